@@ -0,0 +1,120 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Memory used by columnar results compared to lists of dicts.
+
+    python -m benchmarks.bench_columnar [--items 100000] [--output FILE]
+
+Builds the same items, shaped like the data returned by ``list``, as a list
+of dicts and as a ``ColumnarResult`` and records the memory retained by each
+(measured with ``tracemalloc``) along with the time taken to build the
+columnar result, iterate over its rows and convert it back to dicts.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from cruddy.columnar import ColumnarResult
+
+timer = getattr(time, 'perf_counter', time.time)
+
+STATUSES = ('pending', 'shipped', 'delivered', 'returned')
+
+
+def make_items(count):
+    # Built from parsed JSON, as boto3 would, so that nothing is shared
+    # between items that wouldn't be shared in a real response
+    rnd = random.Random(42)
+    items = []
+    for i in range(count):
+        item = {
+            'id': 'order-{:08d}'.format(i),
+            'customer_id': 'customer-{:05d}'.format(rnd.randrange(10000)),
+            'status': rnd.choice(STATUSES),
+            'quantity': rnd.randrange(1, 20),
+            'total': round(rnd.uniform(1, 500), 2),
+            'created_at': 1500000000000 + i * 1000,
+        }
+        if i % 10 == 0:
+            item['note'] = 'gift wrap'
+        items.append(item)
+    return json.loads(json.dumps(items))
+
+
+def retained(build):
+    # Returns the result of build() and the memory it holds on to
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def measure(count):
+    items, dicts_bytes = retained(lambda: make_items(count))
+    start = timer()
+    columnar = ColumnarResult(items)
+    build_time = timer() - start
+    del columnar
+    columnar, columnar_bytes = retained(
+        lambda: ColumnarResult(make_items(count)))
+    start = timer()
+    for row in columnar:
+        row['total']
+    iterate_time = timer() - start
+    start = timer()
+    columnar.to_dicts()
+    to_dicts_time = timer() - start
+    return {
+        'items': count,
+        'dicts_bytes': dicts_bytes,
+        'columnar_bytes': columnar_bytes,
+        'saved_pct': 100.0 * (dicts_bytes - columnar_bytes) / dicts_bytes,
+        'build_ms': build_time * 1000.0,
+        'iterate_ms': iterate_time * 1000.0,
+        'to_dicts_ms': to_dicts_time * 1000.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+    result = measure(args.items)
+    sys.stderr.write(
+        '{items} items: dicts {dicts_bytes} bytes, columnar '
+        '{columnar_bytes} bytes (saved {saved_pct:.1f}%)  build '
+        '{build_ms:.1f}ms  iterate {iterate_ms:.1f}ms  to_dicts '
+        '{to_dicts_ms:.1f}ms\n'.format(**result))
+    if args.output:
+        dirname = os.path.dirname(args.output)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(args.output, 'w') as fp:
+            json.dump({'results': [result]}, fp, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Byte savings and cost of compressed_attributes.
+
+    python -m benchmarks.bench_compression [--algorithms zlib,zstd]
+        [--sizes 512,4096,65536] [--iterations 200] [--output FILE]
+
+For several kinds of attribute value and value sizes, every item is created
+through a CRUD handler using the ``memory`` backend with and without
+``compressed_attributes``.  The results record the stored item size (as
+DynamoDB would account for it), the write and read capacity units that size
+costs and the time taken by ``create`` and ``get``.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import cruddy
+from cruddy import compression
+from cruddy.memory import item_size
+
+timer = getattr(time, 'perf_counter', time.time)
+
+WORDS = ('order customer shipped pending total amount address street city '
+         'note status item quantity price discount invoice').split()
+
+
+def text_value(size, rnd):
+    words = []
+    length = 0
+    while length < size:
+        word = rnd.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+
+def json_value(size, rnd):
+    rows = []
+    while len(json.dumps(rows)) < size:
+        rows.append({'sku': 'SKU-{:06d}'.format(rnd.randrange(1000)),
+                     'quantity': rnd.randrange(1, 10),
+                     'status': rnd.choice(WORDS)})
+    return {'rows': rows}
+
+
+def random_value(size, rnd):
+    # Incompressible data shows the overhead when compression doesn't help
+    return ''.join(chr(rnd.randrange(33, 127)) for i in range(size))
+
+
+KINDS = {'text': text_value, 'json': json_value, 'random': random_value}
+
+
+def _capacity_units(size, unit):
+    return (size + unit - 1) // unit
+
+
+def measure(algorithm, kind, size, iterations):
+    rnd = random.Random(42)
+    values = [KINDS[kind](size, rnd) for i in range(iterations)]
+    params = {'table_name': 'bench', 'backend': 'memory'}
+    if algorithm != 'none':
+        params['compressed_attributes'] = ['body']
+        params['compression'] = {'algorithm': algorithm, 'threshold': 256}
+    crud = cruddy.CRUD(**params)
+    create_time = 0.0
+    get_time = 0.0
+    stored = 0
+    original = 0
+    for i, value in enumerate(values):
+        item = {'id': str(i), 'body': value}
+        original += item_size(item)
+        start = timer()
+        crud.create(item)
+        create_time += timer() - start
+        start = timer()
+        crud.get(str(i))
+        get_time += timer() - start
+        stored += item_size(crud.backend.get_item(Key={'id': str(i)})['Item'])
+    mean_stored = stored // iterations
+    return {
+        'algorithm': algorithm,
+        'kind': kind,
+        'value_size': size,
+        'original_bytes': original // iterations,
+        'stored_bytes': mean_stored,
+        'saved_pct': 100.0 * (original - stored) / original,
+        'wcu': _capacity_units(mean_stored, 1024),
+        'rcu': _capacity_units(mean_stored, 4096),
+        'create_ms': create_time / iterations * 1000.0,
+        'get_ms': get_time / iterations * 1000.0,
+    }
+
+
+def _split(value):
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    default_algorithms = ['none', 'zlib']
+    if compression.zstandard is not None:
+        default_algorithms.append('zstd')
+    parser.add_argument('--algorithms', default=','.join(default_algorithms))
+    parser.add_argument('--kinds', default=','.join(sorted(KINDS)))
+    parser.add_argument('--sizes', default='512,4096,65536')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+    results = []
+    for kind in _split(args.kinds):
+        for size in [int(n) for n in _split(args.sizes)]:
+            for algorithm in _split(args.algorithms):
+                result = measure(algorithm, kind, size, args.iterations)
+                results.append(result)
+                sys.stderr.write(
+                    '{kind:>7} {value_size:>7} {algorithm:>5} '
+                    '{stored_bytes:>7} bytes  saved {saved_pct:5.1f}%  '
+                    'WCU {wcu:>3}  RCU {rcu:>3}  create {create_ms:6.3f}ms  '
+                    'get {get_ms:6.3f}ms\n'.format(**result))
+    if args.output:
+        dirname = os.path.dirname(args.output)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(args.output, 'w') as fp:
+            json.dump({'results': results}, fp, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
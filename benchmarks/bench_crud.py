@@ -0,0 +1,359 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Offline benchmarks for the cruddy CRUD operations.
+
+    python -m benchmarks.bench_crud [--backends standin,memory]
+        [--item-sizes small,large]
+        [--table-sizes 100,1000] [--iterations 500] [--output FILE]
+
+Every operation is run either against an in-memory DynamoDB stand-in, which
+still exercises boto3's request serialization and response parsing
+(``standin``), or against cruddy's own ``MemoryBackend`` (``memory``), so no
+network or AWS credentials are needed.  Results are written as JSON so runs
+from different commits can be compared with ``benchmarks.compare``.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+
+import boto3
+from boto3.dynamodb.types import TypeSerializer
+
+import cruddy
+from cruddy.memory import MemoryBackend
+from benchmarks.standin import LocalDynamoDB
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+timer = getattr(time, 'perf_counter', time.time)
+
+TABLE_NAME = 'cruddy-bench'
+STATUS_VALUES = 10
+
+# name: (number of filler attributes, length of each filler value)
+ITEM_SIZES = {
+    'small': (4, 16),
+    'medium': (16, 64),
+    'large': (40, 256),
+}
+
+BACKENDS = ['standin', 'memory']
+
+OPERATIONS = ['create', 'get', 'update', 'list', 'search',
+              'increment_counter', 'bulk_delete', 'handler']
+
+PROTOTYPE = {'id': '<on-create:uuid>',
+             'created_at': '<on-create:timestamp>',
+             'modified_at': '<on-update:timestamp>',
+             'views': 0}
+
+
+def make_item(item_size, n):
+    count, length = ITEM_SIZES[item_size]
+    item = {'id': str(uuid.uuid4()),
+            'status': 'status-{}'.format(n % STATUS_VALUES),
+            'views': 0,
+            'created_at': 1452109758363,
+            'modified_at': 1452109758363}
+    for i in range(count):
+        item['attr_{}'.format(i)] = 'x' * length
+    return item
+
+
+def _session():
+    return boto3.Session(region_name='us-west-2',
+                         aws_access_key_id='bench',
+                         aws_secret_access_key='bench')
+
+
+class Context(object):
+
+    def __init__(self, backend, item_size, table_size):
+        self.backend = backend
+        self.item_size = item_size
+        self.items = [make_item(item_size, n) for n in range(table_size)]
+        indexes = {'status': 'status-index'}
+        session = _session()
+        if backend == 'standin':
+            db = LocalDynamoDB()
+            table = db.create_table(TABLE_NAME, indexes=indexes)
+            serializer = TypeSerializer()
+            for item in self.items:
+                table.put(dict((k, serializer.serialize(v))
+                               for k, v in item.items()))
+            db.attach(session)
+            storage = 'dynamodb'
+        else:
+            storage = MemoryBackend(TABLE_NAME, indexes=indexes)
+            for item in self.items:
+                storage.put_item(Item=item)
+        self.crud = cruddy.CRUD(table_name=TABLE_NAME, session=session,
+                                backend=storage, prototype=dict(PROTOTYPE))
+        self.random = random.Random(42)
+        self.counter = 0
+
+    def random_item(self):
+        return self.items[self.random.randrange(len(self.items))]
+
+    def random_status(self):
+        return 'status-{}'.format(self.random.randrange(STATUS_VALUES))
+
+
+def _check(response):
+    if response.status != 'success':
+        raise RuntimeError('{}: {}'.format(response.error_type,
+                                           response.error_message))
+
+
+# Each operation is a pair of callables: setup(ctx) returns the argument
+# tuple for a single run (untimed) and run(ctx, *args) is the timed part.
+
+def _create_setup(ctx):
+    ctx.counter += 1
+    item = make_item(ctx.item_size, ctx.counter)
+    del item['id']
+    return (item,)
+
+
+def _create_run(ctx, item):
+    _check(ctx.crud.create(item))
+
+
+def _get_setup(ctx):
+    return (ctx.random_item()['id'],)
+
+
+def _get_run(ctx, item_id):
+    _check(ctx.crud.get(item_id))
+
+
+def _update_setup(ctx):
+    return (dict(ctx.random_item()),)
+
+
+def _update_run(ctx, item):
+    _check(ctx.crud.update(item))
+
+
+def _list_setup(ctx):
+    return ()
+
+
+def _list_run(ctx):
+    _check(ctx.crud.list())
+
+
+def _search_setup(ctx):
+    return ('status={}'.format(ctx.random_status()),)
+
+
+def _search_run(ctx, query):
+    _check(ctx.crud.search(query))
+
+
+def _increment_setup(ctx):
+    return (ctx.random_item()['id'],)
+
+
+def _increment_run(ctx, item_id):
+    _check(ctx.crud.increment_counter(item_id, 'views'))
+
+
+BULK_DELETE_BATCH = 10
+
+
+def _bulk_delete_setup(ctx):
+    for n in range(BULK_DELETE_BATCH):
+        item = make_item(ctx.item_size, n)
+        item['status'] = 'doomed'
+        _check(ctx.crud.create(item))
+    return ('status=doomed',)
+
+
+def _bulk_delete_run(ctx, query):
+    _check(ctx.crud.bulk_delete(query))
+
+
+def _handler_setup(ctx):
+    return ({'operation': 'get', 'id': ctx.random_item()['id']},)
+
+
+def _handler_run(ctx, payload):
+    _check(ctx.crud.handler(**payload))
+
+
+BENCHMARKS = {
+    'create': (_create_setup, _create_run),
+    'get': (_get_setup, _get_run),
+    'update': (_update_setup, _update_run),
+    'list': (_list_setup, _list_run),
+    'search': (_search_setup, _search_run),
+    'increment_counter': (_increment_setup, _increment_run),
+    'bulk_delete': (_bulk_delete_setup, _bulk_delete_run),
+    'handler': (_handler_setup, _handler_run),
+}
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def measure(ctx, operation, iterations, alloc_iterations):
+    setup, run = BENCHMARKS[operation]
+    # warm up caches, lazy imports, etc.
+    for i in range(min(10, iterations)):
+        run(ctx, *setup(ctx))
+    latencies = []
+    for i in range(iterations):
+        args = setup(ctx)
+        start = timer()
+        run(ctx, *args)
+        latencies.append(timer() - start)
+    result = {
+        'backend': ctx.backend,
+        'operation': operation,
+        'item_size': ctx.item_size,
+        'table_size': len(ctx.items),
+        'iterations': iterations,
+        'ops_per_sec': iterations / sum(latencies),
+    }
+    latencies.sort()
+    for name, pct in (('p50_ms', 50), ('p99_ms', 99)):
+        result[name] = _percentile(latencies, pct) * 1000.0
+    result['mean_ms'] = sum(latencies) / len(latencies) * 1000.0
+    result['alloc_peak_bytes'] = measure_allocations(
+        ctx, setup, run, alloc_iterations)
+    return result
+
+
+def measure_allocations(ctx, setup, run, iterations):
+    """
+    Returns the mean peak of memory allocated, above what was already in
+    use, during a single run of the operation.
+    """
+    if tracemalloc is None or not hasattr(tracemalloc, 'reset_peak'):
+        return None
+    peaks = []
+    tracemalloc.start()
+    try:
+        for i in range(iterations):
+            args = setup(ctx)
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            run(ctx, *args)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    return int(sum(peaks) / len(peaks))
+
+
+def git_commit():
+    try:
+        out = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.STDOUT)
+        return out.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(backends, operations, item_sizes, table_sizes,
+                   iterations, alloc_iterations, log=None):
+    results = []
+    for backend in backends:
+        for item_size in item_sizes:
+            for table_size in table_sizes:
+                ctx = Context(backend, item_size, table_size)
+                for operation in operations:
+                    # list scans the whole table (up to 1MB) on every call
+                    # so keep the iteration count reasonable
+                    n = iterations
+                    if operation in ('list', 'bulk_delete'):
+                        n = max(10, iterations // 10)
+                    result = measure(ctx, operation, n, alloc_iterations)
+                    results.append(result)
+                    if log:
+                        log(result)
+    return results
+
+
+def _split(value):
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def _log(result):
+    sys.stderr.write(
+        '{backend:>8} {operation:>18} {item_size:>7} {table_size:>7} '
+        '{ops_per_sec:10.1f} ops/s  p50 {p50_ms:7.3f}ms  '
+        'p99 {p99_ms:7.3f}ms\n'.format(**result))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--operations', default=','.join(OPERATIONS))
+    parser.add_argument('--item-sizes', default='small,medium,large')
+    parser.add_argument('--table-sizes', default='100,1000,10000')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--alloc-iterations', type=int, default=20)
+    parser.add_argument('--output', default=None,
+                        help='JSON results file (default: '
+                             'benchmarks/results/<commit>.json)')
+    args = parser.parse_args(argv)
+    commit = git_commit()
+    results = run_benchmarks(
+        _split(args.backends), _split(args.operations),
+        _split(args.item_sizes),
+        [int(n) for n in _split(args.table_sizes)],
+        args.iterations, args.alloc_iterations, log=_log)
+    output = args.output
+    if output is None:
+        output = os.path.join(os.path.dirname(__file__), 'results',
+                              '{}.json'.format(commit or 'local'))
+    dirname = os.path.dirname(output)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    document = {
+        'meta': {
+            'commit': commit,
+            'cruddy_version': cruddy.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+        },
+        'results': results,
+    }
+    with open(output, 'w') as fp:
+        json.dump(document, fp, indent=2, sort_keys=True)
+    sys.stderr.write('results written to {}\n'.format(output))
+
+
+if __name__ == '__main__':
+    main()
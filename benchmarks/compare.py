@@ -0,0 +1,93 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare two benchmark result files.
+
+    python -m benchmarks.compare BASELINE.json CANDIDATE.json [--threshold 10]
+
+Prints the change in throughput and p99 latency for every benchmark present
+in both files and exits with a non-zero status if the throughput of any of
+them dropped by more than ``threshold`` percent.
+"""
+
+import argparse
+import json
+import sys
+
+
+def _load(path):
+    with open(path) as fp:
+        document = json.load(fp)
+    results = {}
+    for result in document['results']:
+        key = (result.get('backend', 'standin'), result['operation'],
+               result['item_size'], result['table_size'])
+        results[key] = result
+    return document['meta'], results
+
+
+def _change(old, new):
+    if not old:
+        return None
+    return (new - old) / float(old) * 100.0
+
+
+def compare(baseline, candidate, threshold):
+    """
+    Returns a list of (key, throughput change %, p99 change %) tuples and
+    the list of keys whose throughput regressed by more than ``threshold``.
+    """
+    rows = []
+    regressions = []
+    for key in sorted(baseline):
+        if key not in candidate:
+            continue
+        old = baseline[key]
+        new = candidate[key]
+        throughput = _change(old['ops_per_sec'], new['ops_per_sec'])
+        p99 = _change(old['p99_ms'], new['p99_ms'])
+        rows.append((key, throughput, p99))
+        if throughput is not None and throughput < -threshold:
+            regressions.append(key)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='allowed throughput drop, in percent')
+    args = parser.parse_args(argv)
+    old_meta, baseline = _load(args.baseline)
+    new_meta, candidate = _load(args.candidate)
+    print('baseline:  {} ({})'.format(old_meta.get('commit'),
+                                      old_meta.get('timestamp')))
+    print('candidate: {} ({})'.format(new_meta.get('commit'),
+                                      new_meta.get('timestamp')))
+    rows, regressions = compare(baseline, candidate, args.threshold)
+    for key, throughput, p99 in rows:
+        flag = ''
+        if key in regressions:
+            flag = '  REGRESSION'
+        print('{:>8} {:>18} {:>7} {:>7}  ops/s {:+7.1f}%  '
+              'p99 {:+7.1f}%{}'.format(*(key + (throughput or 0.0,
+                                                p99 or 0.0, flag))))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An in-memory stand-in for DynamoDB that plugs into a boto3 Session at the
+botocore ``before-call`` event.  Requests are fully serialized by boto3 and
+responses are parsed by boto3 exactly as they would be for the real service,
+only the HTTP round trip is replaced.  It understands just the subset of the
+API (and of the expression syntax) that cruddy issues.
+"""
+
+import json
+import re
+
+# DynamoDB stops a Scan or Query page once 1MB of data has been read
+PAGE_SIZE = 1024 * 1024
+
+UPDATE_RE = re.compile(
+    r'^\s*set\s+(?P<target>#\w+)\s*=\s*'
+    r'(?:(?P<source>#\w+)\s*\+\s*)?(?P<value>:\w+)\s*$', re.IGNORECASE)
+KEY_CONDITION_RE = re.compile(r'^\s*(?P<name>#\w+)\s*=\s*(?P<value>:\w+)\s*$')
+
+
+class _HTTPResponse(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b''
+        self.text = ''
+
+
+class StandInError(Exception):
+
+    def __init__(self, code, message):
+        super(StandInError, self).__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _key_of(value):
+    # A typed attribute value such as {"S": "foo"} as a hashable key
+    return tuple(value.items())[0]
+
+
+def _size_of(item):
+    return len(json.dumps(item))
+
+
+class LocalTable(object):
+
+    def __init__(self, table_name, hash_key, indexes):
+        self.table_name = table_name
+        self.hash_key = hash_key
+        self.indexes = indexes
+        self.items = {}
+        self.sizes = {}
+        self.index_data = dict((attr, {}) for attr in indexes)
+
+    def description(self):
+        gsis = []
+        for attr, index_name in self.indexes.items():
+            gsis.append({
+                'IndexName': index_name,
+                'KeySchema': [{'AttributeName': attr, 'KeyType': 'HASH'}],
+                'Projection': {'ProjectionType': 'ALL'},
+                'IndexStatus': 'ACTIVE'})
+        description = {
+            'TableName': self.table_name,
+            'TableStatus': 'ACTIVE',
+            'KeySchema': [{'AttributeName': self.hash_key,
+                           'KeyType': 'HASH'}],
+            'ItemCount': len(self.items)}
+        if gsis:
+            description['GlobalSecondaryIndexes'] = gsis
+        return description
+
+    def _index(self, key, item):
+        for attr, data in self.index_data.items():
+            if attr in item:
+                data.setdefault(_key_of(item[attr]), {})[key] = True
+
+    def _unindex(self, key, item):
+        for attr, data in self.index_data.items():
+            if attr in item:
+                keys = data.get(_key_of(item[attr]))
+                if keys:
+                    keys.pop(key, None)
+
+    def put(self, item):
+        if self.hash_key not in item:
+            raise StandInError(
+                'ValidationException',
+                'One of the required keys was not given a value')
+        key = _key_of(item[self.hash_key])
+        old = self.items.get(key)
+        if old is not None:
+            self._unindex(key, old)
+        self.items[key] = item
+        self.sizes[key] = _size_of(item)
+        self._index(key, item)
+        return old
+
+    def delete(self, key):
+        old = self.items.pop(key, None)
+        if old is not None:
+            self.sizes.pop(key)
+            self._unindex(key, old)
+        return old
+
+    def page(self, keys, start_key, limit, projection):
+        items = []
+        size = 0
+        last_key = None
+        started = start_key is None
+        for key in keys:
+            if not started:
+                started = key == start_key
+                continue
+            item = self.items[key]
+            if projection:
+                item = dict((n, item[n]) for n in projection if n in item)
+            else:
+                item = dict(item)
+            items.append(item)
+            size += self.sizes[key]
+            if size >= PAGE_SIZE or (limit and len(items) >= limit):
+                last_key = key
+                break
+        return items, last_key
+
+
+class LocalDynamoDB(object):
+    """
+    Holds any number of ``LocalTable`` objects and answers the DynamoDB API
+    calls made through any Session it is attached to.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.request_count = 0
+
+    def create_table(self, table_name, hash_key='id', indexes=None):
+        """
+        Creates a table with a HASH key called ``hash_key``.  The optional
+        ``indexes`` dict maps GSI hash attribute names to index names.
+        """
+        table = LocalTable(table_name, hash_key, indexes or {})
+        self.tables[table_name] = table
+        return table
+
+    def attach(self, session):
+        session.events.register('before-call.dynamodb', self._handle)
+
+    def _handle(self, model, params, **kwargs):
+        self.request_count += 1
+        request = json.loads(params['body'].decode('utf-8'))
+        method = getattr(self, '_op_{}'.format(model.name), None)
+        try:
+            if method is None:
+                raise StandInError(
+                    'UnknownOperationException',
+                    'Operation {} not supported'.format(model.name))
+            table = self.tables.get(request['TableName'])
+            if table is None:
+                raise StandInError(
+                    'ResourceNotFoundException',
+                    'Requested resource not found')
+            parsed = method(table, request)
+            status_code = 200
+        except StandInError as e:
+            parsed = {'Error': {'Code': e.code, 'Message': e.message,
+                                'Type': 'Sender'}}
+            status_code = 400
+        parsed['ResponseMetadata'] = {
+            'HTTPStatusCode': status_code,
+            'RequestId': str(self.request_count)}
+        return _HTTPResponse(status_code), parsed
+
+    def _name(self, request, name):
+        return request.get('ExpressionAttributeNames', {}).get(name, name)
+
+    def _projection(self, request):
+        pe = request.get('ProjectionExpression')
+        if not pe:
+            return None
+        return [self._name(request, n.strip()) for n in pe.split(',')]
+
+    def _op_DescribeTable(self, table, request):
+        return {'Table': table.description()}
+
+    def _op_PutItem(self, table, request):
+        old = table.put(request['Item'])
+        response = {}
+        if old is not None and request.get('ReturnValues') == 'ALL_OLD':
+            response['Attributes'] = old
+        return response
+
+    def _op_GetItem(self, table, request):
+        # boto3 deserializes the attribute values of a response in place so
+        # never hand out the stored item itself
+        value = request['Key'][table.hash_key]
+        item = table.items.get(_key_of(value))
+        if item is None:
+            return {}
+        return {'Item': dict(item)}
+
+    def _op_DeleteItem(self, table, request):
+        old = table.delete(_key_of(request['Key'][table.hash_key]))
+        response = {}
+        if old is not None and request.get('ReturnValues') == 'ALL_OLD':
+            response['Attributes'] = old
+        return response
+
+    def _page_response(self, table, keys, request):
+        start = request.get('ExclusiveStartKey')
+        start_key = _key_of(start[table.hash_key]) if start else None
+        items, last_key = table.page(
+            keys, start_key, request.get('Limit'), self._projection(request))
+        response = {'Items': items, 'Count': len(items),
+                    'ScannedCount': len(items)}
+        if last_key is not None:
+            last_item = table.items[last_key]
+            lek = {table.hash_key: last_item[table.hash_key]}
+            index_name = request.get('IndexName')
+            for attr, name in table.indexes.items():
+                if name == index_name:
+                    lek[attr] = last_item[attr]
+            response['LastEvaluatedKey'] = lek
+        return response
+
+    def _op_Scan(self, table, request):
+        return self._page_response(table, list(table.items), request)
+
+    def _op_Query(self, table, request):
+        match = KEY_CONDITION_RE.match(request['KeyConditionExpression'])
+        if not match:
+            raise StandInError('ValidationException',
+                               'Unsupported KeyConditionExpression')
+        attr = self._name(request, match.group('name'))
+        value = request['ExpressionAttributeValues'][match.group('value')]
+        if attr == table.hash_key:
+            key = _key_of(value)
+            keys = [key] if key in table.items else []
+        elif attr in table.index_data:
+            keys = list(table.index_data[attr].get(_key_of(value), ()))
+        else:
+            raise StandInError('ValidationException',
+                               'Query condition missed key schema element')
+        return self._page_response(table, keys, request)
+
+    def _op_UpdateItem(self, table, request):
+        match = UPDATE_RE.match(request['UpdateExpression'])
+        if not match:
+            raise StandInError('ValidationException',
+                               'Unsupported UpdateExpression')
+        key_value = request['Key'][table.hash_key]
+        item = dict(table.items.get(_key_of(key_value),
+                                    {table.hash_key: key_value}))
+        target = self._name(request, match.group('target'))
+        value = request['ExpressionAttributeValues'][match.group('value')]
+        if match.group('source'):
+            source = self._name(request, match.group('source'))
+            if source not in item:
+                raise StandInError(
+                    'ValidationException',
+                    'The provided expression refers to an attribute that '
+                    'does not exist in the item')
+            total = _number(item[source]['N']) + _number(value['N'])
+            value = {'N': str(total)}
+        item[target] = value
+        table.put(item)
+        response = {}
+        if request.get('ReturnValues') == 'UPDATED_NEW':
+            response['Attributes'] = {target: value}
+        elif request.get('ReturnValues') == 'ALL_NEW':
+            response['Attributes'] = dict(item)
+        return response
+
+
+def _number(s):
+    if '.' in s or 'e' in s.lower():
+        return float(s)
+    return int(s)
@@ -17,14 +17,36 @@ import logging
 import decimal
 import base64
 import copy
+import functools
 import inspect
+import json
+import threading
+import time
 
 import boto3
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Key, Attr
+from boto3.dynamodb.types import Binary
 from botocore.exceptions import ClientError
 
 from cruddy.prototype import PrototypeHandler
 from cruddy.response import CRUDResponse
+from cruddy.middleware import CallContext, build_chain
+from cruddy.backend import get_backend
+from cruddy.coalesce import CounterBuffer
+from cruddy.counters import ShardMarker, ShardedCounters
+from cruddy.bulk import BulkWriter
+from cruddy.exceptions import CruddyQueueClosedError
+from cruddy.transport import get_config
+from cruddy.writebehind import WriteBehindQueue
+from cruddy.compression import Compressor
+from cruddy.cache import SearchCache
+from cruddy.columnar import ColumnarResult
+from cruddy.lazy import LazyItem
+from cruddy.singleflight import SingleFlight
+from cruddy.pager import Pager
+from cruddy.profiler import AccessProfiler
+from cruddy.consistency import (SESSION, STRONG, WriteSession, Writes,
+                                check_mode, written_keys)
 
 __version__ = open(os.path.join(os.path.dirname(__file__),
                                 '_version')).read().strip()
@@ -32,13 +54,26 @@ __version__ = open(os.path.join(os.path.dirname(__file__),
 LOG = logging.getLogger()
 LOG.setLevel(logging.INFO)
 
+# inspect.getargspec is gone in newer versions of Python 3
+_getargspec = getattr(inspect, 'getfullargspec', None) or inspect.getargspec
+
 
 class CRUD(object):
+    """
+    A CRUD handler is safe to share between threads.  Its configuration is
+    copied when it is created and not changed afterwards, all of its
+    threads share one session and connection pool and the state kept by
+    the optional features is locked.
+    """
 
     SupportedOps = ["create", "update", "get", "delete", "bulk_delete",
                     "list", "search", "increment_counter",
                     "describe", "ping"]
 
+    # BatchGetItem accepts at most this many keys per call
+    BatchGetSize = 100
+    BatchRetries = 5
+
     def __init__(self, **kwargs):
         """
         Create a new CRUD handler.  The CRUD handler accepts the following
@@ -49,17 +84,84 @@ class CRUD(object):
           creating the boto3 Session
         * region_name - name of the AWS region to use when creating the
           boto3 Session
+        * session - an existing boto3 Session to use rather than creating
+          a new one (profile_name and region_name are then ignored)
         * prototype - a dictionary of name/value pairs that will be used to
           initialize newly created items
         * supported_ops - a list of operations supported by the CRUD handler
           (choices are list, get, create, update, delete, search,
-          increment_counter, describe, help, ping)
+          increment_counter, describe, help, ping, and bulk_create,
+          get_counter and stats, which are not in the default
+          ``SupportedOps``)
         * encrypted_attributes - a list of tuples where the first item in the
           tuple is the name of the attribute that should be encrypted and the
           second item in the tuple is the KMS master key ID to use for
           encrypting/decrypting the value
         * debug - if not False this will cause the raw_response to be left
           in the response dictionary
+        * middleware - a list of middleware callables (see
+          ``cruddy.middleware``) that will wrap every call to DynamoDB
+        * backend - the storage backend to use.  Either a
+          ``cruddy.backend.Backend`` instance, a backend name (``dynamodb``,
+          the default, or ``memory``) or a dict with a ``name`` and the
+          parameters for that backend
+        * coalesce_counters - if not False, ``increment_counter`` calls are
+          buffered in memory and written out periodically as a single update
+          per item.  Can be a dict with ``max_pending`` (number of increments
+          to buffer before flushing) and ``interval`` (maximum number of
+          seconds between flushes)
+        * sharded_counters - a dict mapping counter names to a number of
+          shards.  Increments of these counters are spread across that many
+          separate items and ``get_counter`` sums them.
+        * shard_selection - how a shard is picked for an increment, either
+          ``random`` (the default) or ``hash``
+        * counter_cache_ttl - number of seconds to cache the totals of sharded
+          counters read by ``get_counter`` (default 0, no caching)
+        * version_attribute - name of a numeric attribute used for optimistic
+          concurrency.  Updates only succeed if the stored version matches
+          the version in the item, and increment it.
+        * transport - a dict of connection settings for the AWS clients
+          (``max_pool_connections``, ``connect_timeout``, ``read_timeout``,
+          ``tcp_keepalive``, ``retry_mode`` and ``max_attempts``, see
+          ``cruddy.transport``).  If it contains ``prewarm``, that many
+          connections to DynamoDB are opened when the handler is created.
+        * kms_client - an existing KMS client to use for encrypted
+          attributes rather than creating a new one
+        * compressed_attributes - a list of the names of attributes whose
+          values are stored compressed (as binary) when they are larger than
+          the compression threshold.  They are compressed before they are
+          encrypted and decompressed when items are read.
+        * compression - a dict with the ``algorithm`` (``zlib``, the
+          default, or ``zstd``), the ``threshold`` size in bytes (default
+          1024) and the ``level`` used for ``compressed_attributes``
+        * search_cache - if not False, the results of ``search`` are cached.
+          Can be a dict with the ``ttl`` in seconds (default 60) and
+          ``max_entries`` (default 1000).  Writes made through this handler
+          invalidate the cached searches they affect.
+        * write_behind - if not False, ``create`` and ``update`` queue items
+          and return immediately while a background thread writes them with
+          batched writes.  Can be a dict with ``max_pending``, ``interval``,
+          ``workers``, ``batch_size``, ``max_retries`` and ``on_error`` (see
+          ``cruddy.writebehind``).  Any other write of an item first waits
+          for its queued writes to be written.
+        * profiler - if not False, every call to DynamoDB is profiled to
+          find hot keys, item sizes and the mix of scans and queries (see
+          ``stats``).  Can be a dict with ``capacity`` (number of keys
+          tracked per operation, default 1000) and ``top`` (number of hot
+          keys reported, default 10)
+        * read_consistency - how ``get`` and ``get_counter`` read items:
+          ``strong`` (the default), ``eventual`` or ``session``, which reads
+          the keys written by this handler in the last few seconds strongly
+          and everything else eventually.  Can be a dict with the ``mode``
+          and, for sessions, the ``ttl`` in seconds (default 5) and
+          ``max_keys`` (default 10000) remembered.
+        * lazy_items - if True, ``get``, ``list`` and ``search`` return
+          LazyItems (see ``cruddy.lazy``) that decrypt and convert each
+          value only when it is first read.  Each call can also pass
+          ``lazy``.
+        * single_flight - if True, concurrent identical eventually
+          consistent ``get`` and ``search`` calls share a single request to
+          DynamoDB
         """
         self.table_name = kwargs['table_name']
         profile_name = kwargs.get('profile_name')
@@ -67,13 +169,39 @@ class CRUD(object):
         placebo = kwargs.get('placebo')
         placebo_dir = kwargs.get('placebo_dir')
         placebo_mode = kwargs.get('placebo_mode', 'record')
-        self.prototype = kwargs.get('prototype', dict())
+        # The configuration is copied so that it can't be changed by the
+        # caller while the handler is in use
+        self.prototype = copy.deepcopy(kwargs.get('prototype', dict()))
         self._prototype_handler = PrototypeHandler(self.prototype)
-        self.supported_ops = kwargs.get('supported_ops', self.SupportedOps)
-        self.supported_ops.append('describe')
-        self.encrypted_attributes = kwargs.get('encrypted_attributes', list())
-        session = boto3.Session(profile_name=profile_name,
-                                region_name=region_name)
+        supported_ops = list(kwargs.get('supported_ops', self.SupportedOps))
+        if 'describe' not in supported_ops:
+            supported_ops.append('describe')
+        self.supported_ops = supported_ops
+        self.encrypted_attributes = [
+            tuple(attr) for attr in kwargs.get('encrypted_attributes', list())]
+        self._lock = threading.Lock()
+        self._compressor = Compressor(
+            kwargs.get('compressed_attributes', list()),
+            **kwargs.get('compression', dict()))
+        self.version_attribute = kwargs.get('version_attribute')
+        self.lazy_items = kwargs.get('lazy_items', False)
+        if kwargs.get('single_flight'):
+            self.single_flight = SingleFlight()
+        else:
+            self.single_flight = None
+        consistency = kwargs.get('read_consistency') or STRONG
+        if not isinstance(consistency, dict):
+            consistency = {'mode': consistency}
+        consistency = dict(consistency)
+        self.read_consistency = check_mode(consistency.pop('mode', STRONG))
+        if self.read_consistency == SESSION:
+            self.write_session = WriteSession(**consistency)
+        else:
+            self.write_session = None
+        session = kwargs.get('session')
+        if session is None:
+            session = boto3.Session(profile_name=profile_name,
+                                    region_name=region_name)
         if placebo and placebo_dir:
             self.pill = placebo.attach(session, placebo_dir, debug=True)
             if placebo_mode == 'record':
@@ -82,25 +210,70 @@ class CRUD(object):
                 self.pill.playback()
         else:
             self.pill = None
-        ddb_resource = session.resource('dynamodb')
-        self.table = ddb_resource.Table(self.table_name)
+        transport = kwargs.get('transport') or {}
+        config = get_config(transport)
+        self.backend = get_backend(kwargs.get('backend'), session,
+                                   self.table_name, config)
         self._indexes = {}
+        self.hash_key = None
         self._analyze_table()
         self._debug = kwargs.get('debug', False)
+        self._middleware = list(kwargs.get('middleware', list()))
+        profiler = kwargs.get('profiler')
+        if profiler:
+            if not isinstance(profiler, dict):
+                profiler = {}
+            # Innermost, so it sees only the calls that reach the table
+            self.profiler = AccessProfiler(self.hash_key, **profiler)
+            self._middleware.append(self.profiler)
+        else:
+            self.profiler = None
+        self._middleware_chain = build_chain(self._middleware)
         if self.encrypted_attributes:
-            self._kms_client = session.client('kms')
+            self._kms_client = kwargs.get('kms_client') or session.client(
+                'kms', config=config)
         else:
             self._kms_client = None
+        if transport.get('prewarm'):
+            self.backend.prewarm(transport['prewarm'])
+        coalesce = kwargs.get('coalesce_counters')
+        if coalesce:
+            if not isinstance(coalesce, dict):
+                coalesce = {}
+            self.counter_buffer = CounterBuffer(self._write_counters,
+                                                **coalesce)
+        else:
+            self.counter_buffer = None
+        search_cache = kwargs.get('search_cache')
+        if search_cache:
+            if not isinstance(search_cache, dict):
+                search_cache = {}
+            self.search_cache = SearchCache(**search_cache)
+        else:
+            self.search_cache = None
+        write_behind = kwargs.get('write_behind')
+        if write_behind:
+            if not isinstance(write_behind, dict):
+                write_behind = {}
+            self.write_queue = WriteBehindQueue(self, **write_behind)
+        else:
+            self.write_queue = None
+        self.sharded_counters = ShardedCounters(
+            kwargs.get('sharded_counters', dict()),
+            selection=kwargs.get('shard_selection', 'random'),
+            cache_ttl=kwargs.get('counter_cache_ttl', 0))
 
     def _analyze_table(self):
         # First check the Key Schema
-        if len(self.table.key_schema) != 1:
+        key_schema = self.backend.key_schema
+        if len(key_schema) != 1:
             LOG.info('cruddy does not support RANGE keys')
         else:
-            self._indexes[self.table.key_schema[0]['AttributeName']] = None
+            self.hash_key = key_schema[0]['AttributeName']
+            self._indexes[self.hash_key] = None
         # Now process any GSI's
-        if self.table.global_secondary_indexes:
-            for gsi in self.table.global_secondary_indexes:
+        if self.backend.global_secondary_indexes:
+            for gsi in self.backend.global_secondary_indexes:
                 # find HASH of GSI, that's all we support for now
                 # if the GSI has a RANGE, we ignore it for now
                 if len(gsi['KeySchema']) == 1:
@@ -128,6 +301,89 @@ class CRUD(object):
         else:
             return obj
 
+    def _convert_items(self, items):
+        # Converts items read from the table into plain values
+        return self._replace_decimals(
+            [self._decompress(item) for item in items])
+
+    def _result_items(self, items, columnar=False, lazy=None):
+        # The items read by list and search: converted right away, as
+        # columns or as LazyItems
+        if lazy is None:
+            lazy = self.lazy_items
+        items = self._without_shards(items)
+        if lazy and not columnar:
+            return [self._lazy_item(item) for item in items]
+        items = self._convert_items(items)
+        if columnar:
+            return ColumnarResult(items)
+        return items
+
+    def _without_shards(self, items):
+        # Sharded counters' shard items are not listed or searched
+        if not self.sharded_counters:
+            return items
+        return [item for item in items if ShardMarker not in item]
+
+    def _lazy_item(self, item, decrypt=False):
+        return LazyItem(item, functools.partial(self._convert_attribute,
+                                                decrypt=decrypt))
+
+    def _convert_attribute(self, name, value, decrypt=False):
+        # Everything _decrypt, _decompress and _replace_decimals do to an
+        # item, for one of its values
+        if decrypt:
+            for encrypted_attr, _ in self.encrypted_attributes:
+                if encrypted_attr == name:
+                    value = self._decrypt_value(value)
+        if self._compressor and name in self._compressor.attributes:
+            value = self._compressor.decode(value)
+        return self._replace_decimals(value)
+
+    def _set_last_evaluated_key(self, response):
+        # Paginated responses carry the key to pass back as ``start_key``
+        last_key = response.raw_response.get('LastEvaluatedKey')
+        if last_key:
+            response.last_evaluated_key = self._replace_decimals(last_key)
+
+    def _exclusive_start_key(self, start_key):
+        # The reverse of _set_last_evaluated_key.  Fractional numbers in a
+        # ``start_key`` are floats (also once it has been through JSON, e.g.
+        # an export checkpoint), which boto3 rejects
+        return dict((name, decimal.Decimal(repr(value))
+                     if isinstance(value, float) else value)
+                    for name, value in start_key.items())
+
+    def _invalidate(self, *items):
+        # Drop the cached searches that could include any of ``items``, the
+        # old and new versions of the written item.  None means the item is
+        # not known so every search on an indexed attribute is dropped.
+        if self.search_cache is None:
+            return
+        for item in items:
+            if item is None:
+                self.search_cache.clear()
+                return
+            for attribute in self._indexes:
+                if attribute in item:
+                    self.search_cache.invalidate(attribute, item[attribute])
+
+    def _compress(self, item, encrypt=True):
+        # Compression happens before encryption.  Values that are about to
+        # be encrypted are left as bytes for KMS; if they are not being
+        # encrypted they already hold ciphertext and are left alone.
+        if self._compressor:
+            encrypted = [attr for attr, _ in self.encrypted_attributes]
+            if encrypt:
+                self._compressor.compress(item, raw=encrypted)
+            else:
+                self._compressor.compress(item, skip=encrypted)
+
+    def _decompress(self, item):
+        if self._compressor:
+            self._compressor.decompress(item)
+        return item
+
     def _encrypt(self, item):
         for encrypted_attr, master_key_id in self.encrypted_attributes:
             if encrypted_attr in item:
@@ -140,9 +396,15 @@ class CRUD(object):
     def _decrypt(self, item):
         for encrypted_attr, master_key_id in self.encrypted_attributes:
             if encrypted_attr in item:
-                response = self._kms_client.decrypt(
-                    CiphertextBlob=base64.b64decode(item[encrypted_attr]))
-                item[encrypted_attr] = response['Plaintext']
+                item[encrypted_attr] = self._decrypt_value(
+                    item[encrypted_attr])
+
+    def _decrypt_value(self, value):
+        if isinstance(value, Binary):
+            value = value.value
+        response = self._kms_client.decrypt(
+            CiphertextBlob=base64.b64decode(value))
+        return response['Plaintext']
 
     def _check_supported_op(self, op_name, response):
         if op_name not in self.supported_ops:
@@ -153,9 +415,25 @@ class CRUD(object):
             return False
         return True
 
-    def _call_ddb_method(self, method, kwargs, response):
+    def _call_ddb_method(self, method, kwargs, response, flight_key=None):
+        # Reads pass a ``flight_key`` identifying the request so that, with
+        # single_flight, concurrent identical reads share one call
+        if self.write_session is not None:
+            operation = getattr(method, '__name__', None)
+            if operation in Writes:
+                # Recorded before the write as it may succeed even if the
+                # call fails (e.g. a timeout)
+                self.write_session.record(
+                    written_keys(operation, kwargs, self.hash_key))
         try:
-            response.raw_response = method(**kwargs)
+            if flight_key is not None and self.single_flight:
+                result, shared = self.single_flight.do(
+                    flight_key, lambda: self._invoke(method, kwargs))
+                # Every caller converts its items in place
+                response.raw_response = (copy.deepcopy(result) if shared
+                                         else result)
+            else:
+                response.raw_response = self._invoke(method, kwargs)
         except ClientError as e:
             LOG.debug(e)
             response.status = 'error'
@@ -168,9 +446,67 @@ class CRUD(object):
             response.error_code = None
             response.error_message = str(e)
 
+    def _invoke(self, method, kwargs):
+        chain = self._middleware_chain
+        if chain is None:
+            return method(**kwargs)
+        context = CallContext(method.__name__, method, kwargs)
+        chain(context)
+        return context.result
+
+    def _flight_key(self, *key):
+        # Requests whose key can't be hashed are never coalesced
+        if self.single_flight is None:
+            return None
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
     def _new_response(self):
         return CRUDResponse(self._debug)
 
+    def _consistent_read(self, keys, consistency=None):
+        # Whether a read of ``keys`` should be strongly consistent under the
+        # call's (or else the handler's) read consistency.  A session read
+        # on a handler that isn't tracking writes is always strong.
+        mode = check_mode(consistency or self.read_consistency)
+        if mode == SESSION:
+            if self.write_session is None:
+                return True
+            return self.write_session.recent(keys)
+        return mode == STRONG
+
+    def _read_consistency(self, keys, consistency, response):
+        # As _consistent_read but reports an unknown consistency in the
+        # response and returns None
+        try:
+            return self._consistent_read(keys, consistency)
+        except ValueError as e:
+            response.status = 'error'
+            response.error_type = 'InvalidConsistency'
+            response.error_message = str(e)
+            return None
+
+    def add_middleware(self, middleware):
+        """
+        Adds a middleware callable to the end of the chain that wraps every
+        call to DynamoDB, just outside the profiler if there is one.  The
+        chain is rebuilt once here so there is no per-call cost for
+        composing it.
+        """
+        with self._lock:
+            # A new list and chain, so calls in flight are not affected
+            middlewares = list(self._middleware)
+            if self.profiler:
+                middlewares.insert(middlewares.index(self.profiler),
+                                   middleware)
+            else:
+                middlewares.append(middleware)
+            self._middleware = middlewares
+            self._middleware_chain = build_chain(self._middleware)
+
     def ping(self, **kwargs):
         """
         A no-op method that simply returns a successful response.
@@ -187,13 +523,28 @@ class CRUD(object):
         description = {
             'cruddy_version': __version__,
             'table_name': self.table_name,
-            'supported_operations': copy.copy(self.supported_ops),
+            'supported_operations': list(self.supported_ops),
             'prototype': copy.deepcopy(self.prototype),
             'operations': {}
         }
+        if self.counter_buffer:
+            description['counter_coalescing'] = self.counter_buffer.stats()
+        if self.write_queue:
+            description['write_behind'] = self.write_queue.stats()
+        if self._compressor:
+            description['compression'] = self._compressor.stats()
+        if self.search_cache:
+            description['search_cache'] = self.search_cache.stats()
+        if self.profiler:
+            description['profiler'] = self.profiler.report()
+        description['read_consistency'] = self.read_consistency
+        if self.write_session:
+            description['write_session'] = self.write_session.stats()
+        if self.single_flight:
+            description['single_flight'] = self.single_flight.stats()
         for name, method in inspect.getmembers(self, inspect.ismethod):
             if not name.startswith('_'):
-                argspec = inspect.getargspec(method)
+                argspec = _getargspec(method)
                 if argspec.defaults is None:
                     defaults = None
                 else:
@@ -203,7 +554,8 @@ class CRUD(object):
                     'argspec': {
                         'args': argspec.args,
                         'varargs': argspec.varargs,
-                        'keywords': argspec.keywords,
+                        'keywords': getattr(argspec, 'keywords',
+                                            getattr(argspec, 'varkw', None)),
                         'defaults': defaults
                     }
                 }
@@ -211,6 +563,37 @@ class CRUD(object):
         response.data = description
         return response
 
+    def stats(self, top=None, reset=False, **kwargs):
+        """
+        Returns the statistics of the optional features that are enabled
+        (``counter_coalescing``, ``write_behind``, ``compression``,
+        ``search_cache``, ``write_session``, ``single_flight`` and
+        ``profiler``).  The ``profiler`` report lists
+        the ``top`` hot keys and, if ``reset`` is True, the profile is
+        cleared once it has been reported.
+        """
+        response = self._new_response()
+        if self._check_supported_op('stats', response):
+            stats = {}
+            if self.counter_buffer:
+                stats['counter_coalescing'] = self.counter_buffer.stats()
+            if self.write_queue:
+                stats['write_behind'] = self.write_queue.stats()
+            if self._compressor:
+                stats['compression'] = self._compressor.stats()
+            if self.search_cache:
+                stats['search_cache'] = self.search_cache.stats()
+            if self.write_session:
+                stats['write_session'] = self.write_session.stats()
+            if self.single_flight:
+                stats['single_flight'] = self.single_flight.stats()
+            if self.profiler:
+                stats['profiler'] = self.profiler.report(top)
+                if reset:
+                    self.profiler.reset()
+            response.data = stats
+        return response
+
     def search(self, query, **kwargs):
         """
         Cruddy provides a limited but useful interface to search GSI indexes in
@@ -234,6 +617,15 @@ class CRUD(object):
         the response will be ``success``.  Otherwise, the ``status`` will be
         ``error`` and the ``error_type`` and ``error_message`` will provide
         further information about the error.
+
+        Like ``list``, ``search`` returns a single page of results and
+        accepts ``start_key`` and ``limit`` to page through the rest,
+        ``columnar=True`` returns the items as a ColumnarResult and
+        ``lazy`` is as for ``list``.
+
+        If the handler has a ``search_cache`` the response ``metadata``
+        contains ``cached``, which is True if the results came from the
+        cache.  Pass ``use_cache=False`` to bypass it.
         """
         response = self._new_response()
         if self._check_supported_op('search', response):
@@ -250,42 +642,148 @@ class CRUD(object):
                     msg = 'Attribute {} is not indexed'.format(key)
                     response.error_message = msg
                 else:
+                    pe = kwargs.get('projection_expression')
+                    cache_key = None
+                    if self.search_cache and kwargs.get('use_cache', True):
+                        cache_key = self.search_cache.key(
+                            key, value, pe, kwargs.get('start_key'),
+                            kwargs.get('limit'))
+                        cached = self.search_cache.get(cache_key)
+                        if cached is not None:
+                            items, last_key = cached
+                            if kwargs.get('columnar'):
+                                items = ColumnarResult(items)
+                            response.data = items
+                            if last_key:
+                                response.last_evaluated_key = last_key
+                            response.metadata = {'cached': True}
+                            return response
+                        generation = self.search_cache.generation
                     params = {'KeyConditionExpression': Key(key).eq(value)}
                     index_name = self._indexes[key]
                     if index_name:
                         params['IndexName'] = index_name
-                    pe = kwargs.get('projection_expression')
                     if pe:
                         params['ProjectionExpression'] = pe
-                    self._call_ddb_method(self.table.query,
-                                          params, response)
+                    if kwargs.get('start_key'):
+                        params['ExclusiveStartKey'] = \
+                            self._exclusive_start_key(kwargs['start_key'])
+                    if kwargs.get('limit'):
+                        params['Limit'] = kwargs['limit']
+                    start_key = kwargs.get('start_key')
+                    if start_key:
+                        start_key = json.dumps(start_key, sort_keys=True,
+                                               default=str)
+                    self._call_ddb_method(
+                        self.backend.query, params, response,
+                        self._flight_key('search', key, value, pe, start_key,
+                                         kwargs.get('limit')))
                     if response.status == 'success':
-                        response.data = self._replace_decimals(
-                            response.raw_response['Items'])
+                        items = response.raw_response['Items']
+                        self._set_last_evaluated_key(response)
+                        if cache_key is None:
+                            response.data = self._result_items(
+                                items, kwargs.get('columnar'),
+                                kwargs.get('lazy'))
+                        else:
+                            # Cached results are stored converted
+                            items = self._convert_items(
+                                self._without_shards(items))
+                            self.search_cache.put(
+                                cache_key, items,
+                                getattr(response, 'last_evaluated_key',
+                                        None), generation)
+                            if kwargs.get('columnar'):
+                                items = ColumnarResult(items)
+                            response.data = items
+                            response.prepare()
+                            response.metadata = dict(response.metadata or {},
+                                                     cached=False)
+                            return response
         response.prepare()
         return response
 
-    def list(self, **kwargs):
+    def list(self, segment=None, total_segments=None, start_key=None,
+             limit=None, attributes=None, columnar=False, lazy=None,
+             **kwargs):
         """
         Returns a list of items in the database.  Encrypted attributes are not
         decrypted when listing items.
+
+        A single page of items is returned.  If there are more items, the
+        response has a ``last_evaluated_key`` which can be passed back as
+        ``start_key`` to get the next page.  ``limit`` caps the number of
+        items read for the page, ``attributes`` is a list of the attribute
+        names to return and ``segment`` and ``total_segments`` restrict the
+        listing to one segment of a parallel scan.
+
+        If ``columnar`` is True the response data is a ColumnarResult,
+        which stores the items one column per attribute and uses much less
+        memory than a list of dicts for large pages.  If ``lazy`` is True
+        (it defaults to the handler's ``lazy_items``) the items are
+        LazyItems whose values are only converted when they are read.
         """
         response = self._new_response()
         if self._check_supported_op('list', response):
-            self._call_ddb_method(self.table.scan, {}, response)
+            params = {}
+            if total_segments:
+                params['Segment'] = segment
+                params['TotalSegments'] = total_segments
+            if start_key:
+                params['ExclusiveStartKey'] = self._exclusive_start_key(
+                    start_key)
+            if limit:
+                params['Limit'] = limit
+            if attributes:
+                if self.sharded_counters:
+                    # Needed to recognize the shard items, which are
+                    # left out
+                    attributes = list(attributes) + [ShardMarker]
+                names = dict(('#p{}'.format(i), name)
+                             for i, name in enumerate(attributes))
+                params['ProjectionExpression'] = ', '.join(sorted(names))
+                params['ExpressionAttributeNames'] = names
+            self._call_ddb_method(self.backend.scan, params, response)
             if response.status == 'success':
-                response.data = self._replace_decimals(
-                    response.raw_response['Items'])
+                response.data = self._result_items(
+                    response.raw_response['Items'], columnar, lazy)
+                self._set_last_evaluated_key(response)
         response.prepare()
         return response
 
-    def get(self, id, decrypt=False, id_name='id', **kwargs):
+    def iter_list(self, prefetch=0, **kwargs):
+        """
+        Returns a Pager that iterates over every item in the database, one
+        page of ``list`` at a time.  Any other parameters are passed to
+        ``list``.  If ``prefetch`` is greater than 0, up to that many pages
+        are read in the background while the current page is consumed.
+        """
+        return Pager(self.list, kwargs, prefetch)
+
+    def iter_search(self, query, prefetch=0, **kwargs):
+        """
+        Returns a Pager that iterates over every item matching ``query``,
+        one page of ``search`` at a time.  ``prefetch`` is as for
+        ``iter_list``.
+        """
+        kwargs['query'] = query
+        return Pager(self.search, kwargs, prefetch)
+
+    def get(self, id, decrypt=False, id_name='id', consistency=None,
+            lazy=None, **kwargs):
         """
         Returns the item corresponding to ``id``.  If the ``decrypt`` param is
         not False (the default) any encrypted attributes in the item will be
         decrypted before the item is returned.  If not, the encrypted
         attributes will contain the encrypted value.
 
+        ``consistency`` overrides the handler's ``read_consistency`` for
+        this read (``strong``, ``eventual`` or ``session``).
+
+        If ``lazy`` is True (it defaults to the handler's ``lazy_items``)
+        the item is a LazyItem, which only decrypts and converts each
+        value when it is first read.
+
         """
         response = self._new_response()
         if self._check_supported_op('get', response):
@@ -294,16 +792,28 @@ class CRUD(object):
                 response.error_type = 'IDRequired'
                 response.error_message = 'Get requires an id'
             else:
+                consistent = self._read_consistency([id], consistency,
+                                                    response)
+            if response.status == 'success':
                 params = {'Key': {id_name: id},
-                          'ConsistentRead': True}
-                self._call_ddb_method(self.table.get_item,
-                                      params, response)
+                          'ConsistentRead': consistent}
+                # A strongly consistent read can't join a read that may
+                # have started before a write it must see
+                flight_key = None
+                if not consistent:
+                    flight_key = self._flight_key('get', id_name, id)
+                self._call_ddb_method(
+                    self.backend.get_item, params, response, flight_key)
                 if response.status == 'success':
                     if 'Item' in response.raw_response:
                         item = response.raw_response['Item']
-                        if decrypt:
-                            self._decrypt(item)
-                        response.data = self._replace_decimals(item)
+                        if self.lazy_items if lazy is None else lazy:
+                            response.data = self._lazy_item(item, decrypt)
+                        else:
+                            if decrypt:
+                                self._decrypt(item)
+                            self._decompress(item)
+                            response.data = self._replace_decimals(item)
                     else:
                         response.status = 'error'
                         response.error_type = 'NotFound'
@@ -319,43 +829,248 @@ class CRUD(object):
         item will be added using the default value defined in ``prototype``.
         """
         response = self._new_response()
-        if self._prototype_handler.check(item, 'create', response):
-            self._encrypt(item)
-            params = {'Item': item}
-            self._call_ddb_method(self.table.put_item,
-                                  params, response)
-            if response.status == 'success':
-                response.data = item
+        if self._prepare_create(item, response):
+            self._put(item, {'Item': item}, response)
         response.prepare()
         return response
 
-    def update(self, item, encrypt=True, **kwargs):
+    def _wait_for_queued(self, *keys):
+        # A write that doesn't go through the write-behind queue must not
+        # be overwritten later by an earlier write of the same item that is
+        # still queued
+        if self.write_queue:
+            self.write_queue.flush_keys(keys)
+
+    def _put(self, item, params, response):
+        # Conditional puts can't be batched so they are always written
+        # synchronously
+        if self.write_queue and 'ConditionExpression' not in params:
+            try:
+                response._future = self.write_queue.submit(dict(item))
+            except CruddyQueueClosedError as e:
+                response.status = 'error'
+                response.error_type = 'WriteQueueClosed'
+                response.error_message = str(e)
+                return
+            # the item being replaced is not known
+            self._invalidate(item, None)
+            response.data = self._decompress(item)
+            response.metadata = {'queued': True}
+            return
+        self._wait_for_queued(item.get(self.hash_key))
+        if self.search_cache:
+            params['ReturnValues'] = 'ALL_OLD'
+        self._call_ddb_method(self.backend.put_item, params, response)
+        if response.status == 'success':
+            self._invalidate(item, response.raw_response.get('Attributes',
+                                                             {}))
+            response.data = self._decompress(item)
+
+    def _prepare_create(self, item, response):
+        # Everything that happens to a new item before it is written
+        if not self._prototype_handler.check(item, 'create', response):
+            return False
+        if self.version_attribute:
+            item.setdefault(self.version_attribute, 1)
+        self._compress(item)
+        self._encrypt(item)
+        return True
+
+    def bulk_create(self, items, **kwargs):
+        """
+        Creates all of the items in the list ``items`` using batched writes.
+        Each item is handled just as it would be by ``create``.  The response
+        data contains the number of items ``created`` and a list of the
+        items that ``failed``, each with the ``index`` of the item in
+        ``items``, an ``error_type`` and an ``error_message``.
+        """
+        response = self._new_response()
+        if self._check_supported_op('bulk_create', response):
+            failed = []
+
+            def on_error(index, error_type, error_message):
+                failed.append({'index': index,
+                               'error_type': error_type,
+                               'error_message': error_message})
+
+            self._wait_for_queued(*[item.get(self.hash_key)
+                                    for item in items])
+            writer = BulkWriter(self, workers=kwargs.get('workers', 1),
+                                on_error=on_error)
+            for index, item in enumerate(items):
+                item_response = self._new_response()
+                if self._prepare_create(item, item_response):
+                    writer.put(item, index)
+                else:
+                    on_error(index, item_response.error_type,
+                             item_response.error_message)
+            writer.close()
+            self._invalidate(None)
+            failed.sort(key=lambda f: f['index'])
+            response.data = {'created': writer.stats()['written'],
+                             'failed': failed}
+        return response
+
+    def update(self, item, encrypt=True, partial=False, original=None,
+               id_name='id', **kwargs):
         """
         Updates the item based on the current values of the dictionary passed
         in.
+
+        If ``partial`` is True, only the attributes present in ``item`` are
+        written (attributes whose value is None are removed) rather than
+        replacing the whole item.  If ``original`` is also passed, only the
+        attributes that differ from ``original`` are written and attributes
+        missing from ``item`` are removed.  A partial update fails if the item
+        does not already exist.
+
+        If the handler has a ``version_attribute``, the update only succeeds
+        if the stored version matches the one in ``item`` (otherwise the
+        ``error_code`` is ``ConditionalCheckFailedException``) and the
+        version is incremented.  The new version is only set in ``item``
+        once the update has succeeded, so retrying a failed update with the
+        same item fails again.
         """
         response = self._new_response()
         if self._check_supported_op('update', response):
-            if self._prototype_handler.check(item, 'update', response):
-                if encrypt:
-                    self._encrypt(item)
-                params = {'Item': item}
-                self._call_ddb_method(self.table.put_item,
-                                      params, response)
-                if response.status == 'success':
-                    response.data = item
+            partial = partial or original is not None
+            if self._prototype_handler.check(item, 'update', response,
+                                             partial=partial):
+                if partial:
+                    self._partial_update(item, encrypt, original,
+                                         id_name, response)
+                else:
+                    # The caller's item is left alone until the write
+                    # succeeds
+                    new_item = dict(item)
+                    self._compress(new_item, encrypt)
+                    if encrypt:
+                        self._encrypt(new_item)
+                    params = {'Item': new_item}
+                    if self.version_attribute:
+                        condition, version = self._bump_version(item)
+                        params['ConditionExpression'] = condition
+                        new_item[self.version_attribute] = version
+                    self._put(new_item, params, response)
+                    if (self.version_attribute and
+                            response.status == 'success'):
+                        item[self.version_attribute] = version
         response.prepare()
         return response
 
+    def _bump_version(self, item, original=None):
+        # Returns the condition that the stored version must match the one
+        # in the item and the version to write
+        version = item.get(self.version_attribute)
+        if version is None and original is not None:
+            version = original.get(self.version_attribute)
+        if version is None:
+            return Attr(self.version_attribute).not_exists(), 1
+        return Attr(self.version_attribute).eq(version), version + 1
+
+    def _partial_update(self, item, encrypt, original, id_name, response):
+        if id_name not in item:
+            response.status = 'error'
+            response.error_type = 'IDRequired'
+            response.error_message = 'Update requires an {}'.format(id_name)
+            return
+        condition = Attr(id_name).exists()
+        version = None
+        if self.version_attribute:
+            version_condition, version = self._bump_version(item, original)
+            condition = condition & version_condition
+        changed = {}
+        removed = []
+        for name, value in item.items():
+            if name == id_name:
+                continue
+            if value is None:
+                removed.append(name)
+            elif original is None or original.get(name) != value:
+                changed[name] = value
+        if original is not None:
+            removed.extend(name for name in original if name not in item
+                           and name != self.version_attribute)
+        if version is not None:
+            changed[self.version_attribute] = version
+        self._compress(changed, encrypt)
+        if encrypt:
+            self._encrypt(changed)
+        names = {}
+        values = {}
+        set_actions = []
+        remove_actions = []
+        for i, name in enumerate(sorted(changed)):
+            names['#u{}'.format(i)] = name
+            values[':u{}'.format(i)] = changed[name]
+            set_actions.append('#u{0} = :u{0}'.format(i))
+        for i, name in enumerate(sorted(removed)):
+            names['#r{}'.format(i)] = name
+            remove_actions.append('#r{}'.format(i))
+        expression = []
+        if set_actions:
+            expression.append('SET ' + ', '.join(set_actions))
+        if remove_actions:
+            expression.append('REMOVE ' + ', '.join(remove_actions))
+        if not expression:
+            response.data = item
+            return
+        params = {'Key': {id_name: item[id_name]},
+                  'UpdateExpression': ' '.join(expression),
+                  'ExpressionAttributeNames': names,
+                  'ConditionExpression': condition,
+                  'ReturnValues': 'ALL_NEW'}
+        if values:
+            params['ExpressionAttributeValues'] = values
+        self._wait_for_queued(item[id_name])
+        self._call_ddb_method(self.backend.update_item, params, response)
+        if response.status == 'success':
+            if version is not None:
+                item[self.version_attribute] = version
+            attributes = response.raw_response['Attributes']
+            self._invalidate(attributes)
+            if self.search_cache:
+                # The old values of changed indexed attributes are unknown
+                for name in set(changed).union(removed):
+                    if name in self._indexes:
+                        self.search_cache.invalidate_attribute(name)
+            response.data = self._replace_decimals(
+                self._decompress(attributes))
+
     def increment_counter(self, id, counter_name, increment=1,
-                          id_name='id', **kwargs):
+                          id_name='id', shard_key=None, **kwargs):
         """
         Atomically increments a counter attribute in the item identified by
         ``id``.  You must specify the name of the attribute as ``counter_name``
         and, optionally, the ``increment`` which defaults to ``1``.
+
+        If the handler was created with ``coalesce_counters`` the increment
+        is buffered rather than written immediately.  In that case ``data``
+        will be None since the new value of the counter is not known.
+
+        If ``counter_name`` is one of the handler's ``sharded_counters`` the
+        increment is applied to one of the counter's shard items and ``data``
+        will be None.  Use ``get_counter`` to read the total.  When shards
+        are selected by hash, ``shard_key`` is the value that is hashed.
         """
         response = self._new_response()
         if self._check_supported_op('increment_counter', response):
+            if counter_name in self.sharded_counters:
+                shard_id = self.sharded_counters.choose(
+                    id, counter_name, shard_key)
+                self.sharded_counters.adjust(id, counter_name, increment)
+                if self.counter_buffer:
+                    self.counter_buffer.add(
+                        id_name, shard_id, counter_name, increment)
+                    response.metadata = {'coalesced': True}
+                    return response
+                response = self._write_counters(
+                    id_name, shard_id, {counter_name: increment})
+                return response
+            if self.counter_buffer:
+                self.counter_buffer.add(id_name, id, counter_name, increment)
+                response.metadata = {'coalesced': True}
+                return response
             params = {
                 'Key': {id_name: id},
                 'UpdateExpression': 'set #ctr = #ctr + :val',
@@ -364,8 +1079,12 @@ class CRUD(object):
                     ':val': decimal.Decimal(increment)},
                 'ReturnValues': 'UPDATED_NEW'
             }
-            self._call_ddb_method(self.table.update_item, params, response)
+            if self.search_cache:
+                params['ReturnValues'] = 'ALL_NEW'
+            self._wait_for_queued(id)
+            self._call_ddb_method(self.backend.update_item, params, response)
             if response.status == 'success':
+                self._invalidate(response.raw_response.get('Attributes', {}))
                 if 'Attributes' in response.raw_response:
                     self._replace_decimals(response.raw_response)
                     attr = response.raw_response['Attributes'][counter_name]
@@ -373,6 +1092,153 @@ class CRUD(object):
         response.prepare()
         return response
 
+    def get_counter(self, id, counter_name, id_name='id', consistency=None,
+                    **kwargs):
+        """
+        Returns the current value of the counter attribute ``counter_name``
+        in the item identified by ``id``.  For sharded counters the value is
+        the sum of all of the shards, read with a single batch request.
+        ``consistency`` is as for ``get``, except that sharded counters are
+        read eventually unless ``consistency`` says otherwise.
+        """
+        response = self._new_response()
+        if self._check_supported_op('get_counter', response):
+            if counter_name in self.sharded_counters:
+                total = self.sharded_counters.cached(id, counter_name)
+                if total is not None:
+                    response.data = total
+                    response.metadata = {'cached': True}
+                    return response
+                shard_ids = self.sharded_counters.shard_ids(id, counter_name)
+                keys = [{id_name: shard_id} for shard_id in shard_ids]
+                params = {'ProjectionExpression': '#ctr',
+                          'ExpressionAttributeNames': {'#ctr': counter_name}}
+                if consistency:
+                    params['ConsistentRead'] = self._read_consistency(
+                        shard_ids, consistency, response)
+                    if response.status != 'success':
+                        return response
+                items = self._batch_get(keys, params, response)
+                if response.status == 'success':
+                    total = sum(self._replace_decimals(
+                        item.get(counter_name, 0)) for item in items)
+                    self.sharded_counters.store(id, counter_name, total)
+                    response.data = total
+            else:
+                consistent = self._read_consistency([id], consistency,
+                                                    response)
+                if consistent is None:
+                    return response
+                params = {'Key': {id_name: id},
+                          'ConsistentRead': consistent,
+                          'ProjectionExpression': '#ctr',
+                          'ExpressionAttributeNames': {'#ctr': counter_name}}
+                self._call_ddb_method(self.backend.get_item,
+                                      params, response)
+                if response.status == 'success':
+                    if 'Item' in response.raw_response:
+                        item = response.raw_response['Item']
+                        response.data = self._replace_decimals(
+                            item.get(counter_name, 0))
+                    else:
+                        response.status = 'error'
+                        response.error_type = 'NotFound'
+                        msg = 'item ({}) not found'.format(id)
+                        response.error_message = msg
+        response.prepare()
+        return response
+
+    def _batch_get(self, keys, params, response):
+        # Reads all of the keys, BatchGetSize at a time, retrying any
+        # unprocessed keys with an exponential backoff.
+        items = []
+        for i in range(0, len(keys), self.BatchGetSize):
+            pending = keys[i:i + self.BatchGetSize]
+            attempt = 0
+            while pending:
+                batch_params = dict(params, Keys=pending)
+                self._call_ddb_method(self.backend.batch_get_item,
+                                      batch_params, response)
+                if response.status != 'success':
+                    return items
+                items.extend(response.raw_response['Items'])
+                pending = response.raw_response.get('UnprocessedKeys')
+                if pending:
+                    attempt += 1
+                    if attempt > self.BatchRetries:
+                        response.status = 'error'
+                        response.error_type = 'UnprocessedKeys'
+                        response.error_message = (
+                            '{} keys could not be read'.format(len(pending)))
+                        return items
+                    time.sleep(0.05 * 2 ** attempt)
+        return items
+
+    def _write_counters(self, id_name, id, deltas):
+        # Used by the CounterBuffer to write all of the pending increments
+        # for a single item.  ADD creates the counter if it does not exist.
+        names = {}
+        values = {}
+        actions = []
+        for i, counter_name in enumerate(sorted(deltas)):
+            names['#c{}'.format(i)] = counter_name
+            values[':v{}'.format(i)] = decimal.Decimal(deltas[counter_name])
+            actions.append('#c{0} :v{0}'.format(i))
+        expression = 'ADD ' + ', '.join(actions)
+        if any(name in self.sharded_counters for name in deltas):
+            # Sharded counters are only ever written to shard items
+            names['#shard'] = ShardMarker
+            values[':shard'] = self.sharded_counters.owner(id)
+            expression += ' SET #shard = :shard'
+        params = {
+            'Key': {id_name: id},
+            'UpdateExpression': expression,
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': values
+        }
+        if self.search_cache:
+            params['ReturnValues'] = 'ALL_NEW'
+        response = self._new_response()
+        self._wait_for_queued(id)
+        self._call_ddb_method(self.backend.update_item, params, response)
+        if response.status == 'success' and self.search_cache:
+            self._invalidate(response.raw_response.get('Attributes', {}))
+        response.prepare()
+        return response
+
+    def flush_counters(self, **kwargs):
+        """
+        Writes out any counter increments that are buffered because of
+        ``coalesce_counters``.  The response data contains the flush
+        statistics.
+        """
+        response = self._new_response()
+        if self.counter_buffer:
+            self.counter_buffer.flush()
+            response.data = self.counter_buffer.stats()
+        return response
+
+    def flush_writes(self, **kwargs):
+        """
+        Waits until every item queued by ``write_behind`` has been written.
+        The response data contains the queue statistics.
+        """
+        response = self._new_response()
+        if self.write_queue:
+            self.write_queue.flush()
+            response.data = self.write_queue.stats()
+        return response
+
+    def close(self):
+        """
+        Writes out anything that is buffered and stops any background
+        threads.  The handler should not be used after it is closed.
+        """
+        if self.write_queue:
+            self.write_queue.close()
+        if self.counter_buffer:
+            self.counter_buffer.close()
+
     def delete(self, id, id_name='id', **kwargs):
         """
         Deletes the item corresponding to ``id``.
@@ -380,7 +1246,12 @@ class CRUD(object):
         response = self._new_response()
         if self._check_supported_op('delete', response):
             params = {'Key': {id_name: id}}
-            self._call_ddb_method(self.table.delete_item, params, response)
+            if self.search_cache:
+                params['ReturnValues'] = 'ALL_OLD'
+            self._wait_for_queued(id)
+            self._call_ddb_method(self.backend.delete_item, params, response)
+            if response.status == 'success':
+                self._invalidate(response.raw_response.get('Attributes', {}))
             response.data = 'true'
         response.prepare()
         return response
@@ -393,6 +1264,7 @@ class CRUD(object):
         if self._check_supported_op('search', response):
             n = 0
             pe = 'id'
+            kwargs['use_cache'] = False
             response = self.search(query, projection_expression=pe, **kwargs)
             while response.status == 'success' and response.data:
                 for item in response.data:
@@ -443,3 +1315,7 @@ class CRUD(object):
                 msg = 'Operation: {} is not implemented'.format(operation)
                 response.error_message = msg
         return response
+
+
+from cruddy.registry import CRUDRegistry  # noqa
+from cruddy.events import EventBatchHandler  # noqa
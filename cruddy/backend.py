@@ -0,0 +1,188 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from botocore.vendored.six import string_types
+
+from cruddy.transport import prewarm
+
+
+class Backend(object):
+    """
+    The storage interface used by the CRUD handler.  It deliberately mirrors
+    the boto3 DynamoDB ``Table`` resource: every method accepts the same
+    keyword arguments as the corresponding ``Table`` method and returns a
+    response dictionary of the same shape (including ``ResponseMetadata``).
+    Errors are reported by raising ``botocore.exceptions.ClientError``.
+
+    The batch methods are scoped to the backend's table.  ``batch_get_item``
+    accepts ``Keys`` (plus the optional ``ProjectionExpression``,
+    ``ExpressionAttributeNames`` and ``ConsistentRead``) and returns the
+    found ``Items`` and any ``UnprocessedKeys``.  ``batch_write_item``
+    accepts ``RequestItems``, a list of ``PutRequest`` and ``DeleteRequest``
+    dicts, and returns any ``UnprocessedItems`` in the same form.
+    """
+
+    name = None
+
+    @property
+    def key_schema(self):
+        raise NotImplementedError()
+
+    @property
+    def global_secondary_indexes(self):
+        raise NotImplementedError()
+
+    def put_item(self, **kwargs):
+        raise NotImplementedError()
+
+    def get_item(self, **kwargs):
+        raise NotImplementedError()
+
+    def update_item(self, **kwargs):
+        raise NotImplementedError()
+
+    def delete_item(self, **kwargs):
+        raise NotImplementedError()
+
+    def scan(self, **kwargs):
+        raise NotImplementedError()
+
+    def query(self, **kwargs):
+        raise NotImplementedError()
+
+    def batch_get_item(self, **kwargs):
+        raise NotImplementedError()
+
+    def batch_write_item(self, **kwargs):
+        raise NotImplementedError()
+
+    def prewarm(self, connections):
+        """
+        Opens ``connections`` connections to the storage service ahead of
+        the first request.  Returns the number opened.
+        """
+        return 0
+
+
+class DynamoDBBackend(Backend):
+    """
+    The default backend, which simply passes every call through to a boto3
+    DynamoDB ``Table`` resource.  ``config`` is an optional
+    ``botocore.config.Config`` used for the underlying client.  Several
+    backends can share one connection pool by passing the same DynamoDB
+    ``resource``, in which case ``config`` is ignored.
+
+    boto3 resources are not thread-safe but their clients are, so each
+    thread gets its own ``Table`` resource while every thread shares the
+    one client and its connection pool.
+    """
+
+    name = 'dynamodb'
+
+    def __init__(self, session, table_name, config=None, resource=None,
+                 **kwargs):
+        self.session = session
+        self.table_name = table_name
+        if resource is None:
+            resource = session.resource('dynamodb', config=config)
+        self.resource = resource
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def table(self):
+        table = getattr(self._local, 'table', None)
+        if table is None:
+            # Creating the resource isn't thread-safe either
+            with self._lock:
+                table = self.resource.Table(self.table_name)
+            self._local.table = table
+        return table
+
+    @property
+    def key_schema(self):
+        return self.table.key_schema
+
+    @property
+    def global_secondary_indexes(self):
+        return self.table.global_secondary_indexes
+
+    def put_item(self, **kwargs):
+        return self.table.put_item(**kwargs)
+
+    def get_item(self, **kwargs):
+        return self.table.get_item(**kwargs)
+
+    def update_item(self, **kwargs):
+        return self.table.update_item(**kwargs)
+
+    def delete_item(self, **kwargs):
+        return self.table.delete_item(**kwargs)
+
+    def scan(self, **kwargs):
+        return self.table.scan(**kwargs)
+
+    def query(self, **kwargs):
+        return self.table.query(**kwargs)
+
+    def batch_get_item(self, **kwargs):
+        response = self.resource.batch_get_item(
+            RequestItems={self.table_name: kwargs})
+        unprocessed = response.get('UnprocessedKeys', {}).get(
+            self.table_name, {})
+        return {
+            'Items': response['Responses'].get(self.table_name, []),
+            'UnprocessedKeys': unprocessed.get('Keys', []),
+            'ResponseMetadata': response['ResponseMetadata']
+        }
+
+    def batch_write_item(self, **kwargs):
+        response = self.resource.batch_write_item(
+            RequestItems={self.table_name: kwargs['RequestItems']})
+        return {
+            'UnprocessedItems': response.get('UnprocessedItems', {}).get(
+                self.table_name, []),
+            'ResponseMetadata': response['ResponseMetadata']
+        }
+
+    def prewarm(self, connections):
+        return prewarm(self.resource.meta.client.describe_limits, connections)
+
+
+def get_backend(backend, session, table_name, config=None):
+    """
+    Returns a Backend instance for ``backend``, which can be an existing
+    Backend instance, the name of a backend (``dynamodb`` or ``memory``) or
+    a dictionary containing a ``name`` and any other constructor parameters
+    for that backend.  ``config`` is the ``botocore.config.Config`` used by
+    backends that talk to AWS.
+    """
+    if isinstance(backend, Backend):
+        return backend
+    if backend is None:
+        backend = 'dynamodb'
+    if isinstance(backend, string_types):
+        backend = {'name': backend}
+    params = dict(backend)
+    name = params.pop('name', 'dynamodb')
+    params.setdefault('table_name', table_name)
+    if name == 'dynamodb':
+        params.setdefault('config', config)
+        return DynamoDBBackend(session, **params)
+    elif name == 'memory':
+        from cruddy.memory import MemoryBackend
+        return MemoryBackend(**params)
+    raise ValueError('Unknown backend: {}'.format(name))
@@ -0,0 +1,190 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+LOG = logging.getLogger(__name__)
+
+# Errors that mean "try again later" rather than "this request is bad"
+RetryableErrors = ('ProvisionedThroughputExceededException',
+                   'ThrottlingException', 'RequestLimitExceeded',
+                   'InternalServerError', 'ServiceUnavailable')
+
+
+class BulkWriter(object):
+    """
+    Writes items to the CRUD handler's backend using batched writes.
+    Batches are written by a pool of worker threads and the number of
+    batches waiting to be written is bounded, so ``put`` blocks rather than
+    letting memory grow when the writers fall behind.  Throttled requests
+    and unprocessed items are retried with an exponential backoff.
+
+    * crud - the CRUD handler whose backend is written to
+    * workers - number of concurrent batch writers
+    * batch_size - number of items per batch (at most 25)
+    * max_retries - number of times a batch is retried before its items are
+      reported as failed
+    * on_error - called as ``on_error(tag, error_type, error_message)`` for
+      every item that could not be written, where ``tag`` is the value
+      passed to ``put`` along with the item
+    * on_success - called as ``on_success(tag)`` for every item written
+
+    ``put`` and ``delete`` should be called from a single thread.
+    """
+
+    MaxBatchSize = 25
+
+    def __init__(self, crud, workers=4, batch_size=25, max_retries=8,
+                 on_error=None, on_success=None):
+        self.crud = crud
+        self.batch_size = min(batch_size, self.MaxBatchSize)
+        self.max_retries = max_retries
+        self.on_error = on_error
+        self.on_success = on_success
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(workers * 2)
+        self._lock = threading.Lock()
+        self._batch = []
+        self._batch_keys = set()
+        self._futures = set()
+        self._stats = {'written': 0, 'failed': 0, 'batches': 0,
+                       'retries': 0, 'throttled': 0}
+
+    def put(self, item, tag=None):
+        """
+        Queues ``item`` to be written.  The item must already have been
+        prepared (prototype applied, attributes encrypted, etc.).
+        """
+        self._add({'PutRequest': {'Item': item}},
+                  item.get(self.crud.hash_key), tag)
+
+    def delete(self, key, tag=None):
+        """
+        Queues the deletion of the item with the given ``key`` dict.
+        """
+        self._add({'DeleteRequest': {'Key': key}},
+                  key.get(self.crud.hash_key), tag)
+
+    def _add(self, request, key, tag):
+        # A batch may not contain two requests for the same key
+        if key in self._batch_keys:
+            self._submit()
+        self._batch.append((request, key, tag))
+        self._batch_keys.add(key)
+        if len(self._batch) >= self.batch_size:
+            self._submit()
+
+    def _submit(self):
+        if not self._batch:
+            return
+        batch = self._batch
+        self._batch = []
+        self._batch_keys = set()
+        self._slots.acquire()
+        future = self._executor.submit(self._write, batch)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self._slots.release()
+        with self._lock:
+            self._futures.discard(future)
+        if future.exception() is not None:
+            LOG.error('batch write failed: %s', future.exception())
+
+    def _fail(self, batch, error_type, error_message):
+        with self._lock:
+            self._stats['failed'] += len(batch)
+        if self.on_error:
+            for request, key, tag in batch:
+                self.on_error(tag, error_type, error_message)
+
+    def _write(self, batch):
+        attempt = 0
+        while batch:
+            response = self.crud._new_response()
+            params = {'RequestItems': [request for request, _, _ in batch]}
+            self.crud._call_ddb_method(self.crud.backend.batch_write_item,
+                                       params, response)
+            if response.status != 'success':
+                if response.error_code not in RetryableErrors:
+                    self._fail(batch, response.error_type or
+                               response.error_code, response.error_message)
+                    return
+                with self._lock:
+                    self._stats['throttled'] += 1
+                unprocessed = batch
+            else:
+                unprocessed = self._unprocessed(
+                    batch, response.raw_response.get('UnprocessedItems'))
+                written = len(batch) - len(unprocessed)
+                with self._lock:
+                    self._stats['written'] += written
+                    if attempt == 0:
+                        self._stats['batches'] += 1
+                if self.on_success:
+                    remaining = set(id(entry) for entry in unprocessed)
+                    for entry in batch:
+                        if id(entry) not in remaining:
+                            self.on_success(entry[2])
+            batch = unprocessed
+            if batch:
+                attempt += 1
+                if attempt > self.max_retries:
+                    self._fail(batch, 'UnprocessedItems',
+                               'Retries exhausted')
+                    return
+                with self._lock:
+                    self._stats['retries'] += 1
+                time.sleep(min(0.05 * 2 ** attempt, 5.0))
+
+    def _unprocessed(self, batch, unprocessed):
+        if not unprocessed:
+            return []
+        keys = set()
+        for request in unprocessed:
+            if 'PutRequest' in request:
+                item = request['PutRequest']['Item']
+            else:
+                item = request['DeleteRequest']['Key']
+            keys.add(item.get(self.crud.hash_key))
+        return [entry for entry in batch if entry[1] in keys]
+
+    def flush(self):
+        """
+        Writes any partial batch and waits for every queued item to be
+        written (or to fail).
+        """
+        self._submit()
+        while True:
+            with self._lock:
+                futures = list(self._futures)
+            if not futures:
+                break
+            for future in futures:
+                future.exception()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
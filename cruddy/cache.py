@@ -0,0 +1,140 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import copy
+import json
+import threading
+import time
+
+
+class SearchCache(object):
+    """
+    Caches the results of ``search`` calls.  Entries are keyed on the
+    indexed attribute and value being searched for plus anything else that
+    changes the result (projection, start key and limit), expire after
+    ``ttl`` seconds and the least recently used entries are evicted once
+    there are ``max_entries``.
+
+    Entries are also indexed by (attribute, value) so that a write only
+    needs to invalidate the searches for the values it touched.  To avoid
+    caching a result that a concurrent write has already made stale, take
+    the ``generation`` before running a search and pass it to ``put``.
+    """
+
+    def __init__(self, ttl=60, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._by_value = {}
+        self._generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0,
+                       'evictions': 0}
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def key(self, attribute, value, projection=None, start_key=None,
+            limit=None):
+        if projection:
+            projection = ','.join(sorted(
+                p.strip() for p in projection.split(',')))
+        if start_key:
+            start_key = json.dumps(start_key, sort_keys=True, default=str)
+        return (attribute, value, projection or None, start_key or None,
+                limit or None)
+
+    def get(self, key):
+        """
+        Returns a copy of the cached ``(items, last_evaluated_key)`` for
+        ``key`` or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            self._entries.pop(key)
+            self._entries[key] = entry
+        return copy.deepcopy(entry[1])
+
+    def put(self, key, items, last_key=None, generation=None):
+        value = copy.deepcopy((items, last_key))
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._by_value.setdefault(key[:2], set()).add(key)
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._by_value.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_value[key[:2]]
+
+    def invalidate(self, attribute, value):
+        """
+        Drops every cached search for ``attribute=value``.
+        """
+        try:
+            hash(value)
+        except TypeError:
+            return
+        with self._lock:
+            self._generation += 1
+            keys = self._by_value.pop((attribute, value), ())
+            for key in keys:
+                self._entries.pop(key, None)
+            if keys:
+                self._stats['invalidations'] += len(keys)
+
+    def invalidate_attribute(self, attribute):
+        """
+        Drops every cached search on ``attribute``.
+        """
+        with self._lock:
+            self._generation += 1
+            keys = [key for key in self._entries if key[0] == attribute]
+            for key in keys:
+                self._remove(key)
+            self._stats['invalidations'] += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self._by_value.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        stats['ttl'] = self.ttl
+        stats['max_entries'] = self.max_entries
+        return stats
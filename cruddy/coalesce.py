@@ -0,0 +1,159 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+import weakref
+
+from cruddy import shutdown
+
+LOG = logging.getLogger(__name__)
+
+
+def _flush_loop(ref, stopped, interval):
+    while not stopped.wait(interval):
+        buffer = ref()
+        if buffer is None:
+            return
+        buffer.flush()
+        del buffer
+
+
+class CounterBuffer(object):
+    """
+    Accumulates counter increments in memory and writes them out in as few
+    updates as possible.  Increments are summed per (item, counter) and all
+    of the counters pending for an item are written with a single update.
+
+    * flush_fn - called as ``flush_fn(id_name, id, deltas)`` for each item,
+      where ``deltas`` is a dict of counter name to increment.  It must
+      return a CRUDResponse.
+    * max_pending - flush once this many increments have been buffered
+    * interval - flush at least this often, in seconds.  This is the
+      durability window: an increment can be lost if the process dies
+      within ``interval`` seconds of it being made.
+    """
+
+    def __init__(self, flush_fn, max_pending=1000, interval=1.0):
+        self._flush_fn = flush_fn
+        self.max_pending = max_pending
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pending_count = 0
+        self._oldest = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._stats = {'increments': 0, 'flushes': 0, 'updates': 0,
+                       'errors': 0, 'last_flush': None}
+        shutdown.register(self)
+
+    def add(self, id_name, id, counter_name, increment):
+        with self._lock:
+            counters = self._pending.setdefault((id_name, id), {})
+            counters[counter_name] = counters.get(
+                counter_name, 0) + increment
+            self._pending_count += 1
+            self._stats['increments'] += 1
+            if self._oldest is None:
+                self._oldest = time.time()
+                shutdown.pin(self)
+            full = self._pending_count >= self.max_pending
+            if self._thread is None and not self._stopped.is_set():
+                self._start()
+        if full:
+            self.flush()
+
+    def _start(self):
+        # The thread only holds a weak reference, so it doesn't keep the
+        # buffer alive
+        self._thread = threading.Thread(
+            target=_flush_loop, args=(weakref.ref(self), self._stopped,
+                                      self.interval),
+            name='cruddy-counter-flush')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _take(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._pending_count = 0
+            self._oldest = None
+            shutdown.unpin(self)
+        return pending
+
+    def _requeue(self, id_name, id, deltas):
+        with self._lock:
+            counters = self._pending.setdefault((id_name, id), {})
+            for counter_name, delta in deltas.items():
+                counters[counter_name] = counters.get(
+                    counter_name, 0) + delta
+                self._pending_count += 1
+            if self._oldest is None:
+                self._oldest = time.time()
+                shutdown.pin(self)
+
+    def flush(self):
+        """
+        Writes out everything that is currently buffered.  Updates that fail
+        are put back in the buffer and retried on the next flush.  Returns
+        the number of updates issued.
+        """
+        pending = self._take()
+        updates = 0
+        errors = 0
+        for (id_name, id), deltas in pending.items():
+            deltas = dict((k, v) for k, v in deltas.items() if v)
+            if not deltas:
+                continue
+            updates += 1
+            response = self._flush_fn(id_name, id, deltas)
+            if response.status != 'success':
+                errors += 1
+                LOG.error('counter flush for %s failed: %s',
+                          id, response.error_message)
+                self._requeue(id_name, id, deltas)
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['updates'] += updates
+            self._stats['errors'] += errors
+            self._stats['last_flush'] = time.time()
+        return updates
+
+    def close(self):
+        """
+        Stops the background flush and writes out anything still buffered.
+        """
+        self._stopped.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        if self._pending:
+            self.flush()
+        shutdown.unregister(self)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = self._pending_count
+            stats['pending_items'] = len(self._pending)
+            if self._oldest is None:
+                stats['oldest_pending_age'] = None
+            else:
+                stats['oldest_pending_age'] = time.time() - self._oldest
+        stats['max_pending'] = self.max_pending
+        stats['durability_window'] = self.interval
+        return stats
@@ -0,0 +1,208 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import array
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from botocore.vendored.six import integer_types, text_type
+from botocore.vendored.six.moves import intern
+
+# The range of integers that fit in a signed 64 bit array
+MIN_INT = -2 ** 63
+MAX_INT = 2 ** 63 - 1
+# Integers beyond this lose precision when stored as doubles
+MAX_EXACT_FLOAT = 2 ** 53
+
+_MISSING = object()
+
+
+def _number(value):
+    # Whole numbers come back as ints, as they do from _replace_decimals
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _pack(values):
+    # Returns the most compact storage for a column's values: a signed 64
+    # bit array if they are all integers, a double array if they are all
+    # numbers or otherwise a list.  Missing values are stored as 0 (or None)
+    # and tracked by the column's mask.
+    kind = 'q'
+    for value in values:
+        if value is _MISSING:
+            continue
+        if isinstance(value, bool):
+            kind = None
+            break
+        if isinstance(value, integer_types):
+            if kind == 'q' and not MIN_INT <= value <= MAX_INT:
+                kind = 'd'
+            if kind == 'd' and abs(value) > MAX_EXACT_FLOAT:
+                kind = None
+                break
+        elif isinstance(value, float):
+            kind = 'd'
+        else:
+            kind = None
+            break
+    if kind is None:
+        return [None if value is _MISSING else value for value in values]
+    return array.array(kind, [0 if value is _MISSING else value
+                              for value in values])
+
+
+class ColumnarRow(Mapping):
+    """
+    A read-only view of one item of a ColumnarResult.  It behaves like the
+    item's dict without the dict ever being created.
+    """
+
+    __slots__ = ('_result', '_index')
+
+    def __init__(self, result, index):
+        self._result = result
+        self._index = index
+
+    def __getitem__(self, name):
+        return self._result._value(name, self._index)
+
+    def __iter__(self):
+        for name in self._result.columns:
+            if self._result._has(name, self._index):
+                yield name
+
+    def __len__(self):
+        return sum(1 for name in self)
+
+    def __repr__(self):
+        return 'ColumnarRow({!r})'.format(dict(self))
+
+
+class ColumnarResult(object):
+    """
+    Holds a list of items as one column per attribute rather than one dict
+    per item.  Attribute names are interned and stored once, columns whose
+    values are all numbers are stored in typed arrays (8 bytes per value)
+    and repeated string values within a column share one string object.
+
+    Iterating over (or indexing) the result gives a ColumnarRow view of
+    each item and ``to_dicts`` converts the result back to a list of dicts.
+    """
+
+    def __init__(self, items=()):
+        names = []
+        seen = set()
+        for item in items:
+            for name in item:
+                if name not in seen:
+                    seen.add(name)
+                    names.append(intern(name) if isinstance(name, str)
+                                 else name)
+        self._length = len(items)
+        self._columns = {}
+        self._masks = {}
+        for name in names:
+            strings = {}
+            values = []
+            for item in items:
+                value = item.get(name, _MISSING)
+                if isinstance(value, text_type):
+                    value = strings.setdefault(value, value)
+                values.append(value)
+            self._columns[name] = _pack(values)
+            if any(value is _MISSING for value in values):
+                self._masks[name] = bytearray(
+                    v is not _MISSING for v in values)
+        self._names = tuple(names)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield ColumnarRow(self, index)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('ColumnarResult index out of range')
+        return ColumnarRow(self, index)
+
+    def __repr__(self):
+        return 'ColumnarResult({} items, {} columns)'.format(
+            self._length, len(self._names))
+
+    @property
+    def columns(self):
+        """
+        The attribute names, in the order they were first seen.
+        """
+        return self._names
+
+    def column(self, name):
+        """
+        Returns the storage for the column ``name``: an ``array.array`` for
+        numeric columns, otherwise a list.  Positions where an item has no
+        value for the attribute hold 0 or None; see ``mask``.
+        """
+        return self._columns[name]
+
+    def mask(self, name):
+        """
+        Returns a bytearray with a 1 for every item that has a value for
+        ``name``, or None if every item has one.
+        """
+        if name not in self._columns:
+            raise KeyError(name)
+        return self._masks.get(name)
+
+    def _has(self, name, index):
+        mask = self._masks.get(name)
+        return mask is None or bool(mask[index])
+
+    def _value(self, name, index):
+        column = self._columns[name]
+        if not self._has(name, index):
+            raise KeyError(name)
+        return _number(column[index])
+
+    def to_dicts(self):
+        """
+        Returns the items as a list of dicts.
+        """
+        return [dict(row) for row in self]
+
+    def to_columns(self):
+        """
+        Returns a JSON serializable dict with the number of items and a
+        list of values (None where missing) for every column.
+        """
+        columns = {}
+        for name in self._names:
+            mask = self._masks.get(name)
+            column = self._columns[name]
+            values = list(column)
+            if getattr(column, 'typecode', None) == 'd':
+                values = [_number(value) for value in values]
+            if mask is not None:
+                values = [value if present else None
+                          for value, present in zip(values, mask)]
+            columns[name] = values
+        return {'length': self._length, 'columns': columns}
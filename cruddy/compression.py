@@ -0,0 +1,174 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import decimal
+import json
+import threading
+import zlib
+
+from boto3.dynamodb.types import Binary
+from botocore.vendored.six import binary_type, text_type
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Every compressed value starts with this header followed by one byte for
+# the algorithm and one for the type of the original value
+MAGIC = b'\xcc\x5a'
+
+ZLIB = b'z'
+ZSTD = b's'
+Algorithms = {'zlib': ZLIB, 'zstd': ZSTD}
+
+TEXT = b't'
+BYTES = b'b'
+JSON = b'j'
+
+
+def _json_default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return int(obj) if obj % 1 == 0 else float(obj)
+    if isinstance(obj, Binary):
+        return obj.value.decode('utf-8')
+    raise TypeError('{!r} is not JSON serializable'.format(obj))
+
+
+class Compressor(object):
+    """
+    Compresses the values of some attributes of an item before it is stored
+    and decompresses them after it is read.  Values whose serialized size is
+    below ``threshold`` bytes are stored as they are.
+
+    * attributes - a list of attribute names to compress.  Values may be
+      strings, bytes or anything that can be serialized as JSON.
+    * algorithm - ``zlib`` (the default) or ``zstd`` (requires the
+      ``zstandard`` package)
+    * threshold - the minimum size, in bytes, of a value worth compressing
+    * level - the compression level
+    """
+
+    def __init__(self, attributes, algorithm='zlib', threshold=1024,
+                 level=None):
+        if algorithm not in Algorithms:
+            raise ValueError('Unknown compression algorithm: {}'.format(
+                algorithm))
+        if algorithm == 'zstd' and zstandard is None:
+            raise ValueError('zstd compression requires the zstandard '
+                             'package')
+        self.attributes = list(attributes)
+        self.algorithm = algorithm
+        self.threshold = threshold
+        self.level = level
+        self._lock = threading.Lock()
+        self._stats = {'compressed': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    def __bool__(self):
+        return bool(self.attributes)
+
+    __nonzero__ = __bool__
+
+    def _serialize(self, value):
+        if isinstance(value, text_type):
+            return TEXT, value.encode('utf-8')
+        if isinstance(value, Binary):
+            return BYTES, value.value
+        if isinstance(value, binary_type):
+            return BYTES, value
+        return JSON, json.dumps(value, default=_json_default,
+                                separators=(',', ':')).encode('utf-8')
+
+    def _deserialize(self, kind, data):
+        if kind == TEXT:
+            return data.decode('utf-8')
+        if kind == JSON:
+            return json.loads(data.decode('utf-8'))
+        return data
+
+    def encode(self, value):
+        """
+        Returns the compressed bytes for ``value``, or None if the value is
+        too small to be worth compressing or doesn't get any smaller.
+        """
+        kind, data = self._serialize(value)
+        if len(data) < self.threshold:
+            return None
+        if self.algorithm == 'zstd':
+            level = 3 if self.level is None else self.level
+            compressed = zstandard.ZstdCompressor(level=level).compress(data)
+        else:
+            level = 6 if self.level is None else self.level
+            compressed = zlib.compress(data, level)
+        encoded = MAGIC + Algorithms[self.algorithm] + kind + compressed
+        if len(encoded) >= len(data):
+            # Incompressible, store the value as it is
+            return None
+        with self._lock:
+            self._stats['compressed'] += 1
+            self._stats['bytes_in'] += len(data)
+            self._stats['bytes_out'] += len(encoded)
+        return encoded
+
+    def decode(self, value):
+        """
+        Returns the original value if ``value`` was produced by ``encode``,
+        otherwise returns ``value`` unchanged.
+        """
+        data = value.value if isinstance(value, Binary) else value
+        if not isinstance(data, binary_type) or not data.startswith(MAGIC):
+            return value
+        algorithm = data[2:3]
+        kind = data[3:4]
+        payload = data[4:]
+        if algorithm == ZSTD:
+            if zstandard is None:
+                raise ValueError('zstd compressed value found but the '
+                                 'zstandard package is not installed')
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        else:
+            payload = zlib.decompress(payload)
+        return self._deserialize(kind, payload)
+
+    def compress(self, item, raw=(), skip=()):
+        """
+        Compresses the configured attributes of ``item`` in place.
+        Compressed values are stored as DynamoDB binary values, except for
+        the attributes named in ``raw`` which are left as bytes (e.g. to be
+        encrypted next).  Attributes named in ``skip`` are left alone.
+        """
+        for name in self.attributes:
+            if name in item and name not in skip:
+                value = item[name]
+                if value is None:
+                    continue
+                encoded = self.encode(value)
+                if encoded is not None:
+                    item[name] = encoded if name in raw else Binary(encoded)
+
+    def decompress(self, item):
+        """
+        Decompresses the configured attributes of ``item`` in place.
+        """
+        for name in self.attributes:
+            if name in item:
+                item[name] = self.decode(item[name])
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['algorithm'] = self.algorithm
+        stats['threshold'] = self.threshold
+        stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_out']
+        return stats
@@ -0,0 +1,121 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import threading
+import time
+
+EVENTUAL = 'eventual'
+STRONG = 'strong'
+SESSION = 'session'
+Modes = (EVENTUAL, STRONG, SESSION)
+
+Writes = ('put_item', 'update_item', 'delete_item', 'batch_write_item')
+
+
+def check_mode(mode):
+    if mode not in Modes:
+        raise ValueError('Unknown read consistency: {} (choose from '
+                         '{})'.format(mode, ', '.join(Modes)))
+    return mode
+
+
+def written_keys(operation, params, hash_key):
+    """
+    Returns the hash key values of the items written by a call to the
+    table method ``operation`` with ``params``.
+    """
+    if operation in ('update_item', 'delete_item'):
+        return [params['Key'].get(hash_key)]
+    if operation == 'put_item':
+        return [params['Item'].get(hash_key)]
+    if operation == 'batch_write_item':
+        keys = []
+        for request in params.get('RequestItems', []):
+            if 'PutRequest' in request:
+                keys.append(request['PutRequest']['Item'].get(hash_key))
+            else:
+                keys.append(request['DeleteRequest']['Key'].get(hash_key))
+        return keys
+    return []
+
+
+class WriteSession(object):
+    """
+    Remembers the keys this process wrote in the last ``ttl`` seconds, so
+    that reads of those keys can be strongly consistent (read-your-writes)
+    while every other read is eventually consistent.  At most ``max_keys``
+    keys are remembered; when there are more, the oldest are forgotten
+    early.
+
+    DynamoDB replicates a write to every copy of an item within about a
+    second, so the default ``ttl`` leaves a wide margin.
+    """
+
+    def __init__(self, ttl=5, max_keys=10000):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._keys = collections.OrderedDict()
+        self._stats = {'strong_reads': 0, 'eventual_reads': 0,
+                       'evictions': 0}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def record(self, keys):
+        expires = time.time() + self.ttl
+        with self._lock:
+            for key in keys:
+                try:
+                    self._keys.pop(key, None)
+                except TypeError:
+                    continue
+                self._keys[key] = expires
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def recent(self, keys):
+        """
+        Returns True if any of ``keys`` was written in the last ``ttl``
+        seconds.
+        """
+        now = time.time()
+        found = False
+        with self._lock:
+            # Keys are kept in the order they were written, so the expired
+            # ones are all at the front
+            while self._keys:
+                key, expires = next(iter(self._keys.items()))
+                if expires > now:
+                    break
+                del self._keys[key]
+            for key in keys:
+                try:
+                    if key in self._keys:
+                        found = True
+                        break
+                except TypeError:
+                    continue
+            self._stats['strong_reads' if found else 'eventual_reads'] += 1
+        return found
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['keys'] = len(self._keys)
+        stats['ttl'] = self.ttl
+        stats['max_keys'] = self.max_keys
+        return stats
@@ -0,0 +1,113 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import threading
+import time
+import zlib
+
+# Shard items are marked with this attribute, holding the id of the item
+# the counter belongs to, so they can be left out of list results
+ShardMarker = 'cruddy_shard_of'
+
+
+class ShardedCounters(object):
+    """
+    Keeps track of which counters are sharded and how.  A sharded counter
+    named ``views`` on the item ``foo`` is stored as N separate items with
+    ids ``foo#views#0`` through ``foo#views#N-1``, each holding part of the
+    total in its ``views`` attribute.  Shard items also have a
+    ``ShardMarker`` attribute and are left out of ``list`` and ``search``
+    results (and so out of exports and ``bulk_delete``).
+
+    * shards - a dict mapping counter names to the number of shards
+    * selection - ``random`` (the default) picks a shard at random for each
+      increment, ``hash`` picks one based on a hash of the ``shard_key``
+      passed to ``increment_counter`` (or of the current thread)
+    * cache_ttl - if greater than zero, totals read with ``get_counter`` are
+      cached for this many seconds
+    """
+
+    Selections = ('random', 'hash')
+    MaxCacheEntries = 10000
+
+    def __init__(self, shards, selection='random', cache_ttl=0):
+        if selection not in self.Selections:
+            raise ValueError('Unknown shard selection: {}'.format(selection))
+        self.shards = dict(shards)
+        self.selection = selection
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def __contains__(self, counter_name):
+        return counter_name in self.shards
+
+    def __bool__(self):
+        return bool(self.shards)
+
+    __nonzero__ = __bool__
+
+    def owner(self, shard_id):
+        """
+        Returns the id of the item a shard item's counter belongs to.
+        """
+        return shard_id.rsplit('#', 2)[0]
+
+    def shard_id(self, id, counter_name, shard):
+        return '{}#{}#{}'.format(id, counter_name, shard)
+
+    def shard_ids(self, id, counter_name):
+        return [self.shard_id(id, counter_name, shard)
+                for shard in range(self.shards[counter_name])]
+
+    def choose(self, id, counter_name, shard_key=None):
+        """
+        Returns the id of the shard item the next increment should go to.
+        """
+        n = self.shards[counter_name]
+        if self.selection == 'hash':
+            if shard_key is None:
+                shard_key = threading.current_thread().ident
+            shard = zlib.crc32(str(shard_key).encode('utf-8')) % n
+        else:
+            shard = self._random.randrange(n)
+        return self.shard_id(id, counter_name, shard)
+
+    def cached(self, id, counter_name):
+        if self.cache_ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._cache.get((id, counter_name))
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    def store(self, id, counter_name, total):
+        if self.cache_ttl <= 0:
+            return
+        with self._lock:
+            if len(self._cache) >= self.MaxCacheEntries:
+                self._cache.clear()
+            self._cache[(id, counter_name)] = (
+                total, time.time() + self.cache_ttl)
+
+    def adjust(self, id, counter_name, increment):
+        # Keep a cached total in step with increments made by this process
+        with self._lock:
+            entry = self._cache.get((id, counter_name))
+            if entry is not None:
+                self._cache[(id, counter_name)] = (entry[0] + increment,
+                                                   entry[1])
@@ -0,0 +1,318 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import copy
+import json
+import logging
+
+from cruddy.bulk import BulkWriter
+from cruddy.registry import CRUDRegistry
+from cruddy.response import CRUDResponse
+
+LOG = logging.getLogger(__name__)
+
+
+class EventRecord(object):
+    """
+    One operation payload taken from a batch event.  ``record_id`` is what
+    identifies the record in a partial batch failure response.
+    """
+
+    def __init__(self, record_id, payload=None, error=None):
+        self.record_id = record_id
+        self.payload = payload
+        self.response = None
+        if error is not None:
+            self.fail('InvalidPayload', error)
+
+    def fail(self, error_type, error_message):
+        self.response = CRUDResponse()
+        self.response.status = 'error'
+        self.response.error_type = error_type
+        self.response.error_message = error_message
+
+
+def _parse(record_id, body):
+    try:
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        payload = json.loads(body) if not isinstance(body, dict) else body
+    except ValueError as e:
+        return EventRecord(record_id, error=str(e))
+    if not isinstance(payload, dict) or 'operation' not in payload:
+        return EventRecord(record_id,
+                           error='Payload must be an object with an '
+                                 'operation')
+    return EventRecord(record_id, payload)
+
+
+def parse_event(event):
+    """
+    Returns the kind of ``event`` (``sqs``, ``kinesis``, ``list`` or
+    ``single``) and a list of EventRecords.
+    """
+    if isinstance(event, list):
+        return 'list', [_parse(i, payload) for i, payload in enumerate(event)]
+    records = event.get('Records') if isinstance(event, dict) else None
+    if not records:
+        return 'single', [_parse(None, event)]
+    source = records[0].get('eventSource') or records[0].get('EventSource')
+    if source == 'aws:sqs':
+        return 'sqs', [_parse(r['messageId'], r['body']) for r in records]
+    if source == 'aws:kinesis':
+        return 'kinesis', [
+            _parse(r['kinesis']['sequenceNumber'],
+                   base64.b64decode(r['kinesis']['data']))
+            for r in records]
+    raise ValueError('Unsupported event source: {}'.format(source))
+
+
+class EventBatchHandler(object):
+    """
+    Runs every operation in an SQS event, a Kinesis event or a list of
+    operation payloads against a CRUD handler, using as few requests as
+    possible:
+
+    * consecutive ``create``, ``delete`` and (full, unconditional)
+      ``update`` operations are written with batched writes
+    * consecutive ``get`` operations are read with batched reads
+    * anything else is passed to ``CRUD.handler`` one at a time
+
+    The operations are run in the order they were received, so every
+    operation sees the writes made before it and none made after it.
+
+    For SQS and Kinesis events the result is a partial batch failure
+    response (``batchItemFailures``) listing only the records that failed,
+    so only those are retried.  For a list of payloads the result is the
+    list of flattened responses, in order.  Any other event is treated as a
+    single payload and passed to ``CRUD.handler``.
+
+    * crud - the CRUD handler, or a CRUDRegistry in which case each
+      payload's ``table`` selects the handler
+    * workers - number of concurrent batch writers.  With more than one,
+      writes to the same item in one event may be applied out of order.
+    """
+
+    Writes = ('create', 'update', 'delete')
+
+    def __init__(self, crud, workers=1):
+        self.crud = crud
+        self.workers = workers
+
+    def __call__(self, event, context=None):
+        return self.handle(event)
+
+    def handle(self, event):
+        kind, records = parse_event(event)
+        if kind == 'single':
+            record = records[0]
+            if record.response is None:
+                return self.crud.handler(**record.payload).flatten()
+            return record.response.flatten()
+        self.run(records)
+        if kind == 'list':
+            return [record.response.flatten() for record in records]
+        failures = [{'itemIdentifier': record.record_id}
+                    for record in records
+                    if record.response.status != 'success']
+        if failures:
+            LOG.info('%d of %d records failed', len(failures), len(records))
+        return {'batchItemFailures': failures}
+
+    def run(self, records):
+        """
+        Runs every record that has not already failed, setting its response.
+        """
+        groups = []
+        by_table = {}
+        for record in records:
+            if record.response is not None:
+                continue
+            crud = self._resolve(record)
+            if crud is None:
+                continue
+            if id(crud) not in by_table:
+                by_table[id(crud)] = (crud, [])
+                groups.append(by_table[id(crud)])
+            by_table[id(crud)][1].append(record)
+        for crud, group in groups:
+            self._run(crud, group)
+
+    def _resolve(self, record):
+        if not isinstance(self.crud, CRUDRegistry):
+            return self.crud
+        table = record.payload.pop('table', None) or self.crud.default_table
+        if table not in self.crud:
+            record.fail('UnknownTable', 'Unknown table: {}'.format(table))
+            return None
+        return self.crud.get(table)
+
+    def _run(self, crud, records):
+        # Each run of consecutive writes (or reads) is one batch, so the
+        # records are still run in the order they were received
+        batch = []
+        batch_kind = None
+        for record in records:
+            kind = self._kind(crud, record.payload)
+            if batch and kind != batch_kind:
+                self._run_batch(crud, batch_kind, batch)
+                batch = []
+            if kind is None:
+                self._run_one(crud, record)
+            else:
+                batch.append(record)
+                batch_kind = kind
+        if batch:
+            self._run_batch(crud, batch_kind, batch)
+
+    def _run_batch(self, crud, kind, records):
+        if kind == 'write':
+            self._write(crud, records)
+        else:
+            self._read(crud, records)
+
+    def _run_one(self, crud, record):
+        try:
+            record.response = crud.handler(**record.payload)
+        except Exception as e:
+            LOG.exception('operation failed')
+            record.fail(type(e).__name__, str(e))
+
+    def _kind(self, crud, payload):
+        # 'write' or 'read' if the payload can be batched, otherwise None
+        operation = payload['operation'].lower()
+        if operation in self.Writes and self._batchable(crud, payload):
+            return 'write'
+        if operation == 'get' and self._batchable(crud, payload):
+            return 'read'
+        return None
+
+    def _batchable(self, crud, payload):
+        operation = payload['operation'].lower()
+        if not crud._check_supported_op(operation, CRUDResponse()):
+            return False
+        if payload.get('id_name', 'id') != crud.hash_key:
+            # Batched requests are keyed on the table's hash key
+            return False
+        if operation == 'update':
+            # Conditional and partial updates need an UpdateItem/PutItem
+            if (crud.version_attribute or payload.get('partial') or
+                    payload.get('original') is not None):
+                return False
+        if operation in ('get', 'delete') and payload.get('id') is None:
+            return False
+        # The keys in a batch are kept in sets, so a malformed key (e.g. a
+        # list) is run on its own and fails without failing the batch
+        try:
+            hash(self._key(crud, payload))
+        except TypeError:
+            return False
+        return True
+
+    def _key(self, crud, payload):
+        if payload['operation'].lower() in ('get', 'delete'):
+            return payload.get('id')
+        item = payload.get('item')
+        if isinstance(item, dict):
+            return item.get(crud.hash_key)
+
+    def _write(self, crud, records):
+
+        def on_error(record, error_type, error_message):
+            record.fail(error_type, error_message)
+
+        def on_success(record):
+            record.response = CRUDResponse()
+            if record.payload['operation'].lower() == 'delete':
+                record.response.data = 'true'
+            else:
+                record.response.data = crud._decompress(
+                    record.payload['item'])
+
+        crud._wait_for_queued(*[self._key(crud, record.payload)
+                                for record in records])
+        writer = BulkWriter(crud, workers=self.workers, on_error=on_error,
+                            on_success=on_success)
+        for record in records:
+            payload = record.payload
+            operation = payload['operation'].lower()
+            if operation == 'delete':
+                key = {crud.hash_key: payload['id']}
+                writer.delete(key, record)
+                continue
+            item = payload.get('item')
+            if not isinstance(item, dict):
+                record.fail('InvalidPayload', 'An item is required')
+                continue
+            response = crud._new_response()
+            if operation == 'create':
+                ok = crud._prepare_create(item, response)
+            else:
+                ok = crud._prototype_handler.check(item, 'update', response)
+                if ok:
+                    encrypt = payload.get('encrypt', True)
+                    crud._compress(item, encrypt)
+                    if encrypt:
+                        crud._encrypt(item)
+            if ok:
+                writer.put(item, record)
+            else:
+                record.response = response
+        writer.close()
+        # The items that were replaced or deleted are not known
+        crud._invalidate(None)
+
+    def _read(self, crud, records):
+        keys = []
+        seen = set()
+        consistent = False
+        valid = []
+        for record in records:
+            id = record.payload['id']
+            # The batch is read strongly if any of its gets needs it
+            try:
+                consistent = crud._consistent_read(
+                    [id], record.payload.get('consistency')) or consistent
+            except ValueError as e:
+                record.fail('InvalidConsistency', str(e))
+                continue
+            valid.append(record)
+            # BatchGetItem rejects duplicate keys
+            if id not in seen:
+                seen.add(id)
+                keys.append({crud.hash_key: id})
+        records = valid
+        if not records:
+            return
+        response = crud._new_response()
+        items = crud._batch_get(keys, {'ConsistentRead': consistent},
+                                response)
+        found = dict((item[crud.hash_key], item) for item in items)
+        for record in records:
+            if response.status != 'success':
+                record.fail(response.error_type or response.error_code,
+                            response.error_message)
+                continue
+            id = record.payload['id']
+            item = found.get(id)
+            if item is None:
+                record.fail('NotFound', 'item ({}) not found'.format(id))
+                continue
+            item = copy.deepcopy(item)
+            if record.payload.get('decrypt'):
+                crud._decrypt(item)
+            crud._decompress(item)
+            record.response = CRUDResponse()
+            record.response.data = crud._replace_decimals(item)
@@ -21,3 +21,35 @@ class CruddyKeySchemaError(Exception):
 class CruddyKeyNameError(Exception):
 
     pass
+
+
+class CruddyWriteError(Exception):
+
+    def __init__(self, error_type, error_message):
+        super(CruddyWriteError, self).__init__(
+            '{}: {}'.format(error_type, error_message))
+        self.error_type = error_type
+        self.error_message = error_message
+
+
+class CruddyReadError(Exception):
+
+    def __init__(self, error_type, error_message):
+        super(CruddyReadError, self).__init__(
+            '{}: {}'.format(error_type, error_message))
+        self.error_type = error_type
+        self.error_message = error_message
+
+
+class CruddyQueueClosedError(RuntimeError):
+
+    pass
+
+
+class CruddyTimeoutError(Exception):
+
+    def __init__(self, operation, deadline):
+        super(CruddyTimeoutError, self).__init__(
+            '{} did not complete within {}s'.format(operation, deadline))
+        self.operation = operation
+        self.deadline = deadline
@@ -0,0 +1,170 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from cruddy.bulk import RetryableErrors
+from cruddy.lazy import json_default
+
+LOG = logging.getLogger(__name__)
+
+
+class Exporter(object):
+    """
+    Exports every item in a table as newline-delimited JSON using a parallel
+    segmented scan.
+
+    * list_fn - called as ``list_fn(**params)`` to read one page of items;
+      either ``CRUD.list`` or an equivalent remote call
+    * outputs - a function returning the binary file object a segment's
+      items are written to (several segments may share one file)
+    * segments - the number of scan segments read in parallel
+    * checkpoint - if not None, the name of a JSON file where the
+      ``last_evaluated_key`` of every segment is saved after each page is
+      written.  If the file already exists the export resumes from it.
+    * attributes - an optional list of the attribute names to export
+    * page_size - an optional limit on the items read per request
+    * max_retries - number of times a throttled page is retried
+
+    Pages are written before they are checkpointed, so an export that is
+    interrupted and resumed may repeat at most one page per segment.
+    """
+
+    def __init__(self, list_fn, outputs, segments=4, checkpoint=None,
+                 attributes=None, page_size=None, max_retries=8):
+        self.list_fn = list_fn
+        self.outputs = outputs
+        self.segments = segments
+        self.checkpoint = checkpoint
+        self.attributes = attributes
+        self.page_size = page_size
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._file_locks = {}
+        self.state = self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as fp:
+                saved = json.load(fp)
+            if saved['segments'] != self.segments:
+                msg = 'Checkpoint was written with {} segments, not {}'
+                raise ValueError(msg.format(saved['segments'],
+                                            self.segments))
+            return dict((int(k), v) for k, v in saved['state'].items())
+        return dict((segment, {'start_key': None, 'done': False,
+                               'count': 0})
+                    for segment in range(self.segments))
+
+    @property
+    def resumed(self):
+        return any(s['count'] or s['done'] for s in self.state.values())
+
+    def _save_checkpoint(self):
+        if not self.checkpoint:
+            return
+        data = {'segments': self.segments,
+                'state': dict((str(k), v) for k, v in self.state.items())}
+        tmp = self.checkpoint + '.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump(data, fp)
+        os.rename(tmp, self.checkpoint)
+
+    def _page(self, segment, start_key):
+        params = {'segment': segment, 'total_segments': self.segments,
+                  'start_key': start_key, 'limit': self.page_size,
+                  'attributes': self.attributes}
+        attempt = 0
+        while True:
+            response = self.list_fn(**params)
+            if response.status == 'success':
+                return response
+            attempt += 1
+            if (response.error_code not in RetryableErrors or
+                    attempt > self.max_retries):
+                raise IOError('Segment {}: {}: {}'.format(
+                    segment, response.error_type, response.error_message))
+            time.sleep(min(0.05 * 2 ** attempt, 5.0))
+
+    def _export_segment(self, segment):
+        state = self.state[segment]
+        fp = self.outputs(segment)
+        with self._lock:
+            file_lock = self._file_locks.setdefault(id(fp), threading.Lock())
+        while not state['done']:
+            response = self._page(segment, state['start_key'])
+            lines = b''.join(
+                json.dumps(item, default=json_default).encode('utf-8') +
+                b'\n' for item in response.data)
+            with file_lock:
+                fp.write(lines)
+                fp.flush()
+            last_key = getattr(response, 'last_evaluated_key', None)
+            with self._lock:
+                state['count'] += len(response.data)
+                state['start_key'] = last_key
+                state['done'] = last_key is None
+                self._save_checkpoint()
+
+    def run(self, workers=None):
+        """
+        Exports every segment that is not yet done and returns the total
+        number of items exported (including any exported before resuming).
+        """
+        pending = [segment for segment, state in self.state.items()
+                   if not state['done']]
+        executor = ThreadPoolExecutor(max_workers=workers or self.segments)
+        try:
+            for future in [executor.submit(self._export_segment, segment)
+                           for segment in pending]:
+                future.result()
+        finally:
+            executor.shutdown(wait=True)
+        return self.count()
+
+    def count(self):
+        with self._lock:
+            return sum(s['count'] for s in self.state.values())
+
+
+def segment_path(path, segment):
+    """
+    Returns the name of the file for ``segment`` when an export is split
+    into one file per segment, e.g. ``items.json.gz`` becomes
+    ``items-0003.json.gz``.
+    """
+    root, ext = os.path.splitext(path)
+    if ext == '.gz':
+        root, inner = os.path.splitext(root)
+        ext = inner + ext
+    return '{}-{:04d}{}'.format(root, segment, ext)
+
+
+def open_output(path, compress, append):
+    """
+    Opens ``path`` for writing (or appending, when resuming an export),
+    compressing it with gzip if ``compress`` is True.  Appending to a gzip
+    file adds a new gzip member, which standard tools read transparently.
+    """
+    mode = 'ab' if append else 'wb'
+    if compress:
+        return gzip.open(path, mode)
+    return open(path, mode)
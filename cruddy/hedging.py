@@ -0,0 +1,245 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from botocore.vendored.six import reraise
+
+from cruddy.exceptions import CruddyTimeoutError
+
+# Operations that can safely be sent twice
+Idempotent = ('get', 'search', 'list', 'describe')
+
+# Upper bounds, in seconds, of the latency histogram buckets: 1ms up to
+# about two minutes, each bucket ~19% wider than the one before it
+LatencyBuckets = tuple(0.001 * 2 ** (i / 4.0) for i in range(68))
+
+
+class LatencyHistogram(object):
+    """
+    Counts latencies in the ``LatencyBuckets`` buckets.  Percentiles are
+    reported as the upper bound of the bucket they fall in, so they are
+    never underestimated by more than one bucket (~19%).
+    """
+
+    def __init__(self):
+        self.counts = [0] * len(LatencyBuckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency):
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+        # The buckets are a geometric series, so the first bucket that
+        # can hold the latency is found with a binary search
+        lo, hi = 0, len(LatencyBuckets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if LatencyBuckets[mid] < latency:
+                lo = mid + 1
+            else:
+                hi = mid
+        self.counts[lo] += 1
+
+    def percentile(self, percentile):
+        """
+        Returns the ``percentile`` (0-100) latency in seconds, or None if
+        nothing has been counted.
+        """
+        if not self.count:
+            return None
+        rank = self.count * percentile / 100.0
+        seen = 0
+        for bound, count in zip(LatencyBuckets[:-1], self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        # The last bucket also holds everything longer
+        return self.max
+
+    def report(self):
+        report = {'count': self.count,
+                  'mean_ms': (1000 * self.total / self.count
+                              if self.count else 0.0),
+                  'max_ms': 1000 * self.max}
+        for percentile in (50, 90, 99):
+            latency = self.percentile(percentile)
+            report['p{}_ms'.format(percentile)] = (
+                1000 * latency if latency is not None else None)
+        return report
+
+
+class Hedger(object):
+    """
+    Sends a second copy of a slow call (a hedged request) and returns
+    whichever answer arrives first, and abandons calls that miss their
+    deadline.
+
+    * percentile - a call is hedged once it has taken longer than this
+      percentile of the recent latencies of its operation
+    * initial_delay - the hedge delay, in seconds, used until
+      ``min_samples`` latencies have been seen for an operation
+    * min_delay, max_delay - bounds on the hedge delay
+    * min_samples - the number of latencies needed before the percentile
+      is used
+    * max_rate - the largest fraction of calls that are hedged, so a slow
+      service is not sent twice the load
+    * deadline - the default number of seconds a call may take, or None
+    * operations - the operations that are hedged.  Only operations that
+      can safely be run twice should be listed.
+    * max_workers - the number of threads making calls.  A call that
+      missed its deadline keeps its thread until it returns.
+
+    Latencies are kept per operation in a LatencyHistogram.
+    """
+
+    def __init__(self, percentile=95, initial_delay=0.5, min_delay=0.005,
+                 max_delay=None, min_samples=20, max_rate=0.1,
+                 deadline=None, operations=Idempotent, max_workers=16):
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.max_rate = max_rate
+        self.deadline = deadline
+        self.operations = tuple(operations)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0,
+                       'deadline_exceeded': 0, 'errors': 0}
+
+    def delay(self, operation):
+        """
+        Returns the number of seconds to wait before hedging a call to
+        ``operation``.
+        """
+        with self._lock:
+            histogram = self._latency.get(operation)
+            if histogram is None or histogram.count < self.min_samples:
+                delay = self.initial_delay
+            else:
+                delay = histogram.percentile(self.percentile)
+        delay = max(delay, self.min_delay)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        return delay
+
+    def _record(self, operation, latency):
+        with self._lock:
+            histogram = self._latency.get(operation)
+            if histogram is None:
+                histogram = self._latency[operation] = LatencyHistogram()
+            histogram.add(latency)
+
+    def _timed(self, fn, payload, operation):
+        start = time.time()
+        result = fn(payload)
+        self._record(operation, time.time() - start)
+        return result
+
+    def _may_hedge(self):
+        with self._lock:
+            if self._stats['hedged'] + 1 > (self.max_rate *
+                                            self._stats['calls']):
+                return False
+            self._stats['hedged'] += 1
+            return True
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def call(self, fn, payload, deadline=None):
+        """
+        Returns ``fn(payload)``.  If the payload's operation is hedged and
+        the call is slow a second call is made and the first answer is
+        returned.  Raises CruddyTimeoutError if there is no answer within
+        ``deadline`` (or the default deadline) seconds.  If every call
+        raises an exception, the first one is raised.
+        """
+        operation = payload.get('operation')
+        if deadline is None:
+            deadline = self.deadline
+        hedge = operation in self.operations
+        with self._lock:
+            self._stats['calls'] += 1
+        if not hedge and deadline is None:
+            return self._timed(fn, payload, operation)
+        start = time.time()
+        expires = start + deadline if deadline is not None else None
+        futures = [self._executor.submit(self._timed, fn, payload,
+                                         operation)]
+        if hedge:
+            timeout = self.delay(operation)
+            if expires is not None:
+                timeout = min(timeout, expires - start)
+            done, _ = wait(futures, timeout=timeout)
+            if not done and (expires is None or time.time() < expires) \
+                    and self._may_hedge():
+                futures.append(self._executor.submit(
+                    self._timed, fn, payload, operation))
+        pending = set(futures)
+        error = None
+        while pending:
+            timeout = None
+            if expires is not None:
+                timeout = max(expires - time.time(), 0)
+            done, pending = wait(pending, timeout=timeout,
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in futures:
+                if future not in done:
+                    continue
+                try:
+                    result = future.result()
+                except Exception:
+                    if error is None:
+                        error = sys.exc_info()
+                    continue
+                if future is not futures[0]:
+                    self._count('hedge_wins')
+                return result
+        if error is not None and not pending:
+            self._count('errors')
+            reraise(*error)
+        self._count('deadline_exceeded')
+        raise CruddyTimeoutError(operation, deadline)
+
+    def stats(self):
+        """
+        Returns the number of ``calls``, how many were ``hedged`` (and the
+        ``hedge_rate``), how many of those the hedge answered first
+        (``hedge_wins``), how many missed their deadline and the latency
+        histogram of each operation.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['latency'] = dict((operation, histogram.report())
+                                    for operation, histogram
+                                    in self._latency.items())
+        stats['hedge_rate'] = (float(stats['hedged']) / stats['calls']
+                               if stats['calls'] else 0.0)
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,114 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import json
+import logging
+import socket
+
+import urllib3
+from urllib3.connection import HTTPConnection
+
+from cruddy.lambdaclient import BaseClient
+from cruddy.response import CRUDResponse
+from cruddy.transport import prewarm
+
+LOG = logging.getLogger(__name__)
+
+
+class HTTPClient(BaseClient):
+    """
+    Calls a handler served by ``cruddy serve`` and has the same operations
+    as LambdaClient.  Connections are kept alive and reused from a pool
+    that is safe to share between threads.
+
+    * url - the server's URL, e.g. ``http://127.0.0.1:8080``
+    * transport - the same settings as LambdaClient's ``transport``:
+      ``max_pool_connections``, ``connect_timeout``, ``read_timeout``,
+      ``tcp_keepalive``, ``max_attempts`` and ``prewarm`` are used.  Only
+      requests that could not be sent are retried, because operations
+      are not idempotent.
+    * hedging - hedge slow idempotent calls, as for LambdaClient
+    """
+
+    def __init__(self, url, transport=None, hedging=None, **kwargs):
+        self.url = url.rstrip('/')
+        self.__name__ = self.url
+        transport = transport or {}
+        socket_options = list(HTTPConnection.default_socket_options)
+        if transport.get('tcp_keepalive'):
+            socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        max_attempts = transport.get('max_attempts') or 3
+        self._pool = urllib3.PoolManager(
+            maxsize=transport.get('max_pool_connections') or 10,
+            timeout=urllib3.Timeout(
+                connect=transport.get('connect_timeout'),
+                read=transport.get('read_timeout')),
+            retries=urllib3.Retry(total=max_attempts - 1, read=0,
+                                  redirect=0),
+            socket_options=socket_options)
+        if transport.get('prewarm'):
+            self.prewarm(transport['prewarm'])
+        self._setup_hedging(hedging)
+
+    def prewarm(self, connections):
+        """
+        Opens ``connections`` connections to the server (with a request to
+        its health check each) so they are waiting in the pool.
+        """
+        def health():
+            try:
+                self._pool.request('GET', self.url + '/health')
+            except urllib3.exceptions.HTTPError as e:
+                LOG.debug('prewarm failed: %s', e)
+        return prewarm(health, connections)
+
+    def _post(self, payload):
+        try:
+            response = self._pool.request(
+                'POST', self.url + '/', body=json.dumps(payload),
+                headers={'Content-Type': 'application/json'})
+        except urllib3.exceptions.HTTPError:
+            LOG.exception('Could not call cruddy server %s', self.url)
+            raise
+        LOG.debug('response.payload: %s', response.data)
+        try:
+            return json.loads(response.data.decode('utf-8'))
+        except ValueError:
+            LOG.error('Call to cruddy server %s failed: %s %s', self.url,
+                      response.status, response.data)
+            return None
+
+    def _send(self, payload):
+        data = self._post(payload)
+        if not isinstance(data, dict):
+            return False
+        return CRUDResponse(response_data=data)
+
+    def invoke_batch(self, payloads):
+        """
+        Sends a list of operation payloads in one request and returns a
+        list of CRUDResponses, in the same order.  If the server was
+        started with ``--batch`` their writes and reads are batched.
+        """
+        data = self._post(payloads)
+        if isinstance(data, dict):
+            # The whole request failed
+            return [CRUDResponse(response_data=data) for p in payloads]
+        if not isinstance(data, list):
+            return False
+        return [CRUDResponse(response_data=d) for d in data]
+
+    def close(self):
+        self._pool.clear()
+        if self.hedger is not None:
+            self.hedger.close()
@@ -17,51 +17,67 @@ import json
 import boto3
 import botocore.exceptions
 
+from cruddy.exceptions import CruddyTimeoutError
+from cruddy.hedging import Hedger
+from cruddy.pager import Pager
 from cruddy.response import CRUDResponse
+from cruddy.transport import get_config, prewarm
 
 LOG = logging.getLogger(__name__)
 
 
-class LambdaClient(object):
+class BaseClient(object):
+    """
+    The operations of a remote cruddy handler.  Each one builds the
+    operation payload and passes it to ``invoke``, which passes it to
+    ``_send``, which subclasses implement to deliver it (to a Lambda
+    function or an HTTP server) and return a CRUDResponse.
 
-    def __init__(self, func_name, profile_name=None,
-                 region_name=None, **kwargs):
-        self.__name__ = func_name
-        self._lambda_client = None
-        session = boto3.Session(
-            profile_name=profile_name, region_name=region_name)
-        self._lambda_client = session.client('lambda')
+    If the client was created with ``hedging`` (True or a dict of Hedger
+    parameters), slow calls of idempotent operations are hedged and calls
+    that miss their deadline return a ``DeadlineExceeded`` error.  Any
+    operation also accepts a ``deadline``, in seconds, for that call.
+    """
+
+    hedger = None
+
+    def _setup_hedging(self, hedging):
+        if not hedging:
+            # Nothing is hedged, but latencies and deadlines still work
+            hedging = {'operations': ()}
+        elif not isinstance(hedging, dict):
+            hedging = {}
+        self.hedger = Hedger(**hedging)
+
+    def _send(self, payload):
+        raise NotImplementedError()
 
     def invoke(self, payload):
+        if self.hedger is None:
+            return self._send(payload)
+        deadline = payload.get('deadline')
+        if deadline is not None:
+            payload = dict(payload)
+            del payload['deadline']
         try:
-            response = self._lambda_client.invoke(
-                FunctionName=self.__name__,
-                InvocationType='RequestResponse',
-                Payload=json.dumps(payload)
-            )
-            LOG.debug('response: %s', response)
-            if response.get('StatusCode') == 200:
-                payload = response['Payload'].read()
-                LOG.debug('response.payload: %s', payload)
-                try:
-                    response = json.loads(payload)
-                except ValueError:
-                    # Probably a plain text response, or an error...
-                    response = payload
-                    print(response)
-                return CRUDResponse(response_data=response)
-            else:
-                LOG.error('Call to lambda function %s failed', self.__name__)
-                LOG.error(response.get('FunctionError'))
-                LOG.error(response.get('ResponseMetadata'))
-                return False
-        except botocore.exceptions.ClientError:
-            LOG.exception('Could not call Lambda function %s', self.__name__)
-            raise
+            return self.hedger.call(self._send, payload, deadline)
+        except CruddyTimeoutError as e:
+            response = CRUDResponse()
+            response.status = 'error'
+            response.error_type = 'DeadlineExceeded'
+            response.error_message = str(e)
+            return response
+
+    def hedging_stats(self):
+        """
+        Returns the hedge rate and the latency histogram of each operation
+        (see ``Hedger.stats``).
+        """
+        return self.hedger.stats()
 
     def call_operation(self, operation, **kwargs):
         """
-        A generic method to call any operation supported by the Lambda handler
+        A generic method to call any operation supported by the handler
         """
         data = {'operation': operation}
         data.update(kwargs)
@@ -77,6 +93,11 @@ class LambdaClient(object):
         data.update(kwargs)
         return self.invoke(data)
 
+    def stats(self, **kwargs):
+        data = {'operation': 'stats'}
+        data.update(kwargs)
+        return self.invoke(data)
+
     def help(self, **kwargs):
         data = {'operation': 'help'}
         data.update(kwargs)
@@ -87,6 +108,9 @@ class LambdaClient(object):
         data.update(kwargs)
         return self.invoke(data)
 
+    def iter_list(self, prefetch=0, **kwargs):
+        return Pager(self.list, kwargs, prefetch)
+
     def get(self, item_id, **kwargs):
         data = {'operation': 'get',
                 'id': item_id}
@@ -99,6 +123,12 @@ class LambdaClient(object):
         data.update(kwargs)
         return self.invoke(data)
 
+    def bulk_create(self, items, **kwargs):
+        data = {'operation': 'bulk_create',
+                'items': items}
+        data.update(kwargs)
+        return self.invoke(data)
+
     def update(self, item, **kwargs):
         data = {'operation': 'update',
                 'item': item}
@@ -125,6 +155,10 @@ class LambdaClient(object):
         data.update(kwargs)
         return self.invoke(data)
 
+    def iter_search(self, query, prefetch=0, **kwargs):
+        kwargs['query'] = query
+        return Pager(self.search, kwargs, prefetch)
+
     def increment(self, item_id, counter_name, **kwargs):
         id_name = kwargs.get('id_name', 'id')
         increment = kwargs.get('increment', 1)
@@ -134,3 +168,60 @@ class LambdaClient(object):
                 'increment': increment}
         data.update(kwargs)
         return self.invoke(data)
+
+    def get_counter(self, item_id, counter_name, **kwargs):
+        data = {'operation': 'get_counter',
+                'id': item_id,
+                'counter_name': counter_name}
+        data.update(kwargs)
+        return self.invoke(data)
+
+
+class LambdaClient(BaseClient):
+
+    def __init__(self, func_name, profile_name=None,
+                 region_name=None, transport=None, hedging=None, **kwargs):
+        self.__name__ = func_name
+        self._lambda_client = None
+        transport = transport or {}
+        session = boto3.Session(
+            profile_name=profile_name, region_name=region_name)
+        self._lambda_client = session.client(
+            'lambda', config=get_config(transport))
+        if transport.get('prewarm'):
+            self.prewarm(transport['prewarm'])
+        self._setup_hedging(hedging)
+
+    def prewarm(self, connections):
+        """
+        Opens ``connections`` connections to the Lambda service so the first
+        invocations do not pay for the TLS handshake.
+        """
+        return prewarm(self._lambda_client.get_account_settings, connections)
+
+    def _send(self, payload):
+        try:
+            response = self._lambda_client.invoke(
+                FunctionName=self.__name__,
+                InvocationType='RequestResponse',
+                Payload=json.dumps(payload)
+            )
+            LOG.debug('response: %s', response)
+            if response.get('StatusCode') == 200:
+                payload = response['Payload'].read()
+                LOG.debug('response.payload: %s', payload)
+                try:
+                    response = json.loads(payload)
+                except ValueError:
+                    # Probably a plain text response, or an error, which
+                    # was logged above
+                    response = payload
+                return CRUDResponse(response_data=response)
+            else:
+                LOG.error('Call to lambda function %s failed', self.__name__)
+                LOG.error(response.get('FunctionError'))
+                LOG.error(response.get('ResponseMetadata'))
+                return False
+        except botocore.exceptions.ClientError:
+            LOG.exception('Could not call Lambda function %s', self.__name__)
+            raise
@@ -0,0 +1,90 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+class LazyItem(Mapping):
+    """
+    A read-only view of an item as it was stored.  Each attribute value is
+    converted (decrypted, decompressed and its Decimals replaced) the first
+    time it is read and the result is kept, so attributes that are never
+    read cost nothing.
+
+    * raw - the item as returned by the table
+    * convert - called as ``convert(name, value)`` to convert a value
+
+    A LazyItem compares equal to the equivalent dict, ``to_dict`` converts
+    every attribute and returns a plain dict and copying it with
+    ``copy.deepcopy`` (as ``CRUDResponse.flatten`` does) also gives a plain
+    dict.  Errors while converting a value (e.g. from KMS) are raised when
+    the attribute is read.
+    """
+
+    __slots__ = ('_raw', '_values', '_convert')
+
+    def __init__(self, raw, convert):
+        self._raw = raw
+        self._values = {}
+        self._convert = convert
+
+    def __getitem__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        value = self._convert(name, self._raw[name])
+        self._values[name] = value
+        return value
+
+    def __contains__(self, name):
+        return name in self._raw
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __repr__(self):
+        # Only the names, reading the values would convert them
+        return 'LazyItem({})'.format(', '.join(sorted(
+            str(name) for name in self._raw)))
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.to_dict(), memo)
+
+    def is_converted(self, name):
+        """
+        Returns True if the value of ``name`` has already been converted.
+        """
+        return name in self._values
+
+    def to_dict(self):
+        return dict((name, self[name]) for name in self._raw)
+
+
+def json_default(value):
+    """
+    A ``default`` for ``json.dumps`` that writes LazyItems as dicts, for
+    data that is not copied with ``CRUDResponse.flatten`` first.
+    """
+    if isinstance(value, LazyItem):
+        return value.to_dict()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
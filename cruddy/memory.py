@@ -0,0 +1,636 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import decimal
+import itertools
+import re
+import threading
+import zlib
+
+from boto3.dynamodb.conditions import AttributeBase, ConditionBase
+from boto3.dynamodb.types import Binary
+from botocore.exceptions import ClientError
+from botocore.vendored.six import string_types, integer_types
+
+from cruddy.backend import Backend
+
+# DynamoDB stops reading a Scan or Query page once 1MB of data has been read
+PAGE_SIZE = 1024 * 1024
+
+CLAUSE_RE = re.compile(r'\b(SET|REMOVE|ADD|DELETE)\b', re.IGNORECASE)
+
+
+def _error(code, message, operation):
+    error = {'Error': {'Code': code, 'Message': message, 'Type': 'Sender'}}
+    return ClientError(error, operation)
+
+
+def _normalize(value):
+    # Store values the way the DynamoDB deserializer would return them
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, integer_types):
+        return decimal.Decimal(value)
+    if isinstance(value, float):
+        raise TypeError(
+            'Float types are not supported. Use Decimal types instead.')
+    if isinstance(value, (bytes, bytearray)) and not isinstance(value, str):
+        return Binary(bytes(value))
+    if isinstance(value, dict):
+        return dict((k, _normalize(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        if not value:
+            raise ValueError('Sets may not be empty')
+        return set(_normalize(v) for v in value)
+    return value
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return dict((k, _copy(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
+def item_size(value):
+    """
+    Returns an estimate, in bytes, of the size DynamoDB would account for the
+    value (or item).
+    """
+    if isinstance(value, dict):
+        return sum(len(k) + item_size(v) for k, v in value.items()) + 3
+    if isinstance(value, (list, set)):
+        return sum(item_size(v) for v in value) + 3
+    if isinstance(value, string_types):
+        return len(value.encode('utf-8'))
+    if isinstance(value, Binary):
+        return len(value.value)
+    if isinstance(value, decimal.Decimal):
+        return len(str(value)) // 2 + 1
+    return 1
+
+
+class _Expression(object):
+    """
+    Resolves the ``#name`` and ``:value`` placeholders of a string
+    expression.
+    """
+
+    def __init__(self, names, values, operation):
+        self.names = names or {}
+        self.values = values or {}
+        self.operation = operation
+
+    def name(self, token):
+        token = token.strip()
+        if token.startswith('#'):
+            if token not in self.names:
+                raise _error('ValidationException',
+                             'Undefined attribute name: {}'.format(token),
+                             self.operation)
+            return self.names[token]
+        if not re.match(r'^[A-Za-z_]\w*$', token):
+            raise _error('ValidationException',
+                         'Unsupported attribute path: {}'.format(token),
+                         self.operation)
+        return token
+
+    def value(self, token):
+        token = token.strip()
+        if token not in self.values:
+            raise _error('ValidationException',
+                         'Undefined attribute value: {}'.format(token),
+                         self.operation)
+        return _normalize(self.values[token])
+
+
+def _split_top_level(s):
+    parts = []
+    depth = 0
+    current = []
+    for c in s:
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        if c == ',' and depth == 0:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(c)
+    if ''.join(current).strip():
+        parts.append(''.join(current))
+    return parts
+
+
+class MemoryBackend(Backend):
+    """
+    A fast, in-process implementation of the storage interface.  Items are
+    kept in a dict keyed by the value of the HASH key, with a hash index for
+    each GSI.  All operations hold a single lock so updates (including
+    counters) are atomic.
+
+    * table_name - the name reported for the table
+    * hash_key - the name of the HASH key attribute (default ``id``)
+    * indexes - a dict mapping GSI HASH attribute names to index names
+    * page_size - the number of bytes read before a Scan or Query page ends
+    """
+
+    name = 'memory'
+
+    def __init__(self, table_name='memory', hash_key='id', indexes=None,
+                 page_size=PAGE_SIZE):
+        self.table_name = table_name
+        self.hash_key = hash_key
+        self.indexes = dict(indexes or {})
+        self.page_size = page_size
+        self._items = {}
+        self._sizes = {}
+        # The keys of the table and of each index value, sorted so a page
+        # can start after its ExclusiveStartKey with a binary search
+        self._keys = []
+        self._index_data = dict((attr, {}) for attr in self.indexes)
+        self._lock = threading.RLock()
+        self._request_ids = itertools.count(1)
+
+    @property
+    def key_schema(self):
+        return [{'AttributeName': self.hash_key, 'KeyType': 'HASH'}]
+
+    @property
+    def global_secondary_indexes(self):
+        if not self.indexes:
+            return None
+        return [{'IndexName': index_name,
+                 'KeySchema': [{'AttributeName': attr, 'KeyType': 'HASH'}],
+                 'Projection': {'ProjectionType': 'ALL'}}
+                for attr, index_name in self.indexes.items()]
+
+    def __len__(self):
+        return len(self._items)
+
+    def _response(self, **kwargs):
+        kwargs['ResponseMetadata'] = {
+            'HTTPStatusCode': 200,
+            'RequestId': str(next(self._request_ids))}
+        return kwargs
+
+    def _key(self, key, operation):
+        if not isinstance(key, dict) or self.hash_key not in key:
+            raise _error('ValidationException',
+                         'The provided key element does not match the '
+                         'schema', operation)
+        return _normalize(key[self.hash_key])
+
+    def _store(self, key, item):
+        old = self._items.get(key)
+        if old is not None:
+            self._unindex(key, old)
+        else:
+            bisect.insort(self._keys, key)
+        self._items[key] = item
+        self._sizes[key] = item_size(item)
+        for attr, data in self._index_data.items():
+            if attr in item:
+                bisect.insort(data.setdefault(item[attr], []), key)
+        return old
+
+    def _unindex(self, key, item):
+        for attr, data in self._index_data.items():
+            if attr in item:
+                keys = data.get(item[attr])
+                if keys is not None:
+                    _discard(keys, key)
+                    if not keys:
+                        del data[item[attr]]
+
+    def _remove(self, key):
+        old = self._items.pop(key, None)
+        if old is not None:
+            del self._sizes[key]
+            _discard(self._keys, key)
+            self._unindex(key, old)
+        return old
+
+    def _check_condition(self, kwargs, item, operation):
+        condition = kwargs.get('ConditionExpression')
+        if condition is not None:
+            expression = _Expression(kwargs.get('ExpressionAttributeNames'),
+                                     kwargs.get('ExpressionAttributeValues'),
+                                     operation)
+            if not _evaluate(condition, item or {}, expression):
+                raise _error('ConditionalCheckFailedException',
+                             'The conditional request failed', operation)
+
+    def _projection(self, kwargs, operation):
+        pe = kwargs.get('ProjectionExpression')
+        if not pe:
+            return None
+        expression = _Expression(kwargs.get('ExpressionAttributeNames'),
+                                 None, operation)
+        return [expression.name(n) for n in pe.split(',')]
+
+    def _project(self, item, projection):
+        if projection is None:
+            return _copy(item)
+        return dict((n, _copy(item[n])) for n in projection if n in item)
+
+    def put_item(self, **kwargs):
+        item = kwargs['Item']
+        try:
+            normalized = _normalize(item)
+        except (TypeError, ValueError) as e:
+            raise _error('ValidationException', str(e), 'PutItem')
+        key = self._key(normalized, 'PutItem')
+        with self._lock:
+            self._check_condition(kwargs, self._items.get(key), 'PutItem')
+            old = self._store(key, normalized)
+        response = self._response()
+        if old is not None and kwargs.get('ReturnValues') == 'ALL_OLD':
+            response['Attributes'] = _copy(old)
+        return response
+
+    def get_item(self, **kwargs):
+        key = self._key(kwargs['Key'], 'GetItem')
+        projection = self._projection(kwargs, 'GetItem')
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return self._response()
+            return self._response(Item=self._project(item, projection))
+
+    def batch_get_item(self, **kwargs):
+        keys = kwargs['Keys']
+        if len(keys) > 100:
+            raise _error('ValidationException',
+                         'Too many items requested for the BatchGetItem '
+                         'call', 'BatchGetItem')
+        projection = self._projection(kwargs, 'BatchGetItem')
+        items = []
+        with self._lock:
+            for key in keys:
+                item = self._items.get(self._key(key, 'BatchGetItem'))
+                if item is not None:
+                    items.append(self._project(item, projection))
+        return self._response(Items=items, UnprocessedKeys=[])
+
+    def batch_write_item(self, **kwargs):
+        requests = kwargs['RequestItems']
+        if len(requests) > 25:
+            raise _error('ValidationException',
+                         'Too many items requested for the BatchWriteItem '
+                         'call', 'BatchWriteItem')
+        writes = []
+        for request in requests:
+            if 'PutRequest' in request:
+                try:
+                    item = _normalize(request['PutRequest']['Item'])
+                except (TypeError, ValueError) as e:
+                    raise _error('ValidationException', str(e),
+                                 'BatchWriteItem')
+                writes.append((self._key(item, 'BatchWriteItem'), item))
+            else:
+                key = request['DeleteRequest']['Key']
+                writes.append((self._key(key, 'BatchWriteItem'), None))
+        if len(set(key for key, _ in writes)) != len(writes):
+            raise _error('ValidationException',
+                         'Provided list of item keys contains duplicates',
+                         'BatchWriteItem')
+        with self._lock:
+            for key, item in writes:
+                if item is None:
+                    self._remove(key)
+                else:
+                    self._store(key, item)
+        return self._response(UnprocessedItems=[])
+
+    def delete_item(self, **kwargs):
+        key = self._key(kwargs['Key'], 'DeleteItem')
+        with self._lock:
+            self._check_condition(kwargs, self._items.get(key), 'DeleteItem')
+            old = self._remove(key)
+        response = self._response()
+        if old is not None and kwargs.get('ReturnValues') == 'ALL_OLD':
+            response['Attributes'] = _copy(old)
+        return response
+
+    def update_item(self, **kwargs):
+        key = self._key(kwargs['Key'], 'UpdateItem')
+        expression = _Expression(kwargs.get('ExpressionAttributeNames'),
+                                 kwargs.get('ExpressionAttributeValues'),
+                                 'UpdateItem')
+        actions = _parse_update(kwargs.get('UpdateExpression', ''),
+                                expression)
+        with self._lock:
+            old = self._items.get(key)
+            self._check_condition(kwargs, old, 'UpdateItem')
+            if old is None:
+                new = {self.hash_key: key}
+            else:
+                new = dict(old)
+            updated = _apply_update(actions, old or {}, new, expression)
+            self._store(key, new)
+            return_values = kwargs.get('ReturnValues', 'NONE')
+            response = self._response()
+            if return_values == 'ALL_NEW':
+                response['Attributes'] = _copy(new)
+            elif return_values == 'ALL_OLD' and old is not None:
+                response['Attributes'] = _copy(old)
+            elif return_values == 'UPDATED_NEW':
+                response['Attributes'] = dict(
+                    (n, _copy(new[n])) for n in updated if n in new)
+            elif return_values == 'UPDATED_OLD' and old is not None:
+                response['Attributes'] = dict(
+                    (n, _copy(old[n])) for n in updated if n in old)
+        return response
+
+    def _page(self, keys, kwargs, index_attr, operation):
+        # ``keys`` is sorted, and is not copied so a page costs no more
+        # than the items it reads
+        projection = self._projection(kwargs, operation)
+        limit = kwargs.get('Limit')
+        first = 0
+        start = kwargs.get('ExclusiveStartKey')
+        if start is not None:
+            first = bisect.bisect_right(keys,
+                                        self._key(start, operation))
+        segment = kwargs.get('Segment')
+        total_segments = kwargs.get('TotalSegments')
+        condition = kwargs.get('FilterExpression')
+        if condition is not None:
+            expression = _Expression(kwargs.get('ExpressionAttributeNames'),
+                                     kwargs.get('ExpressionAttributeValues'),
+                                     operation)
+        items = []
+        scanned = 0
+        size = 0
+        last_key = None
+        for i in range(first, len(keys)):
+            key = keys[i]
+            if total_segments and _segment_of(key, total_segments) != segment:
+                continue
+            item = self._items[key]
+            scanned += 1
+            size += self._sizes[key]
+            if condition is None or _evaluate(condition, item, expression):
+                items.append(self._project(item, projection))
+            if size >= self.page_size or (limit and scanned >= limit):
+                last_key = key
+                break
+        response = self._response(Items=items, Count=len(items),
+                                  ScannedCount=scanned)
+        if last_key is not None and last_key != keys[-1]:
+            lek = {self.hash_key: last_key}
+            if index_attr is not None:
+                lek[index_attr] = self._items[last_key][index_attr]
+            response['LastEvaluatedKey'] = lek
+        return response
+
+    def scan(self, **kwargs):
+        with self._lock:
+            return self._page(self._keys, kwargs, None, 'Scan')
+
+    def query(self, **kwargs):
+        condition = kwargs['KeyConditionExpression']
+        expression = _Expression(kwargs.get('ExpressionAttributeNames'),
+                                 kwargs.get('ExpressionAttributeValues'),
+                                 'Query')
+        attr, value = _key_condition(condition, expression)
+        index_name = kwargs.get('IndexName')
+        index_attr = None
+        with self._lock:
+            if index_name:
+                for name, iname in self.indexes.items():
+                    if iname == index_name:
+                        index_attr = name
+                if index_attr != attr:
+                    raise _error('ValidationException',
+                                 'Query condition missed key schema element',
+                                 'Query')
+                keys = self._index_data[attr].get(value, [])
+            elif attr == self.hash_key:
+                keys = [value] if value in self._items else []
+            else:
+                raise _error('ValidationException',
+                             'Query condition missed key schema element',
+                             'Query')
+            return self._page(keys, kwargs, index_attr, 'Query')
+
+
+def _discard(keys, key):
+    # Removes ``key`` from the sorted list ``keys`` if it is there
+    i = bisect.bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
+
+
+def _segment_of(key, total_segments):
+    return zlib.crc32(repr(key).encode('utf-8')) % total_segments
+
+
+# Condition expressions
+#
+# Conditions are accepted as boto3 condition objects (e.g.
+# ``Attr('version').eq(3)``) which are evaluated directly against the item.
+
+def _operand(value, item):
+    if isinstance(value, AttributeBase):
+        return item.get(value.name)
+    return _normalize(value)
+
+
+def _evaluate(condition, item, expression):
+    if not isinstance(condition, ConditionBase):
+        raise _error('ValidationException',
+                     'MemoryBackend only supports boto3 condition objects',
+                     expression.operation)
+    description = condition.get_expression()
+    operator = description['operator']
+    values = description['values']
+    if operator == 'AND':
+        return (_evaluate(values[0], item, expression) and
+                _evaluate(values[1], item, expression))
+    if operator == 'OR':
+        return (_evaluate(values[0], item, expression) or
+                _evaluate(values[1], item, expression))
+    if operator == 'NOT':
+        return not _evaluate(values[0], item, expression)
+    if operator == 'attribute_exists':
+        return values[0].name in item
+    if operator == 'attribute_not_exists':
+        return values[0].name not in item
+    operands = [_operand(v, item) for v in values]
+    left = operands[0]
+    if left is None and operator != '<>':
+        return False
+    try:
+        if operator == '=':
+            return left == operands[1]
+        if operator == '<>':
+            return left != operands[1]
+        if operator == '<':
+            return left < operands[1]
+        if operator == '<=':
+            return left <= operands[1]
+        if operator == '>':
+            return left > operands[1]
+        if operator == '>=':
+            return left >= operands[1]
+        if operator == 'BETWEEN':
+            return operands[1] <= left <= operands[2]
+        if operator == 'IN':
+            return left in operands[1:]
+        if operator == 'begins_with':
+            return left.startswith(operands[1])
+        if operator == 'contains':
+            return operands[1] in left
+    except TypeError:
+        return False
+    raise _error('ValidationException',
+                 'Unsupported condition operator: {}'.format(operator),
+                 expression.operation)
+
+
+def _key_condition(condition, expression):
+    if isinstance(condition, ConditionBase):
+        description = condition.get_expression()
+        if description['operator'] == '=':
+            key, value = description['values']
+            return key.name, _normalize(value)
+    elif isinstance(condition, string_types):
+        match = re.match(r'^\s*([#\w]+)\s*=\s*(:\w+)\s*$', condition)
+        if match:
+            return (expression.name(match.group(1)),
+                    expression.value(match.group(2)))
+    raise _error('ValidationException',
+                 'Only equality key conditions are supported', 'Query')
+
+
+# Update expressions
+#
+# Supports SET (with ``+``, ``-``, ``if_not_exists`` and ``list_append``),
+# REMOVE, ADD and DELETE on top-level attributes.
+
+def _parse_update(update_expression, expression):
+    actions = []
+    pieces = CLAUSE_RE.split(update_expression)
+    if pieces[0].strip():
+        raise _error('ValidationException',
+                     'Invalid UpdateExpression', 'UpdateItem')
+    for i in range(1, len(pieces), 2):
+        clause = pieces[i].upper()
+        for action in _split_top_level(pieces[i + 1]):
+            action = action.strip()
+            if clause == 'SET':
+                if '=' not in action:
+                    raise _error('ValidationException',
+                                 'Invalid SET action: {}'.format(action),
+                                 'UpdateItem')
+                path, value = action.split('=', 1)
+                actions.append((clause, expression.name(path), value))
+            elif clause == 'REMOVE':
+                actions.append((clause, expression.name(action), None))
+            else:
+                path, value = action.split(None, 1)
+                actions.append((clause, expression.name(path),
+                                expression.value(value)))
+    return actions
+
+
+def _split_arithmetic(value):
+    depth = 0
+    for i, c in enumerate(value):
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c in '+-' and depth == 0:
+            return value[:i], c, value[i + 1:]
+    return None
+
+
+def _set_value(value, old, expression):
+    parts = _split_arithmetic(value)
+    if parts is None:
+        return _set_operand(value, old, expression)
+    left = _set_operand(parts[0], old, expression)
+    right = _set_operand(parts[2], old, expression)
+    if not (isinstance(left, decimal.Decimal) and
+            isinstance(right, decimal.Decimal)):
+        raise _error('ValidationException',
+                     'An operand in the update expression has an '
+                     'incorrect data type', 'UpdateItem')
+    if parts[1] == '+':
+        return left + right
+    return left - right
+
+
+def _set_operand(operand, old, expression):
+    operand = operand.strip()
+    if operand.startswith(':'):
+        return expression.value(operand)
+    match = re.match(r'^(if_not_exists|list_append)\s*\((.*)\)$', operand)
+    if match:
+        args = _split_top_level(match.group(2))
+        if match.group(1) == 'if_not_exists':
+            name = expression.name(args[0])
+            if name in old:
+                return old[name]
+            return _set_operand(args[1], old, expression)
+        return (_set_operand(args[0], old, expression) +
+                _set_operand(args[1], old, expression))
+    name = expression.name(operand)
+    if name not in old:
+        raise _error('ValidationException',
+                     'The provided expression refers to an attribute that '
+                     'does not exist in the item', 'UpdateItem')
+    return old[name]
+
+
+def _apply_update(actions, old, new, expression):
+    updated = []
+    for clause, name, value in actions:
+        if clause == 'SET':
+            new[name] = _set_value(value, old, expression)
+        elif clause == 'REMOVE':
+            new.pop(name, None)
+        elif clause == 'ADD':
+            current = new.get(name)
+            if current is None:
+                new[name] = value
+            elif isinstance(current, set) and isinstance(value, set):
+                new[name] = current | value
+            elif (isinstance(current, decimal.Decimal) and
+                  isinstance(value, decimal.Decimal)):
+                new[name] = current + value
+            else:
+                raise _error('ValidationException',
+                             'An operand in the update expression has an '
+                             'incorrect data type', 'UpdateItem')
+        elif clause == 'DELETE':
+            current = new.get(name)
+            if isinstance(current, set):
+                remaining = current - value
+                if remaining:
+                    new[name] = remaining
+                else:
+                    del new[name]
+        updated.append(name)
+    return updated
@@ -0,0 +1,110 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+
+class CallContext(object):
+    """
+    Describes a single call to the underlying DynamoDB table as it flows
+    through the middleware chain.
+
+    * operation - the name of the table method being called (e.g. put_item)
+    * params - the dictionary of parameters passed to the method.  A
+      middleware may modify these before passing the call along.
+    * result - the raw response returned by the method (or by a middleware
+      that short-circuits the call)
+    * elapsed - the time, in seconds, spent in the actual table method
+    """
+
+    __slots__ = ('operation', 'method', 'params', 'result', 'elapsed')
+
+    def __init__(self, operation, method, params):
+        self.operation = operation
+        self.method = method
+        self.params = params
+        self.result = None
+        self.elapsed = None
+
+
+class Middleware(object):
+    """
+    Base class for cruddy middleware.  A middleware is any callable that
+    accepts a ``CallContext`` and a ``call_next`` callable.  It must either
+    call ``call_next(context)`` to continue down the chain (the actual table
+    method is called at the end of the chain) or set ``context.result``
+    itself to short-circuit the call.  Exceptions raised by a middleware are
+    reported in the CRUD response just like errors from DynamoDB.
+
+    Subclasses can override ``before`` and ``after`` rather than
+    ``__call__`` when they only need to observe or tweak the call.
+    """
+
+    def __call__(self, context, call_next):
+        self.before(context)
+        call_next(context)
+        self.after(context)
+
+    def before(self, context):
+        pass
+
+    def after(self, context):
+        pass
+
+
+class StatsMiddleware(Middleware):
+    """
+    A simple middleware that keeps a count and the cumulative elapsed time
+    for each table operation.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def after(self, context):
+        with self._lock:
+            stats = self.stats.setdefault(context.operation,
+                                          {'count': 0, 'elapsed': 0.0})
+            stats['count'] += 1
+            if context.elapsed is not None:
+                stats['elapsed'] += context.elapsed
+
+
+def _call_method(context):
+    start = time.time()
+    context.result = context.method(**context.params)
+    context.elapsed = time.time() - start
+
+
+def build_chain(middleware):
+    """
+    Compose the list of middleware into a single callable that accepts a
+    ``CallContext``.  The first middleware in the list is the outermost.
+    Returns None if there is no middleware so callers can skip the chain
+    entirely.
+    """
+    if not middleware:
+        return None
+    chain = _call_method
+    for mw in reversed(middleware):
+        chain = _link(mw, chain)
+    return chain
+
+
+def _link(mw, call_next):
+    def call(context):
+        mw(context, call_next)
+    return call
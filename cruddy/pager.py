@@ -0,0 +1,143 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import sys
+import threading
+
+from botocore.vendored.six import reraise
+from botocore.vendored.six.moves import queue
+
+from cruddy.exceptions import CruddyReadError
+
+LOG = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class Pager(object):
+    """
+    Iterates over every page of a paginated operation such as ``list`` or
+    ``search``, passing each page's ``last_evaluated_key`` back as the
+    ``start_key`` of the next request.
+
+    * fetch - called as ``fetch(**params)`` to read one page; e.g.
+      ``CRUD.list``, ``CRUD.search`` or the LambdaClient equivalents
+    * params - the parameters for every request
+    * prefetch - the number of pages to request ahead of the page being
+      consumed.  With 0 (the default) each page is requested only when the
+      previous one has been consumed.  Otherwise a background thread reads
+      ahead, but never more than ``prefetch`` pages.
+
+    Iterating over the pager gives the items of every page in turn and
+    raises CruddyReadError if a request fails; ``pages`` gives the
+    responses themselves, ending with the failed response if a request
+    fails.  If the consumer stops early, call ``close`` (or use the pager
+    as a context manager) to stop the background reads; abandoning the
+    iterator does the same once it is garbage collected.
+    """
+
+    def __init__(self, fetch, params=None, prefetch=0):
+        self.fetch = fetch
+        self.params = dict(params or {})
+        self.prefetch = prefetch
+        self._stop = threading.Event()
+        self._slots = None
+        self._thread = None
+
+    def __iter__(self):
+        for response in self.pages():
+            if response.status != 'success':
+                raise CruddyReadError(response.error_type or
+                                      response.error_code,
+                                      response.error_message)
+            for item in response.data:
+                yield item
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _next_params(self, params, response):
+        # Returns the parameters for the page after ``response`` or None
+        if response.status != 'success':
+            return None
+        last_key = getattr(response, 'last_evaluated_key', None)
+        if not last_key:
+            return None
+        return dict(params, start_key=last_key)
+
+    def pages(self):
+        """
+        Yields the response for every page.
+        """
+        if self.prefetch <= 0:
+            params = self.params
+            while params is not None and not self._stop.is_set():
+                response = self.fetch(**params)
+                yield response
+                params = self._next_params(params, response)
+            return
+        pages = queue.Queue()
+        self._slots = threading.Semaphore(self.prefetch)
+        self._thread = threading.Thread(target=self._read_ahead,
+                                        args=(pages,))
+        self._thread.daemon = True
+        self._thread.start()
+        try:
+            while True:
+                page = pages.get()
+                if page is _DONE:
+                    return
+                # Taking a page frees a slot for the reader
+                self._slots.release()
+                if isinstance(page, tuple):
+                    # The reader failed, raise its exception here
+                    reraise(*page)
+                yield page
+        finally:
+            self.close()
+
+    def _read_ahead(self, pages):
+        params = self.params
+        try:
+            while params is not None:
+                self._slots.acquire()
+                if self._stop.is_set():
+                    break
+                response = self.fetch(**params)
+                if self._stop.is_set():
+                    break
+                pages.put(response)
+                params = self._next_params(params, response)
+        except Exception:
+            LOG.debug('prefetch failed', exc_info=True)
+            pages.put(sys.exc_info())
+        pages.put(_DONE)
+
+    def close(self):
+        """
+        Stops reading ahead.  A request already in flight is allowed to
+        finish but its page is discarded.
+        """
+        self._stop.set()
+        if self._slots is not None:
+            # Wake the reader if it is waiting for a free slot
+            self._slots.release()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._thread = None
@@ -0,0 +1,307 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import decimal
+import heapq
+import itertools
+import threading
+
+from boto3.dynamodb.types import Binary
+from botocore.exceptions import ClientError
+from botocore.vendored.six import string_types
+
+from cruddy.memory import item_size
+from cruddy.middleware import Middleware
+
+# Upper bounds, in bytes, of the item size histogram buckets.  DynamoDB
+# charges reads per 4KB and writes per 1KB and items are at most 400KB.
+SizeBuckets = (1024, 4096, 16384, 65536, 262144, 409600)
+
+Reads = ('get_item', 'batch_get_item', 'query', 'scan')
+
+ThrottlingErrors = ('ProvisionedThroughputExceededException',
+                    'ThrottlingException', 'RequestLimitExceeded')
+
+
+class SpaceSaving(object):
+    """
+    Finds the most frequent keys in a stream using at most ``capacity``
+    counters (the Space-Saving algorithm).  When a new key arrives and every
+    counter is in use, the key with the lowest count is replaced and the new
+    key inherits its count, which is recorded as the new key's ``error``.
+    Any key seen more than ``total / capacity`` times is guaranteed to be
+    tracked and its true count lies between ``count - error`` and ``count``.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.total = 0
+        self._counts = {}
+        # A min-heap of (count, seq, key) that may hold stale entries; the
+        # entries are checked against _counts when they are popped.  seq
+        # keeps keys of different types from ever being compared.
+        self._heap = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, key, count=1):
+        self.total += count
+        entry = self._counts.get(key)
+        if entry is None:
+            if len(self._counts) < self.capacity:
+                entry = [0, 0]
+            else:
+                error = self._evict()
+                entry = [error, error]
+            self._counts[key] = entry
+        entry[0] += count
+        heapq.heappush(self._heap, (entry[0], next(self._seq), key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c[0], next(self._seq), k)
+                          for k, c in self._counts.items()]
+            heapq.heapify(self._heap)
+
+    def _evict(self):
+        while True:
+            count, _, key = heapq.heappop(self._heap)
+            entry = self._counts.get(key)
+            if entry is not None and entry[0] == count:
+                del self._counts[key]
+                return count
+
+    def top(self, n=10):
+        """
+        Returns the ``n`` keys with the highest counts as a list of
+        ``(key, count, error)`` tuples.
+        """
+        ranked = heapq.nlargest(n, self._counts.items(),
+                                key=lambda kv: kv[1][0])
+        return [(key, entry[0], entry[1]) for key, entry in ranked]
+
+
+class SizeHistogram(object):
+    """
+    Counts item sizes in the ``SizeBuckets`` buckets.
+    """
+
+    def __init__(self):
+        self.counts = [0] * len(SizeBuckets)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, size):
+        self.count += 1
+        self.total += size
+        self.max = max(self.max, size)
+        for i, bound in enumerate(SizeBuckets):
+            if size <= bound or i == len(SizeBuckets) - 1:
+                self.counts[i] += 1
+                break
+
+    def report(self):
+        return {
+            'count': self.count,
+            'mean_bytes': self.total // self.count if self.count else 0,
+            'max_bytes': self.max,
+            'buckets': dict(('<={}KB'.format(bound // 1024), count)
+                            for bound, count in zip(SizeBuckets,
+                                                    self.counts))
+        }
+
+
+def _key_value(value):
+    # Keys are reported as strings (or numbers) so the report is JSON
+    # serializable and keys of different types can be told apart
+    if isinstance(value, string_types):
+        return value
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value % 1 == 0 else float(value)
+    if isinstance(value, Binary):
+        value = value.value
+    return repr(value)
+
+
+def _condition_key(condition):
+    # Returns ``attribute=value`` for a boto3 equality key condition such
+    # as Key('color').eq('red'), the partition a query reads
+    try:
+        values = condition.get_expression()['values']
+        return '{}={}'.format(values[0].name, _key_value(values[1]))
+    except (AttributeError, KeyError, IndexError, TypeError):
+        return None
+
+
+class AccessProfiler(Middleware):
+    """
+    A middleware that profiles how a table is accessed: the most frequently
+    used keys for each DynamoDB operation (and across all of them), the
+    sizes of the items read and written and the number of calls of each
+    kind.  The keys are counted with a SpaceSaving sketch so memory use is
+    bounded no matter how many distinct keys there are.
+
+    Queries are counted against the ``attribute=value`` they read, so a
+    hot value of an indexed attribute shows up just like a hot item.  Calls
+    that were throttled are counted as well, and their keys are also
+    counted separately.
+
+    * hash_key - the name of the table's hash key
+    * capacity - the number of keys tracked per operation
+    * top - the default number of hot keys in the report
+    """
+
+    def __init__(self, hash_key, capacity=1000, top=10):
+        self.hash_key = hash_key
+        self.capacity = capacity
+        self.top = top
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._calls = {}
+            self._keys = {}
+            self._all_keys = SpaceSaving(self.capacity)
+            self._throttled_keys = SpaceSaving(self.capacity)
+            self._throttled = 0
+            self._sizes = {'read': SizeHistogram(),
+                           'written': SizeHistogram()}
+            self._items_scanned = 0
+
+    def _request_keys(self, operation, params):
+        if operation in ('get_item', 'update_item', 'delete_item'):
+            return [params.get('Key', {}).get(self.hash_key)]
+        if operation == 'put_item':
+            return [params.get('Item', {}).get(self.hash_key)]
+        if operation == 'batch_get_item':
+            return [key.get(self.hash_key) for key in params.get('Keys', [])]
+        if operation == 'batch_write_item':
+            keys = []
+            for request in params.get('RequestItems', []):
+                if 'PutRequest' in request:
+                    keys.append(request['PutRequest']['Item'].get(
+                        self.hash_key))
+                else:
+                    keys.append(request['DeleteRequest']['Key'].get(
+                        self.hash_key))
+            return keys
+        if operation == 'query':
+            key = _condition_key(params.get('KeyConditionExpression'))
+            return [key] if key is not None else []
+        return []
+
+    def _written_items(self, operation, params):
+        if operation == 'put_item':
+            return [params.get('Item', {})]
+        if operation == 'batch_write_item':
+            return [request['PutRequest']['Item']
+                    for request in params.get('RequestItems', [])
+                    if 'PutRequest' in request]
+        return []
+
+    def _read_items(self, operation, result):
+        if not result:
+            return []
+        if operation == 'get_item':
+            return [result['Item']] if 'Item' in result else []
+        if operation in ('batch_get_item', 'query', 'scan'):
+            return result.get('Items', [])
+        return []
+
+    def __call__(self, context, call_next):
+        try:
+            call_next(context)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            self._record(context, code in ThrottlingErrors)
+            raise
+        self._record(context)
+
+    def _record(self, context, throttled=False):
+        operation = context.operation
+        keys = [_key_value(key)
+                for key in self._request_keys(operation, context.params)
+                if key is not None]
+        written = [item_size(item)
+                   for item in self._written_items(operation,
+                                                   context.params)]
+        read = [item_size(item)
+                for item in self._read_items(operation, context.result)]
+        with self._lock:
+            self._calls[operation] = self._calls.get(operation, 0) + 1
+            if operation == 'scan':
+                self._items_scanned += len(read)
+            if throttled:
+                self._throttled += 1
+                for key in keys:
+                    self._throttled_keys.add(key)
+            if keys:
+                sketch = self._keys.get(operation)
+                if sketch is None:
+                    sketch = self._keys[operation] = SpaceSaving(
+                        self.capacity)
+                for key in keys:
+                    sketch.add(key)
+                    self._all_keys.add(key)
+            for size in written:
+                self._sizes['written'].add(size)
+            for size in read:
+                self._sizes['read'].add(size)
+
+    def _hot_keys(self, sketch, top):
+        return [{'key': key, 'count': count, 'error': error,
+                 'share': float(count) / sketch.total}
+                for key, count, error in sketch.top(top)]
+
+    def report(self, top=None):
+        """
+        Returns the profile: ``hot_keys`` (the ``top`` keys across all
+        operations, in throttled calls and for each operation),
+        ``item_sizes`` (a histogram of the sizes of the items ``read`` and
+        ``written``) and ``access_mix`` (the number of calls of each
+        operation and the share of reads that were scans, queries and key
+        lookups).
+        """
+        top = top or self.top
+        with self._lock:
+            reads = dict((op, self._calls.get(op, 0)) for op in Reads)
+            total_reads = sum(reads.values())
+            mix = {
+                'calls': dict(self._calls),
+                'throttled': self._throttled,
+                'items_scanned': self._items_scanned,
+                'scan_share': 0.0, 'query_share': 0.0, 'key_share': 0.0
+            }
+            if total_reads:
+                mix['scan_share'] = float(reads['scan']) / total_reads
+                mix['query_share'] = float(reads['query']) / total_reads
+                mix['key_share'] = (float(reads['get_item'] +
+                                          reads['batch_get_item']) /
+                                    total_reads)
+            return {
+                'hot_keys': {
+                    'all': self._hot_keys(self._all_keys, top),
+                    'throttled': self._hot_keys(self._throttled_keys, top),
+                    'operations': dict(
+                        (operation, self._hot_keys(sketch, top))
+                        for operation, sketch in self._keys.items())
+                },
+                'item_sizes': dict((name, histogram.report())
+                                   for name, histogram
+                                   in self._sizes.items()),
+                'access_mix': mix,
+                'capacity': self.capacity
+            }
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
+
 from cruddy.calculatedvalue import CalculatedValue
 
 
@@ -20,7 +22,9 @@ class PrototypeHandler(object):
     def __init__(self, prototype):
         self.prototype = prototype
 
-    def check(self, item, operation, response):
+    def check(self, item, operation, response, partial=False):
+        # For a partial update, missing attributes are left alone rather
+        # than being filled in with the prototype defaults
         for key in self.prototype:
             value = self.prototype[key]
             cv = CalculatedValue.check(value)
@@ -41,6 +45,7 @@ class PrototypeHandler(object):
                             key, type(value))
                         response.error_message = msg
                         return False
-                else:
-                    item[key] = value
+                elif not partial:
+                    # Each item gets its own copy of a mutable default
+                    item[key] = copy.deepcopy(value)
         return True
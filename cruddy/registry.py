@@ -0,0 +1,177 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import boto3
+
+import cruddy
+from cruddy.backend import DynamoDBBackend
+from cruddy.response import CRUDResponse
+from cruddy.transport import get_config, prewarm
+
+
+class CRUDRegistry(object):
+    """
+    Hosts CRUD handlers for many tables in one process.  All of the handlers
+    share one boto3 Session, one DynamoDB resource (and so one connection
+    pool) and one KMS client, and each handler is only created the first
+    time its table is used.
+
+    * tables - a dict mapping table names to the parameters for that
+      table's CRUD handler (``table_name`` defaults to the dict key)
+    * default_table - the table used when ``handler`` is called without a
+      ``table``
+    * profile_name, region_name, session, transport - used to create the
+      shared session and clients, as for ``CRUD``.  If ``transport``
+      contains ``prewarm``, the shared connections are opened right away.
+    * debug - passed to every handler
+
+    Any other parameters are used as defaults for every table.
+    """
+
+    def __init__(self, tables=None, default_table=None, **kwargs):
+        self.default_table = default_table
+        self._debug = kwargs.get('debug', False)
+        self._session = kwargs.pop('session', None)
+        self._profile_name = kwargs.pop('profile_name', None)
+        self._region_name = kwargs.pop('region_name', None)
+        self._transport = kwargs.pop('transport', None) or {}
+        self._defaults = kwargs
+        self._configs = {}
+        self._handlers = {}
+        # Held while a table's handler is created, so a slow cold start
+        # only holds up the callers of that table
+        self._init_locks = {}
+        self._resource = None
+        self._kms_client = None
+        self._lock = threading.RLock()
+        for name, config in (tables or {}).items():
+            self.register(name, **config)
+        if self._transport.get('prewarm'):
+            prewarm(self.resource.meta.client.describe_limits,
+                    self._transport['prewarm'])
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = boto3.Session(
+                    profile_name=self._profile_name,
+                    region_name=self._region_name)
+            return self._session
+
+    @property
+    def resource(self):
+        with self._lock:
+            if self._resource is None:
+                self._resource = self.session.resource(
+                    'dynamodb', config=get_config(self._transport))
+            return self._resource
+
+    @property
+    def kms_client(self):
+        with self._lock:
+            if self._kms_client is None:
+                self._kms_client = self.session.client(
+                    'kms', config=get_config(self._transport))
+            return self._kms_client
+
+    @property
+    def tables(self):
+        return sorted(self._configs)
+
+    def register(self, name, **config):
+        """
+        Adds (or replaces) the configuration for the table ``name``.  The
+        handler is not created until the table is first used.
+        """
+        config = dict(self._defaults, **config)
+        config.setdefault('table_name', name)
+        with self._lock:
+            self._configs[name] = config
+            old = self._handlers.pop(name, None)
+        if old is not None:
+            old.close()
+
+    def get(self, name):
+        """
+        Returns the CRUD handler for the table ``name``, creating it if
+        necessary.  Raises KeyError if the table is not registered.
+        """
+        crud = self._handlers.get(name)
+        if crud is not None:
+            return crud
+        with self._lock:
+            if name not in self._configs:
+                raise KeyError(name)
+            init_lock = self._init_locks.setdefault(name, threading.Lock())
+        with init_lock:
+            while True:
+                with self._lock:
+                    crud = self._handlers.get(name)
+                    registered = self._configs[name]
+                if crud is not None:
+                    return crud
+                crud = self._create(registered)
+                with self._lock:
+                    # Unless the table was registered again meanwhile
+                    if self._configs.get(name) is registered:
+                        self._handlers[name] = crud
+                        return crud
+                crud.close()
+
+    def _create(self, config):
+        # Makes a DescribeTable call, so it is done without holding _lock
+        config = dict(config)
+        config['session'] = self.session
+        if config.get('backend') is None:
+            config['backend'] = DynamoDBBackend(
+                self.session, config['table_name'], resource=self.resource)
+        if config.get('encrypted_attributes'):
+            config.setdefault('kms_client', self.kms_client)
+        return cruddy.CRUD(**config)
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def __contains__(self, name):
+        return name in self._configs
+
+    def handler(self, table=None, **kwargs):
+        """
+        Routes a handler call to the CRUD handler for ``table`` (or the
+        ``default_table``).  Everything else is passed through to
+        ``CRUD.handler``.
+        """
+        table = table or self.default_table
+        if table not in self._configs:
+            response = CRUDResponse(self._debug)
+            response.status = 'error'
+            response.error_type = 'UnknownTable'
+            if table is None:
+                response.error_message = 'You must pass a table'
+            else:
+                response.error_message = 'Unknown table: {}'.format(table)
+            return response
+        return self.get(table).handler(**kwargs)
+
+    def close(self):
+        """
+        Closes every handler that has been created.
+        """
+        with self._lock:
+            handlers = list(self._handlers.values())
+        for crud in handlers:
+            crud.close()
@@ -14,6 +14,8 @@
 
 import copy
 
+from cruddy.columnar import ColumnarResult
+
 
 class CRUDResponse(object):
 
@@ -37,15 +39,20 @@ class CRUDResponse(object):
     def is_successful(self):
         return self.status == 'success'
 
+    @property
+    def future(self):
+        """
+        For a write that was queued by a handler with ``write_behind``, a
+        ``Future`` that resolves once the item has been written.
+        """
+        return self.__dict__.get('_future')
+
     def flatten(self):
-        flat = copy.deepcopy(self.__dict__)
-        hiddens = []
-        for k in flat:
-            if k.startswith('_'):
-                hiddens.append(k)
-        for k in hiddens:
-            del flat[k]
-        return flat
+        flat = dict((k, v) for k, v in self.__dict__.items()
+                    if not k.startswith('_'))
+        if isinstance(flat.get('data'), ColumnarResult):
+            flat['data'] = flat['data'].to_columns()
+        return copy.deepcopy(flat)
 
     def prepare(self):
         if self.status == 'success':
@@ -10,36 +10,172 @@
 # distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
+import collections
+import csv
+import gzip
+import io
 import json
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
 
 import click
+from botocore.vendored.six import StringIO
 
 from cruddy import CRUD
+from cruddy.bulk import BulkWriter
+from cruddy.export import Exporter, open_output, segment_path
+from cruddy.httpclient import HTTPClient
 from cruddy.lambdaclient import LambdaClient
+from cruddy.lazy import LazyItem, json_default
+from cruddy.pager import Pager
+from cruddy.server import serve as serve_handler
+
+# The list builtin is shadowed by the list command below
+_list = list
+
+
+class OutputWriter(object):
+    """
+    Writes results to stdout as ``json`` (the default, pretty-printed),
+    ``ndjson`` (one item per line) or ``csv``.  Items can be written a page
+    at a time as they arrive.  The CSV columns are taken from the first page
+    and attributes that only appear in later pages are dropped.
+    """
+
+    Formats = ('json', 'ndjson', 'csv')
+
+    def __init__(self, output_format='json'):
+        self.output_format = output_format
+        self._count = 0
+        self._csv = None
+        self._buffer = None
+
+    def _echo(self, text, nl=True):
+        click.echo(text, nl=nl)
+
+    def _dumps(self, value, indent=None):
+        # Items may be LazyItems when the handler has lazy_items set
+        return json.dumps(value, indent=indent, default=json_default)
+
+    def _cell(self, value):
+        if isinstance(value, (dict, _list)):
+            return self._dumps(value)
+        return value
+
+    def begin(self):
+        if self.output_format == 'json':
+            self._echo('[', nl=False)
+
+    def write_items(self, items):
+        for item in items:
+            if self.output_format == 'json':
+                prefix = ',' if self._count else ''
+                self._echo(prefix + '\n' + self._dumps(item, indent=4),
+                           nl=False)
+            elif self.output_format == 'ndjson':
+                self._echo(self._dumps(item))
+            else:
+                if self._csv is None:
+                    fields = []
+                    for i in items:
+                        fields.extend(k for k in i if k not in fields)
+                    self._buffer = StringIO()
+                    self._csv = csv.DictWriter(self._buffer, fields,
+                                               extrasaction='ignore',
+                                               lineterminator='\n')
+                    self._csv.writeheader()
+                self._csv.writerow(dict((k, self._cell(v))
+                                        for k, v in item.items()))
+                self._echo(self._buffer.getvalue(), nl=False)
+                self._buffer.seek(0)
+                self._buffer.truncate()
+            self._count += 1
+
+    def end(self):
+        if self.output_format == 'json':
+            self._echo('\n]' if self._count else ']')
+
+    def write(self, data):
+        if self.output_format == 'json':
+            self._echo(self._dumps(data, indent=4))
+        elif isinstance(data, _list):
+            self.write_items(data)
+        elif isinstance(data, (dict, LazyItem)):
+            self.write_items([data])
+        else:
+            self._echo(self._dumps(data))
 
 
 class CLIHandler(object):
 
+    # Operations the CLI has commands for that a handler doesn't support by
+    # default.  They are added for a --config handler unless its config
+    # lists its own supported_ops; a remote handler must support them
+    # itself.
+    ExtraOps = ['bulk_create', 'get_counter', 'stats']
+
     def __init__(self, profile_name, region_name,
-                 lambda_fn, config_file, debug=False):
+                 lambda_fn, config_file, debug=False, transport=None,
+                 output_format='json', stream=False, prefetch=0, url=None,
+                 hedging=None):
+        self.output_format = output_format
+        self.stream = stream
+        self.prefetch = prefetch
         self.lambda_fn = lambda_fn
         self.lambda_client = None
+        self.crud = None
         if lambda_fn:
             self.lambda_client = LambdaClient(
                 profile_name=profile_name, region_name=region_name,
-                func_name=lambda_fn, debug=debug)
+                func_name=lambda_fn, debug=debug, transport=transport,
+                hedging=hedging)
+        elif url:
+            self.lambda_client = HTTPClient(url, transport=transport,
+                                            hedging=hedging)
         if config_file:
             config = json.load(config_file)
+            if transport:
+                config['transport'] = dict(config.get('transport', {}),
+                                           **transport)
+            if 'supported_ops' not in config:
+                config['supported_ops'] = CRUD.SupportedOps + self.ExtraOps
             self.crud = CRUD(**config)
         self.debug = debug
 
+    def _handle_error(self, response):
+        click.echo(click.style(response.status, fg='red'))
+        click.echo(click.style(response.error_type, fg='red'))
+        click.echo(click.style(response.error_message, fg='red'))
+
     def _handle_response(self, response):
         if response.status == 'success':
-            click.echo(json.dumps(response.data, indent=4))
+            OutputWriter(self.output_format).write(response.data)
         else:
-            click.echo(click.style(response.status, fg='red'))
-            click.echo(click.style(response.error_type, fg='red'))
-            click.echo(click.style(response.error_message, fg='red'))
+            self._handle_error(response)
+
+    def invoke_paged(self, payload):
+        """
+        Invokes an operation that returns pages of items.  When streaming,
+        every page is requested in turn (up to ``prefetch`` pages ahead of
+        the one being written) and its items are written as soon as it
+        arrives; otherwise only the first page is written.
+        """
+        if not self.stream or not (self.lambda_client or self.crud):
+            return self.invoke(payload)
+        writer = OutputWriter(self.output_format)
+        writer.begin()
+        pager = Pager(lambda **params: self.invoke(params, raw=True),
+                      payload, self.prefetch)
+        with pager:
+            for response in pager.pages():
+                if response.status != 'success':
+                    writer.end()
+                    self._handle_error(response)
+                    return
+                writer.write_items(response.data)
+        writer.end()
 
     def _invoke_lambda(self, payload, raw):
         response = self.lambda_client.invoke(payload)
@@ -54,12 +190,12 @@ class CLIHandler(object):
         self._handle_response(response)
 
     def invoke(self, payload, raw=False):
-        if self.lambda_fn:
+        if self.lambda_client:
             return self._invoke_lambda(payload, raw)
         elif self.crud:
             return self._invoke_cruddy(payload, raw)
         else:
-            msg = 'You must specify either --lambda-fn or --config'
+            msg = 'You must specify --lambda-fn, --url or --config'
             click.echo(click.style(msg, fg='red'))
 
 pass_handler = click.make_pass_decorator(CLIHandler)
@@ -77,6 +213,9 @@ pass_handler = click.make_pass_decorator(CLIHandler)
 @click.option(
     '--lambda-fn',
     help='AWS Lambda controller name')
+@click.option(
+    '--url',
+    help='URL of a cruddy server')
 @click.option(
     '--config',
     help='cruddy config file', type=click.File('rb'))
@@ -85,9 +224,53 @@ pass_handler = click.make_pass_decorator(CLIHandler)
     default=False,
     help='Turn on debugging output'
 )
+@click.option(
+    '--pool-size', type=int,
+    help='maximum number of HTTP connections')
+@click.option(
+    '--connect-timeout', type=float,
+    help='seconds to wait for a connection')
+@click.option(
+    '--read-timeout', type=float,
+    help='seconds to wait for a response')
+@click.option(
+    '--tcp-keepalive/--no-tcp-keepalive',
+    default=None,
+    help='Turn on TCP keep-alive')
+@click.option(
+    '--retry-mode', type=click.Choice(['legacy', 'standard', 'adaptive']),
+    help='botocore retry mode')
+@click.option(
+    '--max-attempts', type=int,
+    help='maximum attempts per request')
+@click.option(
+    '--prewarm', type=int,
+    help='number of connections to open before the first request')
+@click.option(
+    '--format', 'output_format', default='json',
+    type=click.Choice(OutputWriter.Formats),
+    help='output format')
+@click.option(
+    '--stream/--no-stream',
+    default=False,
+    help='Write every page of list and search results as it arrives')
+@click.option(
+    '--prefetch', type=int, default=0,
+    help='number of pages to read ahead when streaming')
+@click.option(
+    '--hedge/--no-hedge',
+    default=False,
+    help='Hedge slow get, search, list and describe calls to --lambda-fn '
+         'or --url')
+@click.option(
+    '--deadline', type=float,
+    help='seconds to wait for --lambda-fn or --url to answer')
 @click.version_option('0.11.1')
 @click.pass_context
-def cli(ctx, profile, region, lambda_fn, config, debug):
+def cli(ctx, profile, region, lambda_fn, url, config, debug, pool_size,
+        connect_timeout, read_timeout, tcp_keepalive, retry_mode,
+        max_attempts, prewarm, output_format, stream, prefetch, hedge,
+        deadline):
     """
     cruddy is a CLI interface to the cruddy handler.  It can be used in one
     of two ways.
@@ -100,8 +283,30 @@ def cli(ctx, profile, region, lambda_fn, config, debug):
     name of an AWS Lambda function which contains a cruddy handler.  In this
     case the CLI will call the Lambda function to make the changes in the
     underlying DynamoDB table.
+
+    Finally, you can pass in a ``--url`` option which is the URL of a
+    ``cruddy serve`` server.
     """
-    ctx.obj = CLIHandler(profile, region, lambda_fn, config, debug)
+    transport = {'max_pool_connections': pool_size,
+                 'connect_timeout': connect_timeout,
+                 'read_timeout': read_timeout,
+                 'tcp_keepalive': tcp_keepalive,
+                 'retry_mode': retry_mode,
+                 'max_attempts': max_attempts,
+                 'prewarm': prewarm}
+    transport = dict((k, v) for k, v in transport.items() if v is not None)
+    hedging = None
+    if hedge or deadline:
+        hedging = {'deadline': deadline}
+        if not hedge:
+            hedging['operations'] = ()
+    try:
+        ctx.obj = CLIHandler(profile, region, lambda_fn, config, debug,
+                             transport, output_format, stream, prefetch,
+                             url, hedging)
+    except ValueError as e:
+        # e.g. a transport option the installed botocore doesn't support
+        raise click.UsageError(str(e))
 
 
 @cli.command()
@@ -112,12 +317,27 @@ def describe(handler):
     handler.invoke(data)
 
 
+@cli.command()
+@click.option('--top', type=int, help='number of hot keys to report')
+@click.option(
+    '--reset/--no-reset',
+    default=False,
+    help='Clear the profile once it has been reported')
+@pass_handler
+def stats(handler, top, reset):
+    """Report the handler's statistics and access profile"""
+    data = {'operation': 'stats', 'reset': reset}
+    if top:
+        data['top'] = top
+    handler.invoke(data)
+
+
 @cli.command()
 @pass_handler
 def list(handler):
     """List the items"""
     data = {'operation': 'list'}
-    handler.invoke(data)
+    handler.invoke_paged(data)
 
 
 @cli.command()
@@ -125,13 +345,18 @@ def list(handler):
     '--decrypt/--no-decrypt',
     default=False,
     help='Decrypt any encrypted attributes')
+@click.option(
+    '--consistency', type=click.Choice(['eventual', 'strong', 'session']),
+    help='read consistency (defaults to the handler\'s)')
 @click.argument('item_id', nargs=1)
 @pass_handler
-def get(handler, item_id, decrypt):
+def get(handler, item_id, decrypt, consistency):
     """Get an item"""
     data = {'operation': 'get',
             'decrypt': decrypt,
             'id': item_id}
+    if consistency:
+        data['consistency'] = consistency
     handler.invoke(data)
 
 
@@ -164,7 +389,7 @@ def search(handler, query):
     """Perform a search"""
     data = {'operation': 'search',
             'query': query}
-    handler.invoke(data)
+    handler.invoke_paged(data)
 
 
 @cli.command()
@@ -181,6 +406,18 @@ def increment(handler, increment, item_id, counter_name):
     handler.invoke(data)
 
 
+@cli.command()
+@click.argument('item_id', nargs=1)
+@click.argument('counter_name', nargs=1)
+@pass_handler
+def get_counter(handler, item_id, counter_name):
+    """Get the value of a (possibly sharded) counter"""
+    data = {'operation': 'get_counter',
+            'id': item_id,
+            'counter_name': counter_name}
+    handler.invoke(data)
+
+
 @cli.command()
 @click.argument('item_document', type=click.File('rb'))
 @pass_handler
@@ -196,16 +433,360 @@ def create(handler, item_document):
     '--encrypt/--no-encrypt',
     default=True,
     help='Encrypt any encrypted attributes')
+@click.option(
+    '--partial/--no-partial',
+    default=False,
+    help='Only write the attributes in the document')
 @click.argument('item_document', type=click.File('rb'))
 @pass_handler
-def update(handler, item_document):
+def update(handler, item_document, encrypt, partial):
     """Update an item from a JSON document"""
     data = {'operation': 'update',
             'encrypt': encrypt,
+            'partial': partial,
             'item': json.load(item_document)}
     handler.invoke(data)
 
 
+def _open_source(source):
+    # Returns a binary stream for a file name or '-' (stdin), transparently
+    # decompressing gzip input
+    if source == '-':
+        fp = click.get_binary_stream('stdin')
+    else:
+        fp = open(source, 'rb')
+    fp = io.BufferedReader(fp) if not hasattr(fp, 'peek') else fp
+    if fp.peek(2)[:2] == b'\x1f\x8b':
+        fp = gzip.GzipFile(fileobj=fp, mode='rb')
+    return fp
+
+
+class ImportProgress(object):
+
+    def __init__(self, reject_file, show=True):
+        self.reject_file = reject_file
+        self.show = show
+        self.lock = threading.Lock()
+        self.read = 0
+        self.rejected = 0
+        self.start = time.time()
+        self.last_report = 0
+
+    def reject(self, tag, error_type, error_message):
+        line_number, line = tag
+        with self.lock:
+            self.rejected += 1
+            if self.reject_file:
+                record = {'line': line_number,
+                          'error_type': error_type,
+                          'error_message': error_message,
+                          'record': line}
+                self.reject_file.write(json.dumps(record) + '\n')
+
+    def report(self, written, final=False):
+        now = time.time()
+        if not self.show or (not final and now - self.last_report < 1):
+            return
+        self.last_report = now
+        elapsed = max(now - self.start, 1e-6)
+        click.echo('\r{} read, {} written, {} rejected, {:.0f} items/s'.format(
+            self.read, written, self.rejected, written / elapsed),
+            err=True, nl=final)
+
+
+def _import_records(fp, progress):
+    for line_number, line in enumerate(fp, 1):
+        line = line.decode('utf-8').strip()
+        if not line:
+            continue
+        progress.read += 1
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            progress.reject((line_number, line), 'InvalidJSON', str(e))
+            continue
+        if not isinstance(item, dict):
+            progress.reject((line_number, line), 'InvalidItem',
+                            'Each line must contain a JSON object')
+            continue
+        yield (line_number, line), item
+
+
+def _import_direct(crud, records, progress, workers, batch_size):
+    writer = BulkWriter(crud, workers=workers, batch_size=batch_size,
+                        on_error=progress.reject)
+    for tag, item in records:
+        response = crud._new_response()
+        if crud._prepare_create(item, response):
+            writer.put(item, tag)
+        else:
+            progress.reject(tag, response.error_type, response.error_message)
+        progress.report(writer.stats()['written'])
+    writer.close()
+    return writer.stats()['written']
+
+
+def _import_remote(handler, records, progress, workers, batch_size):
+    # Send chunks of records to the remote handler's bulk_create operation,
+    # keeping a bounded number of requests in flight
+    written = [0]
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    def send(chunk):
+        try:
+            payload = {'operation': 'bulk_create',
+                       'items': [item for _, item in chunk]}
+            try:
+                response = handler.invoke(payload, raw=True)
+            except Exception as e:
+                # The whole chunk failed, e.g. the call itself errored
+                for tag, _ in chunk:
+                    progress.reject(tag, type(e).__name__, str(e))
+                return
+            if not response or response.status != 'success':
+                for tag, _ in chunk:
+                    progress.reject(tag, getattr(response, 'error_type',
+                                                 None),
+                                    getattr(response, 'error_message', None))
+                return
+            with progress.lock:
+                written[0] += response.data['created']
+            for failure in response.data['failed']:
+                progress.reject(chunk[failure['index']][0],
+                                failure['error_type'],
+                                failure['error_message'])
+        finally:
+            slots.release()
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= batch_size:
+            slots.acquire()
+            executor.submit(send, chunk)
+            chunk = []
+        progress.report(written[0])
+    if chunk:
+        slots.acquire()
+        executor.submit(send, chunk)
+    executor.shutdown(wait=True)
+    return written[0]
+
+
+@cli.command(name='import')
+@click.option('--workers', default=4, help='number of concurrent writers')
+@click.option('--batch-size', default=25, help='items per batch write')
+@click.option('--reject-file', type=click.File('w', lazy=False),
+              default=None,
+              help='write records that could not be imported here')
+@click.option('--progress/--no-progress', default=True,
+              help='show progress and rate on stderr')
+@click.argument('source', nargs=1)
+@pass_handler
+def import_items(handler, source, workers, batch_size, reject_file,
+                 progress):
+    """Create items from a newline-delimited JSON file (or - for stdin)"""
+    tracker = ImportProgress(reject_file, progress)
+    fp = _open_source(source)
+    try:
+        records = _import_records(fp, tracker)
+        if handler.lambda_client:
+            written = _import_remote(handler, records, tracker,
+                                     workers, batch_size)
+        else:
+            written = _import_direct(handler.crud, records, tracker,
+                                     workers, batch_size)
+    finally:
+        fp.close()
+    tracker.report(written, final=True)
+
+
+@cli.command()
+@click.option('--segments', default=4,
+              help='number of scan segments read in parallel')
+@click.option('--output', '-o', default='-',
+              help='file to write the items to (default stdout)')
+@click.option('--gzip/--no-gzip', 'compress', default=False,
+              help='gzip the output')
+@click.option('--split/--no-split', default=False,
+              help='write one output file per segment')
+@click.option('--checkpoint', default=None,
+              help='save progress here and resume from it if it exists')
+@click.option('--attributes', default=None,
+              help='comma-separated list of attributes to export')
+@click.option('--page-size', default=None, type=int,
+              help='maximum number of items read per request')
+@pass_handler
+def export(handler, segments, output, compress, split, checkpoint,
+           attributes, page_size):
+    """Export all items as newline-delimited JSON"""
+    if handler.lambda_client:
+        def list_fn(**params):
+            params['operation'] = 'list'
+            return handler.invoke(params, raw=True)
+    elif handler.crud:
+        list_fn = handler.crud.list
+    else:
+        raise click.UsageError('You must specify --lambda-fn, --url or '
+                               '--config')
+    if split and output == '-':
+        raise click.UsageError('--split requires an --output file')
+    if attributes:
+        attributes = [a.strip() for a in attributes.split(',')]
+    outputs = {}
+
+    def open_segment(segment):
+        path = segment_path(output, segment) if split else output
+        if path not in outputs:
+            if path == '-':
+                fp = click.get_binary_stream('stdout')
+                if compress:
+                    fp = gzip.GzipFile(fileobj=fp, mode='wb')
+            else:
+                fp = open_output(path, compress, exporter.resumed)
+            outputs[path] = fp
+        return outputs[path]
+
+    exporter = Exporter(list_fn, open_segment, segments=segments,
+                        checkpoint=checkpoint, attributes=attributes,
+                        page_size=page_size)
+    # Open every file up front so the workers never race to create them
+    for segment in range(segments):
+        open_segment(segment)
+    try:
+        count = exporter.run()
+    except IOError as e:
+        raise click.ClickException(str(e))
+    finally:
+        for path, fp in outputs.items():
+            if path == '-' and not compress:
+                fp.flush()
+            else:
+                fp.close()
+    click.echo('{} items exported'.format(count), err=True)
+
+
+def _parse_payload(line):
+    # A payload is either a JSON object containing an ``operation`` or an
+    # operation name optionally followed by a JSON object of its arguments,
+    # e.g. ``get {"id": "foo"}``
+    line = line.strip()
+    if line.startswith('{'):
+        payload = json.loads(line)
+        if not isinstance(payload, dict):
+            raise ValueError('Payload must be a JSON object')
+        return payload
+    operation, _, args = line.partition(' ')
+    payload = json.loads(args) if args.strip() else {}
+    if not isinstance(payload, dict):
+        raise ValueError('Arguments must be a JSON object')
+    payload['operation'] = operation
+    return payload
+
+
+def _run_payload(handler, line):
+    try:
+        payload = _parse_payload(line)
+    except ValueError as e:
+        return {'status': 'error', 'error_type': 'InvalidPayload',
+                'error_message': str(e)}
+    try:
+        response = handler.invoke(payload, raw=True)
+    except Exception as e:
+        return {'status': 'error', 'error_type': type(e).__name__,
+                'error_message': str(e)}
+    if not response:
+        return {'status': 'error', 'error_type': 'InvokeFailed',
+                'error_message': 'The handler did not return a response'}
+    return response.flatten()
+
+
+def _run_stream(handler, lines, workers):
+    # Runs payloads on up to ``workers`` threads, yielding results in the
+    # order the payloads were read while keeping a bounded number in flight
+    if workers <= 1:
+        for line in lines:
+            yield _run_payload(handler, line)
+        return
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = collections.deque()
+    try:
+        for line in lines:
+            pending.append(executor.submit(_run_payload, handler, line))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True)
+
+
+def _payload_lines(fp):
+    for line in fp:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if line.strip() and not line.lstrip().startswith('#'):
+            yield line
+
+
+@cli.command()
+@click.option('--workers', default=1,
+              help='number of payloads to run concurrently')
+@click.argument('source', nargs=1)
+@pass_handler
+def run(handler, source, workers):
+    """Run a stream of operation payloads (or - for stdin)"""
+    fp = _open_source(source)
+    try:
+        for result in _run_stream(handler, _payload_lines(fp), workers):
+            click.echo(json.dumps(result, default=str))
+    finally:
+        fp.close()
+
+
+@cli.command()
+@click.option('--host', default='127.0.0.1', help='address to listen on')
+@click.option('--port', default=8080, help='port to listen on')
+@click.option('--workers', default=8,
+              help='number of connections served concurrently')
+@click.option('--batch/--no-batch', default=False,
+              help='Batch the writes and reads in a list of payloads')
+@click.option('--keep-alive', default=5.0,
+              help='seconds to keep an idle connection open')
+@pass_handler
+def serve(handler, host, port, workers, batch, keep_alive):
+    """Serve the handler in --config over HTTP"""
+    if handler.crud is None:
+        raise click.UsageError('serve requires --config')
+    click.echo('Serving {} on http://{}:{}'.format(
+        handler.crud.table_name, host, port), err=True)
+    serve_handler(handler.crud, host, port, workers=workers, batch=batch,
+                  keep_alive=keep_alive)
+
+
+@cli.command()
+@pass_handler
+def shell(handler):
+    """Run operations interactively against one handler"""
+    stdin = click.get_text_stream('stdin')
+    interactive = stdin.isatty()
+    if interactive:
+        click.echo('Enter an operation, e.g. get {"id": "foo"}, '
+                   'or quit to exit', err=True)
+    while True:
+        if interactive:
+            click.echo('cruddy> ', nl=False, err=True)
+        line = stdin.readline()
+        if not line or line.strip() in ('quit', 'exit'):
+            break
+        if not line.strip():
+            continue
+        result = _run_payload(handler, line)
+        click.echo(json.dumps(result, indent=4 if interactive else None,
+                              default=str))
+
+
 def _build_signature_line(method_name, argspec):
     arg_len = len(argspec['args'])
     if argspec['defaults']:
@@ -0,0 +1,183 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.vendored.six.moves import BaseHTTPServer, socketserver
+
+from cruddy.events import EventBatchHandler
+
+LOG = logging.getLogger(__name__)
+
+
+def _error(error_type, error_message):
+    return {'status': 'error', 'error_type': error_type,
+            'error_message': error_message}
+
+
+class CruddyRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Handles the requests on one connection.  ``POST /`` runs the JSON
+    operation payload (or list of payloads) in the request body and
+    responds with the flattened response(s), just as the Lambda handler
+    would.  ``GET /health`` responds with a success status so load
+    balancers can check the server.
+
+    Connections are kept alive (HTTP/1.1) until the client closes them or
+    they have been idle for the server's ``keep_alive`` seconds.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'cruddy'
+
+    def setup(self):
+        # Read by StreamRequestHandler.setup to set the socket timeout
+        self.timeout = self.server.keep_alive
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+
+    def log_message(self, format, *args):
+        LOG.debug('%s - %s', self.address_string(), format % args)
+
+    def _send(self, code, data):
+        body = json.dumps(data, default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.split('?')[0] == '/health':
+            self._send(200, {'status': 'success'})
+        else:
+            self._send(404, _error('NotFound', self.path))
+
+    def do_POST(self):
+        if self.path.split('?')[0] != '/':
+            self._send(404, _error('NotFound', self.path))
+            return
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self.close_connection = True
+            self._send(411, _error('InvalidPayload',
+                                   'Content-Length is required'))
+            return
+        body = self.rfile.read(int(length))
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            self._send(400, _error('InvalidPayload', str(e)))
+            return
+        if not isinstance(payload, (dict, list)):
+            self._send(400, _error('InvalidPayload',
+                                   'Payload must be an object or a list'))
+            return
+        try:
+            result = self.server.run(payload)
+        except Exception as e:
+            LOG.exception('Could not run payload')
+            self._send(500, _error(type(e).__name__, str(e)))
+            return
+        self._send(200, result)
+
+
+class CruddyHTTPServer(socketserver.TCPServer):
+    """
+    Serves a CRUD handler (or a CRUDRegistry) over HTTP.
+
+    * server_address - the ``(host, port)`` to listen on
+    * crud - the CRUD handler or CRUDRegistry that runs the operations
+    * workers - the number of worker threads.  Each connection is served
+      by one worker for as long as it is open, so this is also the number
+      of connections served at once; others wait for a free worker.
+    * batch - if True, a list of payloads is run with an
+      EventBatchHandler, so its writes and reads are batched.  Otherwise
+      each payload in the list is run in turn.
+    * keep_alive - seconds an idle connection is kept open
+    """
+
+    allow_reuse_address = True
+
+    def __init__(self, server_address, crud, workers=8, batch=False,
+                 keep_alive=5):
+        self.crud = crud
+        self.workers = workers
+        self.keep_alive = keep_alive
+        self.batch_handler = None
+        if batch:
+            self.batch_handler = EventBatchHandler(crud)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        socketserver.TCPServer.__init__(self, server_address,
+                                        CruddyRequestHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def run(self, payload):
+        """
+        Runs an operation payload or a list of them and returns the
+        flattened response (or list of responses).
+        """
+        if isinstance(payload, list):
+            if self.batch_handler is not None:
+                return self.batch_handler.handle(payload)
+            return [self._run_one(p) for p in payload]
+        return self._run_one(payload)
+
+    def _run_one(self, payload):
+        if not isinstance(payload, dict):
+            return _error('InvalidPayload', 'Payload must be an object')
+        return self.crud.handler(**payload).flatten()
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        """
+        Stops listening and waits for the connections being served to
+        finish.
+        """
+        socketserver.TCPServer.server_close(self)
+        self._executor.shutdown(wait=True)
+
+
+def serve(crud, host='127.0.0.1', port=8080, workers=8, batch=False,
+          keep_alive=5):
+    """
+    Serves ``crud`` until interrupted, then closes the handler so anything
+    it has buffered is written.
+    """
+    server = CruddyHTTPServer((host, port), crud, workers=workers,
+                              batch=batch, keep_alive=keep_alive)
+    LOG.info('serving %s', server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        crud.close()
@@ -0,0 +1,64 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import logging
+import threading
+import weakref
+
+LOG = logging.getLogger(__name__)
+
+# Everything that is open is referenced weakly, so an idle buffer is freed
+# along with its handler.  A buffer holding unwritten data is also
+# referenced strongly (pinned) until the data is written, so it can't be
+# lost by the buffer being garbage collected first.
+_lock = threading.Lock()
+_open = weakref.WeakSet()
+_pinned = set()
+
+
+def register(obj):
+    """
+    Closes ``obj`` when the interpreter exits, unless it has been freed or
+    unregistered by then.
+    """
+    with _lock:
+        _open.add(obj)
+
+
+def unregister(obj):
+    with _lock:
+        _open.discard(obj)
+        _pinned.discard(obj)
+
+
+def pin(obj):
+    with _lock:
+        _pinned.add(obj)
+
+
+def unpin(obj):
+    with _lock:
+        _pinned.discard(obj)
+
+
+@atexit.register
+def close_all():
+    with _lock:
+        objs = set(_open) | _pinned
+    for obj in objs:
+        try:
+            obj.close()
+        except Exception:
+            LOG.exception('could not close %r at exit', obj)
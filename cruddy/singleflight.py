@@ -0,0 +1,84 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import threading
+
+from botocore.vendored.six import reraise
+
+
+class _Flight(object):
+
+    __slots__ = ('done', 'result', 'exc_info', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent identical calls.  The first caller for a key makes
+    the call and every caller that arrives with the same key while it is in
+    flight waits for it and gets the same result (or exception) rather than
+    making its own call.  Nothing is kept once the call completes, so this
+    is not a cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {'calls': 0, 'shared': 0}
+
+    def do(self, key, fn):
+        """
+        Returns ``(result, shared)`` where ``result`` is the result of
+        ``fn()``, called by this caller or by a concurrent one with the same
+        ``key``, and ``shared`` is True if more than one caller is getting
+        the result (so it must not be modified).
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats['calls'] += 1
+            else:
+                flight.waiters += 1
+                self._stats['shared'] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.exc_info is not None:
+                reraise(*flight.exc_info)
+            return flight.result, True
+        try:
+            flight.result = fn()
+        except BaseException:
+            flight.exc_info = sys.exc_info()
+        finally:
+            with self._lock:
+                del self._flights[key]
+                shared = flight.waiters > 0
+            flight.done.set()
+        if flight.exc_info is not None:
+            reraise(*flight.exc_info)
+        return flight.result, shared
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._flights)
+        return stats
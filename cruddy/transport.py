@@ -0,0 +1,113 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+import botocore
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+LOG = logging.getLogger(__name__)
+
+# The transport settings that are passed straight through to botocore
+ConfigOptions = ('max_pool_connections', 'connect_timeout', 'read_timeout',
+                 'tcp_keepalive')
+
+# The remaining settings
+TransportOptions = ConfigOptions + ('retry_mode', 'max_attempts', 'prewarm')
+
+# The botocore versions that first support some of the settings
+RequiredVersions = {'retry_mode': (1, 15, 0), 'tcp_keepalive': (1, 27, 84)}
+
+
+def _version(version):
+    parts = []
+    for part in version.split('.')[:3]:
+        if not part.isdigit():
+            break
+        parts.append(int(part))
+    return tuple(parts)
+
+
+def get_config(transport):
+    """
+    Returns a ``botocore.config.Config`` built from the ``transport`` dict,
+    or None if ``transport`` is empty.  The dict may contain:
+
+    * max_pool_connections - size of the HTTP connection pool (default 10)
+    * connect_timeout - seconds to wait for a connection to be established
+    * read_timeout - seconds to wait for a response
+    * tcp_keepalive - if True, enable TCP keep-alive on connections
+    * retry_mode - ``legacy``, ``standard`` or ``adaptive``
+    * max_attempts - the maximum number of attempts per request
+    * prewarm - the number of connections to open when the client is created
+      (used by the caller, see ``prewarm``)
+
+    Raises ValueError for an unknown setting, or for ``retry_mode`` or
+    ``tcp_keepalive`` if the installed botocore is too old to support them.
+    """
+    if not transport:
+        return None
+    unknown = set(transport) - set(TransportOptions)
+    if unknown:
+        raise ValueError('Unknown transport options: {}'.format(
+            ', '.join(sorted(unknown))))
+    installed = _version(botocore.__version__)
+    for option, required in sorted(RequiredVersions.items()):
+        if transport.get(option) and installed < required:
+            raise ValueError(
+                'The {} transport option requires botocore {} or later, '
+                'not {}'.format(option, '.'.join(str(n) for n in required),
+                                botocore.__version__))
+    params = dict((k, transport[k]) for k in ConfigOptions
+                  if transport.get(k) is not None)
+    retries = {}
+    if transport.get('retry_mode'):
+        retries['mode'] = transport['retry_mode']
+    if transport.get('max_attempts'):
+        retries['max_attempts'] = transport['max_attempts']
+    if retries:
+        params['retries'] = retries
+    return Config(**params)
+
+
+def prewarm(call, connections):
+    """
+    Opens up to ``connections`` connections to a service by making that many
+    concurrent calls to ``call``, which should be a cheap request.  The
+    result of each call (including any error returned by the service) is
+    ignored: the point is to complete the TCP and TLS handshakes so the
+    connections are waiting in the pool when the first real request is
+    made.  Returns the number of calls that completed.
+    """
+    if not connections or connections < 1:
+        return 0
+
+    def warm(n):
+        try:
+            call()
+        except ClientError:
+            pass
+        except BotoCoreError as e:
+            LOG.debug('prewarm failed: %s', e)
+            return 0
+        return 1
+
+    executor = ThreadPoolExecutor(max_workers=connections)
+    try:
+        return sum(executor.map(warm, range(connections)))
+    finally:
+        executor.shutdown(wait=True)
@@ -0,0 +1,228 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import logging
+import threading
+import time
+import weakref
+
+from concurrent.futures import Future
+
+from cruddy import shutdown
+from cruddy.bulk import BulkWriter
+from cruddy.exceptions import CruddyQueueClosedError, CruddyWriteError
+
+LOG = logging.getLogger(__name__)
+
+
+def _write_loop(ref, cond, queue, stopped, batch_size, interval):
+    while True:
+        with cond:
+            if len(queue) < batch_size and not stopped.is_set():
+                cond.wait(interval)
+        write_queue = ref()
+        if write_queue is None or stopped.is_set():
+            return
+        write_queue.flush()
+        del write_queue
+
+
+class WriteBehindQueue(object):
+    """
+    Queues items that are ready to be written (prototype applied, attributes
+    encrypted) and writes them from a background thread using batched
+    writes, retrying throttled requests.  Writes to the same key are applied
+    in the order they were queued.  Anything that writes a key without the
+    queue must call ``flush_keys`` first, so it isn't overwritten by an
+    earlier queued write.
+
+    * crud - the CRUD handler whose backend is written to
+    * max_pending - the maximum number of queued items; ``submit`` blocks
+      while the queue is full
+    * interval - write queued items at least this often, in seconds.  A
+      flush also starts as soon as ``batch_size`` items are queued.
+    * workers - number of concurrent batch writers
+    * batch_size - number of items per batch write (at most 25)
+    * max_retries - number of times a batch is retried before its items fail
+    * on_error - called as ``on_error(item, error_type, error_message)`` for
+      every item that could not be written
+    """
+
+    def __init__(self, crud, max_pending=1000, interval=0.1, workers=2,
+                 batch_size=25, max_retries=8, on_error=None):
+        self.max_pending = max_pending
+        self.interval = interval
+        self.batch_size = batch_size
+        self.on_error = on_error
+        self._hash_key = crud.hash_key
+        self._writer = BulkWriter(crud, workers=workers,
+                                  batch_size=batch_size,
+                                  max_retries=max_retries,
+                                  on_error=self._failed,
+                                  on_success=self._written)
+        self._queue = collections.deque()
+        # The number of queued or in-flight writes of each key
+        self._keys = collections.Counter()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._stats = {'submitted': 0, 'written': 0, 'failed': 0,
+                       'flushes': 0, 'max_depth': 0, 'last_flush': None,
+                       'last_flush_latency': None, 'write_latency': 0.0}
+        shutdown.register(self)
+
+    def submit(self, item):
+        """
+        Queues ``item`` to be written and returns a ``Future`` which
+        resolves to the item once it has been written, or raises a
+        ``CruddyWriteError`` if it could not be.  Raises
+        ``CruddyQueueClosedError`` if the queue has been closed.
+        """
+        future = Future()
+        with self._cond:
+            while True:
+                # Checked after every wait too, in case the queue was
+                # closed while this waited for room
+                if self._stopped.is_set():
+                    raise CruddyQueueClosedError(
+                        'The write-behind queue is closed')
+                if len(self._queue) < self.max_pending:
+                    break
+                self._cond.notify_all()
+                self._cond.wait()
+            if not self._queue:
+                shutdown.pin(self)
+            self._queue.append((item, future, time.time()))
+            self._keys[item.get(self._hash_key)] += 1
+            self._stats['submitted'] += 1
+            depth = len(self._queue)
+            if depth > self._stats['max_depth']:
+                self._stats['max_depth'] = depth
+            if depth >= self.batch_size:
+                self._cond.notify_all()
+            if self._thread is None:
+                self._start()
+        return future
+
+    def _start(self):
+        # The thread only holds a weak reference, so it doesn't keep the
+        # queue alive
+        self._thread = threading.Thread(
+            target=_write_loop, args=(weakref.ref(self), self._cond,
+                                      self._queue, self._stopped,
+                                      self.batch_size, self.interval),
+            name='cruddy-write-behind')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _done(self, item):
+        # Called with self._cond held
+        key = item.get(self._hash_key)
+        self._keys[key] -= 1
+        if not self._keys[key]:
+            del self._keys[key]
+
+    def _written(self, tag):
+        item, future, queued_at = tag
+        latency = time.time() - queued_at
+        with self._cond:
+            self._stats['written'] += 1
+            self._stats['write_latency'] += latency
+            self._done(item)
+        future.set_result(item)
+
+    def _failed(self, tag, error_type, error_message):
+        item, future, queued_at = tag
+        LOG.error('write-behind of %s failed: %s',
+                  item.get(self._hash_key), error_message)
+        with self._cond:
+            self._stats['failed'] += 1
+            self._done(item)
+        future.set_exception(CruddyWriteError(error_type, error_message))
+        if self.on_error:
+            self.on_error(item, error_type, error_message)
+
+    def flush(self):
+        """
+        Writes everything that is queued and waits until it has been written
+        (or has failed).  Returns the number of items flushed.
+        """
+        with self._flush_lock:
+            with self._cond:
+                entries = list(self._queue)
+                self._queue.clear()
+                self._cond.notify_all()
+                shutdown.unpin(self)
+            if not entries:
+                return 0
+            start = time.time()
+            keys = set()
+            for entry in entries:
+                key = entry[0].get(self._hash_key)
+                if key in keys:
+                    # Let the earlier write of this key land first
+                    self._writer.flush()
+                    keys = set()
+                keys.add(key)
+                self._writer.put(entry[0], entry)
+            self._writer.flush()
+            now = time.time()
+            with self._cond:
+                self._stats['flushes'] += 1
+                self._stats['last_flush'] = now
+                self._stats['last_flush_latency'] = now - start
+        return len(entries)
+
+    def flush_keys(self, keys):
+        """
+        Waits until every queued write of any of ``keys`` has been written
+        (or has failed), flushing the queue if there are any.
+        """
+        with self._cond:
+            pending = any(key in self._keys for key in keys)
+        if pending:
+            self.flush()
+
+    def close(self):
+        """
+        Stops the background thread and writes out anything still queued.
+        """
+        with self._cond:
+            self._stopped.set()
+            self._cond.notify_all()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+        self._writer.close()
+        shutdown.unregister(self)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['depth'] = len(self._queue)
+            if self._queue:
+                stats['oldest_pending_age'] = time.time() - self._queue[0][2]
+            else:
+                stats['oldest_pending_age'] = None
+        written = stats.pop('write_latency')
+        if stats['written']:
+            stats['average_write_latency'] = written / stats['written']
+        else:
+            stats['average_write_latency'] = None
+        stats['max_pending'] = self.max_pending
+        stats['durability_window'] = self.interval
+        return stats
@@ -7,10 +7,18 @@ LOG = logging.getLogger()
 LOG.setLevel(logging.INFO)
 
 config = json.load(open('config.json'))
-crud = cruddy.CRUD(**config)
+if 'tables' in config:
+    # Serve several tables, selected by the ``table`` in each event
+    crud = cruddy.CRUDRegistry(**config)
+else:
+    crud = cruddy.CRUD(**config)
+# SQS, Kinesis and lists of operations are run as batches
+batch_handler = cruddy.EventBatchHandler(crud)
 
 
 def handler(event, context):
     LOG.info(event)
+    if isinstance(event, list) or 'Records' in event:
+        return batch_handler(event, context)
     response = crud.handler(**event)
     return response.flatten()
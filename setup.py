@@ -6,6 +6,7 @@ from setuptools import setup, find_packages
 requires = [
     'boto3',
     'click',
+    'futures; python_version < "3"',
 ]
 
 
@@ -17,7 +18,7 @@ setup(
     author='Mitch Garnaat',
     author_email='mitch@cloudnative.io',
     url='https://github.com/cloudnative/cruddy',
-    packages=find_packages(exclude=['tests*']),
+    packages=find_packages(exclude=['tests*', 'benchmarks*']),
     package_data={'cruddy': ['_version']},
     entry_points="""
         [console_scripts]
@@ -0,0 +1,138 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+from botocore.exceptions import ClientError
+
+import cruddy
+from cruddy.bulk import BulkWriter
+from cruddy.middleware import StatsMiddleware
+from cruddy.response import CRUDResponse
+from cruddy.scripts.cli import ImportProgress, _import_remote, cli
+
+
+class TestBulkWrites(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = StatsMiddleware()
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend='memory',
+            middleware=[self.stats],
+            prototype={'id': '<on-create:uuid>', 'name': ''},
+            supported_ops=cruddy.CRUD.SupportedOps + ['bulk_create'])
+
+    def test_bulk_create(self):
+        items = [{'name': 'item-{}'.format(i)} for i in range(60)]
+        items.append({'name': 5})
+        r = self.crud.bulk_create(items)
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(r.data['created'], 60)
+        self.assertEqual(len(r.data['failed']), 1)
+        self.assertEqual(r.data['failed'][0]['index'], 60)
+        self.assertEqual(self.stats.stats['batch_write_item']['count'], 3)
+        self.assertEqual(len(self.crud.list().data), 60)
+
+    def test_writer_duplicate_keys(self):
+        writer = BulkWriter(self.crud, workers=2)
+        writer.put({'id': 'a', 'name': 'first'})
+        writer.put({'id': 'a', 'name': 'second'})
+        writer.close()
+        self.assertEqual(writer.stats()['written'], 2)
+        self.assertEqual(writer.stats()['batches'], 2)
+        self.assertEqual(self.crud.get('a').data['name'], 'second')
+
+    def test_writer_reports_errors(self):
+        errors = []
+        writer = BulkWriter(self.crud, on_error=lambda *args:
+                            errors.append(args))
+        writer.put({'id': 'a', 'price': 1.5}, 'tag-a')
+        writer.close()
+        self.assertEqual(writer.stats()['failed'], 1)
+        self.assertEqual(errors[0][0], 'tag-a')
+
+
+class TestImportCommand(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = os.path.join(self.tmpdir, 'config.json')
+        with open(self.config, 'w') as fp:
+            json.dump({'table_name': 'test-cruddy',
+                       'backend': 'memory',
+                       'prototype': {'id': '<on-create:uuid>'}}, fp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _import(self, path):
+        rejects = os.path.join(self.tmpdir, 'rejects.json')
+        runner = CliRunner()
+        result = runner.invoke(cli, ['--config', self.config, 'import',
+                                     '--reject-file', rejects, path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(rejects) as fp:
+            return result.output, [json.loads(line) for line in fp]
+
+    def test_import(self):
+        path = os.path.join(self.tmpdir, 'items.json')
+        with open(path, 'w') as fp:
+            fp.write('{"name": "a"}\n{"name": "b"}\n\nnot json\n[1]\n')
+        output, rejects = self._import(path)
+        self.assertIn('4 read, 2 written, 2 rejected', output)
+        self.assertEqual([r['line'] for r in rejects], [4, 5])
+        self.assertEqual(rejects[0]['error_type'], 'InvalidJSON')
+        self.assertEqual(rejects[0]['record'], 'not json')
+
+    def test_import_gzip(self):
+        path = os.path.join(self.tmpdir, 'items.json.gz')
+        with gzip.open(path, 'wb') as fp:
+            for i in range(30):
+                fp.write(json.dumps({'n': i}).encode('utf-8') + b'\n')
+        output, rejects = self._import(path)
+        self.assertIn('30 read, 30 written, 0 rejected', output)
+        self.assertEqual(rejects, [])
+
+    def test_remote_import_rejects_failed_calls(self):
+        calls = []
+
+        class Handler(object):
+            def invoke(self, payload, raw=False):
+                calls.append(payload)
+                if len(calls) == 2:
+                    raise ClientError({'Error': {'Code': 'Throttled'}},
+                                      'Invoke')
+                response = CRUDResponse()
+                response.data = {'created': len(payload['items']),
+                                 'failed': []}
+                return response
+
+        rejects = os.path.join(self.tmpdir, 'rejects.json')
+        with open(rejects, 'w') as fp:
+            progress = ImportProgress(fp, show=False)
+            records = [((i + 1, '{}'), {'n': i}) for i in range(6)]
+            written = _import_remote(Handler(), iter(records), progress,
+                                     workers=1, batch_size=2)
+        self.assertEqual(written, 4)
+        self.assertEqual(progress.rejected, 2)
+        with open(rejects) as fp:
+            rejected = [json.loads(line) for line in fp]
+        self.assertEqual([r['line'] for r in rejected], [3, 4])
+        self.assertEqual(rejected[0]['error_type'], 'ClientError')
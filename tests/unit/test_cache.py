@@ -0,0 +1,110 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import time
+import unittest
+
+import cruddy
+from cruddy.cache import SearchCache
+from cruddy.middleware import StatsMiddleware
+
+
+class TestSearchCache(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = StatsMiddleware()
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend={'name': 'memory',
+                     'indexes': {'status': 'status-index',
+                                 'owner': 'owner-index'}},
+            middleware=[self.stats],
+            search_cache={'ttl': 60, 'max_entries': 10})
+        for i in range(6):
+            self.crud.create({'id': str(i), 'n': i, 'owner': 'bob',
+                              'status': 'active' if i % 2 else 'done'})
+
+    def tearDown(self):
+        self.crud.close()
+
+    def _queries(self):
+        return self.stats.stats.get('query', {}).get('count', 0)
+
+    def test_hit(self):
+        r = self.crud.search('status=active')
+        self.assertFalse(r.metadata['cached'])
+        r = self.crud.search('status=active')
+        self.assertEqual(r.metadata, {'cached': True})
+        self.assertEqual(len(r.data), 3)
+        self.assertEqual(self._queries(), 1)
+        # results are copies
+        r.data[0]['n'] = 100
+        r = self.crud.search('status=active')
+        self.assertNotEqual(r.data[0]['n'], 100)
+        self.crud.search('status=active', projection_expression='id')
+        self.assertEqual(self._queries(), 2)
+
+    def test_selective_invalidation(self):
+        self.crud.search('status=active')
+        self.crud.search('status=done')
+        self.crud.update({'id': '1', 'n': 10, 'owner': 'bob',
+                          'status': 'active'})
+        self.assertFalse(self.crud.search('status=active').metadata[
+            'cached'])
+        self.assertTrue(self.crud.search('status=done').metadata['cached'])
+        self.assertEqual(self._queries(), 3)
+
+    def test_old_value_invalidated(self):
+        self.crud.search('status=active')
+        self.crud.search('status=done')
+        self.crud.update({'id': '1', 'n': 1, 'owner': 'bob',
+                          'status': 'done'})
+        self.assertEqual(len(self.crud.search('status=active').data), 2)
+        self.assertEqual(len(self.crud.search('status=done').data), 4)
+
+    def test_partial_update_and_delete(self):
+        self.crud.search('status=active')
+        self.crud.search('owner=bob')
+        self.crud.update({'id': '1', 'status': 'done'}, partial=True)
+        self.assertEqual(len(self.crud.search('status=active').data), 2)
+        self.assertFalse(self.crud.search('owner=bob').metadata['cached'])
+        self.crud.delete('3')
+        self.assertEqual(len(self.crud.search('status=active').data), 1)
+        self.crud.increment_counter('5', 'n')
+        r = self.crud.search('status=active')
+        self.assertFalse(r.metadata['cached'])
+        self.assertEqual(r.data[0]['n'], 6)
+
+    def test_bulk_delete(self):
+        self.crud.search('status=active')
+        r = self.crud.bulk_delete('status=active')
+        self.assertEqual(r.data, {'deleted': 3})
+        self.assertEqual(self.crud.search('status=active').data, [])
+
+    def test_ttl_and_size(self):
+        cache = SearchCache(ttl=0.01, max_entries=2)
+        cache.put(cache.key('a', '1'), [{'id': 1}])
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(cache.key('a', '1')))
+        cache = SearchCache(max_entries=2)
+        for v in '123':
+            cache.put(cache.key('a', v), [])
+        self.assertIsNone(cache.get(cache.key('a', '1')))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_stale_put_is_dropped(self):
+        cache = SearchCache()
+        generation = cache.generation
+        cache.invalidate('a', '1')
+        cache.put(cache.key('a', '1'), [], generation=generation)
+        self.assertIsNone(cache.get(cache.key('a', '1')))
@@ -0,0 +1,92 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from click.testing import CliRunner
+
+import cruddy
+from cruddy.middleware import StatsMiddleware
+from cruddy.scripts.cli import cli
+
+
+class TestStreamingOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = os.path.join(self.tmpdir, 'config.json')
+        with open(self.config, 'w') as fp:
+            json.dump({'table_name': 'test-cruddy'}, fp)
+        self.stats = StatsMiddleware()
+        # small pages so that listing takes several requests
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy', middleware=[self.stats],
+            backend={'name': 'memory', 'page_size': 300,
+                     'indexes': {'color': 'color-index'}})
+        for i in range(40):
+            self.crud.create({'id': 'item-{:02d}'.format(i), 'n': i,
+                              'color': 'red' if i % 2 else 'blue',
+                              'tags': ['a', 'b']})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _run(self, args):
+        runner = CliRunner()
+        with mock.patch('cruddy.scripts.cli.CRUD', return_value=self.crud):
+            result = runner.invoke(cli, ['--config', self.config] + args)
+        self.assertEqual(result.exit_code, 0, result.output)
+        return result.output
+
+    def test_first_page_only(self):
+        items = json.loads(self._run(['list']))
+        self.assertTrue(0 < len(items) < 40)
+
+    def test_stream_ndjson(self):
+        output = self._run(['--format', 'ndjson', '--stream', 'list'])
+        items = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual(sorted(i['n'] for i in items), list(range(40)))
+        self.assertTrue(self.stats.stats['scan']['count'] > 1)
+
+    def test_stream_json(self):
+        output = self._run(['--stream', 'search', 'color=red'])
+        items = json.loads(output)
+        self.assertEqual(len(items), 20)
+        self.assertTrue(self.stats.stats['query']['count'] > 1)
+
+    def test_csv(self):
+        output = self._run(['--format', 'csv', '--stream', 'list'])
+        rows = list(csv.DictReader(io.StringIO(output)))
+        self.assertEqual(len(rows), 40)
+        self.assertEqual(rows[0]['tags'], '["a", "b"]')
+
+    def test_single_item(self):
+        output = self._run(['--format', 'ndjson', 'get', 'item-03'])
+        self.assertEqual(json.loads(output)['n'], 3)
+
+    def test_lazy_items(self):
+        self.crud.lazy_items = True
+        self.assertEqual(json.loads(self._run(['get', 'item-03']))['n'], 3)
+        self.assertTrue(json.loads(self._run(['list'])))
+        output = self._run(['--format', 'ndjson', '--stream', 'list'])
+        self.assertEqual(len(output.splitlines()), 40)
+        output = self._run(['--format', 'csv', 'get', 'item-03'])
+        self.assertEqual(list(csv.DictReader(io.StringIO(output)))[0]['n'],
+                         '3')
@@ -0,0 +1,98 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from cruddy.scripts.cli import cli
+
+
+class TestRunCommand(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = os.path.join(self.tmpdir, 'config.json')
+        with open(self.config, 'w') as fp:
+            json.dump({'table_name': 'test-cruddy',
+                       'backend': 'memory'}, fp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _run(self, args, payloads):
+        runner = CliRunner()
+        result = runner.invoke(cli, ['--config', self.config] + args,
+                               input=payloads)
+        self.assertEqual(result.exit_code, 0, result.output)
+        return result.output
+
+    def test_run_stdin(self):
+        payloads = '\n'.join([
+            '{"operation": "create", "item": {"id": "a", "n": 1}}',
+            'increment_counter {"id": "a", "counter_name": "n"}',
+            '# comments are skipped',
+            'get {"id": "a"}',
+            'get {"id": "missing"}',
+            'not json {',
+        ])
+        output = self._run(['run', '-'], payloads)
+        results = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[2]['data'], {'id': 'a', 'n': 2})
+        self.assertEqual(results[3]['status'], 'error')
+        self.assertEqual(results[4]['error_type'], 'InvalidPayload')
+
+    def test_run_parallel_keeps_order(self):
+        payloads = ''.join('create {{"item": {{"id": "{}"}}}}\n'.format(i)
+                           for i in range(50))
+        payloads += ''.join('get {{"id": "{}"}}\n'.format(i)
+                            for i in range(50))
+        output = self._run(['run', '--workers', '8', '-'], payloads)
+        results = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual([r['data']['id'] for r in results[50:]],
+                         [str(i) for i in range(50)])
+
+    def test_opt_in_operations(self):
+        payloads = '\n'.join([
+            'create {"item": {"id": "a", "n": 1}}',
+            'get_counter {"id": "a", "counter_name": "n"}',
+            'bulk_create {"items": [{"id": "b"}]}',
+            'stats {}',
+        ])
+        output = self._run(['run', '-'], payloads)
+        results = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual([r['status'] for r in results], ['success'] * 4)
+        self.assertEqual(results[1]['data'], 1)
+        self.assertEqual(results[2]['data']['created'], 1)
+        self.assertEqual(json.loads(self._run(['stats'], '')), {})
+
+    def test_config_supported_ops(self):
+        with open(self.config, 'w') as fp:
+            json.dump({'table_name': 'test-cruddy', 'backend': 'memory',
+                       'supported_ops': ['get']}, fp)
+        output = self._run(['run', '-'], 'stats {}')
+        self.assertEqual(json.loads(output)['error_type'],
+                         'UnsupportedOperation')
+
+    def test_shell(self):
+        output = self._run(['shell'], 'create {"item": {"id": "a"}}\n'
+                                      'get {"id": "a"}\nquit\n'
+                                      'get {"id": "a"}\n')
+        results = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[1]['data'], {'id': 'a'})
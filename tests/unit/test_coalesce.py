@@ -0,0 +1,111 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import gc
+import unittest
+import weakref
+
+from botocore.exceptions import ClientError
+
+import cruddy
+from cruddy import shutdown
+from cruddy.middleware import Middleware, StatsMiddleware
+
+
+class FailOnce(Middleware):
+
+    def __init__(self):
+        self.failed = False
+
+    def __call__(self, context, call_next):
+        if not self.failed:
+            self.failed = True
+            error = {'Error': {'Code': 'ThrottlingException',
+                               'Message': 'slow down'}}
+            raise ClientError(error, context.operation)
+        call_next(context)
+
+
+class TestCounterCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = StatsMiddleware()
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend='memory',
+            middleware=[self.stats],
+            coalesce_counters={'max_pending': 100, 'interval': 60})
+
+    def tearDown(self):
+        self.crud.close()
+
+    def _updates(self):
+        return self.stats.stats.get('update_item', {}).get('count', 0)
+
+    def test_coalesce(self):
+        for i in range(10):
+            r = self.crud.increment_counter('a', 'views')
+            self.assertEqual(r.status, 'success')
+            self.assertIsNone(r.data)
+        self.crud.increment_counter('a', 'likes', 3)
+        self.crud.increment_counter('b', 'views')
+        self.assertEqual(self._updates(), 0)
+        r = self.crud.flush_counters()
+        self.assertEqual(r.data['increments'], 12)
+        self.assertEqual(r.data['updates'], 2)
+        self.assertEqual(r.data['pending'], 0)
+        self.assertEqual(r.data['durability_window'], 60)
+        self.assertEqual(self._updates(), 2)
+        item = self.crud.get('a').data
+        self.assertEqual(item['views'], 10)
+        self.assertEqual(item['likes'], 3)
+
+    def test_flush_on_size(self):
+        for i in range(100):
+            self.crud.increment_counter('a', 'views')
+        self.assertEqual(self._updates(), 1)
+        self.assertEqual(self.crud.get('a').data['views'], 100)
+
+    def test_flush_on_close(self):
+        self.crud.increment_counter('a', 'views', 7)
+        self.crud.close()
+        self.assertEqual(self.crud.get('a').data['views'], 7)
+
+    def test_failed_flush_is_retried(self):
+        self.crud.add_middleware(FailOnce())
+        self.crud.increment_counter('a', 'views', 2)
+        r = self.crud.flush_counters()
+        self.assertEqual(r.data['errors'], 1)
+        self.assertEqual(r.data['pending'], 1)
+        self.crud.increment_counter('a', 'views', 2)
+        r = self.crud.flush_counters()
+        self.assertEqual(r.data['pending'], 0)
+        self.assertEqual(self.crud.get('a').data['views'], 4)
+
+    def test_idle_buffer_is_freed(self):
+        self.crud.increment_counter('a', 'views')
+        buffer = self.crud.counter_buffer
+        self.assertIn(buffer, shutdown._pinned)
+        self.crud.flush_counters()
+        self.assertNotIn(buffer, shutdown._pinned)
+        ref = weakref.ref(buffer)
+        del buffer
+        self.crud = cruddy.CRUD(table_name='test-cruddy', backend='memory')
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_pending_increments_are_written_at_exit(self):
+        self.crud.increment_counter('a', 'views', 3)
+        shutdown.close_all()
+        self.assertNotIn(self.crud.counter_buffer, shutdown._open)
+        self.assertEqual(self.crud.get('a').data['views'], 3)
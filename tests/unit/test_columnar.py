@@ -0,0 +1,111 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import array
+import decimal
+import json
+import unittest
+
+import cruddy
+from cruddy.columnar import ColumnarResult
+
+
+class TestColumnarResult(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [
+            {'id': 'a', 'n': 1, 'price': 1.5, 'status': 'new'},
+            {'id': 'b', 'n': 2, 'price': 2, 'status': 'new',
+             'tags': ['x']},
+            {'id': 'c', 'n': 2 ** 70, 'price': 3.25, 'flag': True},
+        ]
+
+    def test_columns(self):
+        result = ColumnarResult(self.items)
+        self.assertEqual(len(result), 3)
+        self.assertEqual(result.columns,
+                         ('id', 'n', 'price', 'status', 'tags', 'flag'))
+        self.assertEqual(result.column('price'),
+                         array.array('d', [1.5, 2.0, 3.25]))
+        # Too big for a 64 bit integer or a double
+        self.assertEqual(result.column('n'), [1, 2, 2 ** 70])
+        self.assertEqual(result.column('flag'), [None, None, True])
+        self.assertIsNone(result.mask('id'))
+        self.assertEqual(list(result.mask('status')), [1, 1, 0])
+        self.assertIs(result.column('status')[0],
+                      result.column('status')[1])
+        self.assertRaises(KeyError, result.mask, 'missing')
+
+    def test_integer_column(self):
+        result = ColumnarResult([{'n': i} for i in range(5)] + [{}])
+        self.assertEqual(result.column('n').typecode, 'q')
+        self.assertEqual([row.get('n') for row in result],
+                         [0, 1, 2, 3, 4, None])
+
+    def test_rows(self):
+        result = ColumnarResult(self.items)
+        row = result[1]
+        self.assertEqual(row['price'], 2)
+        self.assertIsInstance(row['price'], int)
+        self.assertEqual(sorted(row), ['id', 'n', 'price', 'status', 'tags'])
+        self.assertNotIn('flag', row)
+        self.assertRaises(KeyError, lambda: row['flag'])
+        self.assertEqual(result[-1]['id'], 'c')
+        self.assertRaises(IndexError, lambda: result[3])
+        self.assertEqual(result.to_dicts(), self.items)
+
+    def test_to_columns(self):
+        data = ColumnarResult(self.items).to_columns()
+        self.assertEqual(data['length'], 3)
+        self.assertEqual(data['columns']['status'], ['new', 'new', None])
+        self.assertEqual(data['columns']['price'], [1.5, 2, 3.25])
+        json.dumps(data)
+
+    def test_empty(self):
+        result = ColumnarResult([])
+        self.assertEqual(len(result), 0)
+        self.assertEqual(result.to_dicts(), [])
+
+
+class TestColumnarResponses(unittest.TestCase):
+
+    def setUp(self):
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend={'name': 'memory',
+                     'indexes': {'status': 'status-index'}},
+            search_cache=True)
+        for i in range(10):
+            self.crud.create({'id': str(i), 'n': i,
+                              'price': decimal.Decimal(i) / 4,
+                              'status': 'even' if i % 2 == 0 else 'odd'})
+
+    def test_list(self):
+        r = self.crud.list(columnar=True)
+        self.assertEqual(r.status, 'success')
+        self.assertIsInstance(r.data, ColumnarResult)
+        self.assertEqual(r.data.column('n').typecode, 'q')
+        self.assertEqual(sorted(r.data.to_dicts(), key=lambda i: i['id']),
+                         sorted(self.crud.list().data,
+                                key=lambda i: i['id']))
+        flat = r.flatten()
+        self.assertEqual(flat['data']['length'], 10)
+        json.dumps(flat['data'])
+
+    def test_search(self):
+        for cached in (False, True):
+            r = self.crud.search('status=odd', columnar=True)
+            self.assertEqual(r.metadata['cached'], cached)
+            self.assertIsInstance(r.data, ColumnarResult)
+            self.assertEqual(sorted(r.data.column('n')), [1, 3, 5, 7, 9])
+        self.assertIsInstance(self.crud.search('status=odd').data, list)
@@ -0,0 +1,103 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import unittest
+
+from boto3.dynamodb.types import Binary
+
+import cruddy
+from cruddy import compression
+from cruddy.memory import item_size
+
+
+class FakeKMS(object):
+    # Reversible "encryption" so the order of operations can be checked
+
+    def encrypt(self, KeyId, Plaintext):
+        if not isinstance(Plaintext, bytes):
+            Plaintext = Plaintext.encode('utf-8')
+        return {'CiphertextBlob': Plaintext[::-1]}
+
+    def decrypt(self, CiphertextBlob):
+        return {'Plaintext': CiphertextBlob[::-1]}
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend={'name': 'memory', 'indexes': {'kind': 'kind-index'}},
+            compressed_attributes=['body', 'doc'],
+            compression={'threshold': 100})
+        self.body = 'lorem ipsum dolor sit amet ' * 100
+        self.doc = {'rows': [{'n': i, 'name': 'row'} for i in range(50)]}
+
+    def _stored(self, id):
+        return self.crud.backend.get_item(Key={'id': id})['Item']
+
+    def test_round_trip(self):
+        r = self.crud.create({'id': 'a', 'kind': 'x', 'body': self.body,
+                              'doc': self.doc, 'small': 'y'})
+        self.assertEqual(r.data['body'], self.body)
+        stored = self._stored('a')
+        self.assertIsInstance(stored['body'], Binary)
+        self.assertIsInstance(stored['doc'], Binary)
+        self.assertTrue(len(stored['body'].value) < len(self.body) / 10)
+        self.assertEqual(self.crud.get('a').data['body'], self.body)
+        self.assertEqual(self.crud.get('a').data['doc'], self.doc)
+        self.assertEqual(self.crud.list().data[0]['doc'], self.doc)
+        self.assertEqual(self.crud.search('kind=x').data[0]['body'],
+                         self.body)
+        stats = self.crud.describe().data['compression']
+        self.assertTrue(stats['bytes_saved'] > 0)
+
+    def test_below_threshold(self):
+        self.crud.create({'id': 'a', 'body': 'short'})
+        self.assertEqual(self._stored('a')['body'], 'short')
+        self.assertEqual(self.crud.get('a').data['body'], 'short')
+
+    def test_updates(self):
+        self.crud.create({'id': 'a', 'body': 'short'})
+        item = self.crud.get('a').data
+        item['body'] = self.body
+        self.crud.update(item)
+        self.assertIsInstance(self._stored('a')['body'], Binary)
+        r = self.crud.update({'id': 'a', 'doc': self.doc}, partial=True)
+        self.assertEqual(r.data['doc'], self.doc)
+        self.assertIsInstance(self._stored('a')['doc'], Binary)
+        self.assertEqual(self.crud.get('a').data['body'], self.body)
+
+    def test_compress_then_encrypt(self):
+        crud = cruddy.CRUD(
+            table_name='test-cruddy', backend='memory',
+            compressed_attributes=['body'], compression={'threshold': 100},
+            encrypted_attributes=[('body', 'key-id')], kms_client=FakeKMS())
+        crud.create({'id': 'a', 'body': self.body})
+        stored = crud.backend.get_item(Key={'id': 'a'})['Item']['body']
+        # the ciphertext is of the compressed value
+        self.assertTrue(len(stored.value) < len(self.body) / 5)
+        self.assertEqual(crud.get('a', decrypt=True).data['body'], self.body)
+
+    def test_unknown_algorithm(self):
+        self.assertRaises(ValueError, compression.Compressor, ['a'],
+                          algorithm='lz77')
+
+    def test_savings(self):
+        compressor = compression.Compressor(['body'], threshold=0)
+        item = {'id': 'a', 'body': self.body}
+        before = item_size(item)
+        compressor.compress(item)
+        self.assertTrue(item_size(item) < before)
+        compressor.decompress(item)
+        self.assertEqual(item['body'], self.body)
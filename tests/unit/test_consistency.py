@@ -0,0 +1,116 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import unittest
+
+import mock
+
+import cruddy
+from cruddy.consistency import WriteSession
+from cruddy.middleware import Middleware
+
+
+class ReadRecorder(Middleware):
+
+    def __init__(self):
+        self.reads = []
+
+    def before(self, context):
+        if context.operation in ('get_item', 'batch_get_item'):
+            self.reads.append(context.params.get('ConsistentRead'))
+
+
+class TestWriteSession(unittest.TestCase):
+
+    def test_expiry(self):
+        session = WriteSession(ttl=5)
+        with mock.patch('time.time', return_value=1000.0):
+            session.record(['a'])
+            self.assertTrue(session.recent(['a']))
+            self.assertFalse(session.recent(['b']))
+        with mock.patch('time.time', return_value=1006.0):
+            self.assertFalse(session.recent(['a']))
+        self.assertEqual(len(session), 0)
+
+    def test_bounded(self):
+        session = WriteSession(max_keys=3)
+        session.record(['a', 'b', 'c', 'd'])
+        self.assertEqual(len(session), 3)
+        self.assertFalse(session.recent(['a']))
+        self.assertTrue(session.recent(['x', 'd']))
+        stats = session.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['strong_reads'], 1)
+        self.assertEqual(stats['eventual_reads'], 1)
+
+
+class TestReadConsistency(unittest.TestCase):
+
+    def _crud(self, **kwargs):
+        self.recorder = ReadRecorder()
+        ops = cruddy.CRUD.SupportedOps + ['bulk_create', 'get_counter',
+                                          'stats']
+        return cruddy.CRUD(table_name='test-cruddy', backend='memory',
+                           middleware=[self.recorder], supported_ops=ops,
+                           **kwargs)
+
+    def test_default_is_strong(self):
+        crud = self._crud()
+        crud.create({'id': 'a'})
+        crud.get('a')
+        crud.get('a', consistency='eventual')
+        self.assertEqual(self.recorder.reads, [True, False])
+
+    def test_eventual(self):
+        crud = self._crud(read_consistency='eventual')
+        crud.create({'id': 'a', 'n': 1})
+        self.assertEqual(crud.get('a').data['n'], 1)
+        crud.get('a', consistency='strong')
+        crud.get_counter('a', 'n')
+        self.assertEqual(self.recorder.reads, [False, True, False])
+
+    def test_session(self):
+        crud = self._crud(read_consistency={'mode': 'session', 'ttl': 60})
+        crud.backend.put_item(Item={'id': 'elsewhere'})
+        crud.create({'id': 'mine'})
+        crud.get('mine')
+        crud.get('elsewhere')
+        crud.update({'id': 'elsewhere', 'n': 1})
+        crud.get('elsewhere')
+        self.assertEqual(self.recorder.reads, [True, False, True])
+        stats = crud.stats().data['write_session']
+        self.assertEqual(stats['keys'], 2)
+        self.assertEqual(stats['strong_reads'], 2)
+
+    def test_session_tracks_batched_writes_and_deletes(self):
+        crud = self._crud(read_consistency='session')
+        crud.bulk_create([{'id': str(i)} for i in range(3)])
+        crud.get('1')
+        crud.write_session = WriteSession()
+        crud.delete('1')
+        crud.get('1')
+        crud.get('2')
+        self.assertEqual(self.recorder.reads, [True, True, False])
+
+    def test_session_call_without_tracking_is_strong(self):
+        crud = self._crud(read_consistency='eventual')
+        crud.get('a', consistency='session')
+        self.assertEqual(self.recorder.reads, [True])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, self._crud, read_consistency='maybe')
+        crud = self._crud()
+        r = crud.get('a', consistency='maybe')
+        self.assertEqual(r.status, 'error')
+        self.assertEqual(r.error_type, 'InvalidConsistency')
+        self.assertEqual(self.recorder.reads, [])
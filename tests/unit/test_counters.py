@@ -0,0 +1,104 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import unittest
+
+import cruddy
+from cruddy.counters import ShardedCounters
+from cruddy.middleware import StatsMiddleware
+
+
+class TestShardedCounters(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = StatsMiddleware()
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend='memory',
+            middleware=[self.stats],
+            supported_ops=cruddy.CRUD.SupportedOps + ['get_counter'],
+            sharded_counters={'views': 8, 'likes': 2})
+
+    def tearDown(self):
+        self.crud.close()
+
+    def test_increment_and_read(self):
+        for i in range(50):
+            r = self.crud.increment_counter('page', 'views')
+            self.assertEqual(r.status, 'success')
+        r = self.crud.get_counter('page', 'views')
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(r.data, 50)
+        # all shards are read with a single batch request
+        self.assertEqual(self.stats.stats['batch_get_item']['count'], 1)
+        shards = [self.crud.get(shard_id).data for shard_id
+                  in self.crud.sharded_counters.shard_ids('page', 'views')]
+        shards = [shard for shard in shards if shard]
+        self.assertTrue(1 < len(shards) <= 8)
+        self.assertEqual(shards[0]['cruddy_shard_of'], 'page')
+
+    def test_shards_are_not_listed(self):
+        self.crud.create({'id': 'page', 'color': 'red'})
+        for i in range(10):
+            self.crud.increment_counter('page', 'views')
+        self.assertEqual(self.crud.list().data,
+                         [{'id': 'page', 'color': 'red'}])
+        self.assertEqual(self.crud.list(attributes=['id']).data,
+                         [{'id': 'page'}])
+        self.assertEqual(self.crud.get_counter('page', 'views').data, 10)
+
+    def test_unwritten_counter(self):
+        r = self.crud.get_counter('page', 'likes')
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(r.data, 0)
+
+    def test_unsharded_counter(self):
+        self.crud.create({'id': 'page', 'hits': 0})
+        self.crud.increment_counter('page', 'hits', 3)
+        r = self.crud.get_counter('page', 'hits')
+        self.assertEqual(r.data, 3)
+
+    def test_hash_selection(self):
+        counters = ShardedCounters({'views': 16}, selection='hash')
+        self.assertEqual(counters.choose('a', 'views', 'user-1'),
+                         counters.choose('a', 'views', 'user-1'))
+
+    def test_cache(self):
+        crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend='memory',
+            middleware=[self.stats],
+            supported_ops=cruddy.CRUD.SupportedOps + ['get_counter'],
+            sharded_counters={'views': 4},
+            counter_cache_ttl=60)
+        crud.increment_counter('page', 'views', 2)
+        self.assertEqual(crud.get_counter('page', 'views').data, 2)
+        crud.increment_counter('page', 'views', 3)
+        r = crud.get_counter('page', 'views')
+        self.assertEqual(r.data, 5)
+        self.assertEqual(r.metadata, {'cached': True})
+        self.assertEqual(self.stats.stats['batch_get_item']['count'], 1)
+
+    def test_with_coalescing(self):
+        crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend='memory',
+            supported_ops=cruddy.CRUD.SupportedOps + ['get_counter'],
+            sharded_counters={'views': 4},
+            coalesce_counters={'interval': 60})
+        for i in range(20):
+            crud.increment_counter('page', 'views')
+        crud.flush_counters()
+        self.assertEqual(crud.get_counter('page', 'views').data, 20)
+        self.assertEqual(crud.list().data, [])
+        crud.close()
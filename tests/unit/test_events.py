@@ -0,0 +1,181 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import base64
+import json
+import unittest
+
+import cruddy
+from cruddy.events import EventBatchHandler
+from cruddy.middleware import StatsMiddleware
+
+
+def sqs_event(*payloads):
+    return {'Records': [{'eventSource': 'aws:sqs',
+                         'messageId': 'm{}'.format(i),
+                         'body': json.dumps(payload)}
+                        for i, payload in enumerate(payloads)]}
+
+
+class TestEventBatchHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = StatsMiddleware()
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend='memory',
+            middleware=[self.stats],
+            prototype={'name': ''})
+        self.handler = EventBatchHandler(self.crud)
+
+    def test_sqs_writes_are_batched(self):
+        payloads = [{'operation': 'create',
+                     'item': {'id': str(i), 'name': 'item-{}'.format(i)}}
+                    for i in range(30)]
+        r = self.handler(sqs_event(*payloads))
+        self.assertEqual(r, {'batchItemFailures': []})
+        self.assertEqual(self.stats.stats['batch_write_item']['count'], 2)
+        self.assertNotIn('put_item', self.stats.stats)
+        self.assertEqual(len(self.crud.list().data), 30)
+
+    def test_sqs_partial_failures(self):
+        self.crud.create({'id': 'old', 'name': 'old'})
+        r = self.handler(sqs_event(
+            {'operation': 'create', 'item': {'id': 'a', 'name': 'a'}},
+            {'operation': 'create', 'item': {'id': 'b', 'name': 5}},
+            {'operation': 'delete', 'id': 'old'},
+            {'operation': 'get', 'id': 'missing'},
+            {'item': {'id': 'c'}}))
+        self.assertEqual(r['batchItemFailures'],
+                         [{'itemIdentifier': 'm1'},
+                          {'itemIdentifier': 'm3'},
+                          {'itemIdentifier': 'm4'}])
+        self.assertEqual(self.crud.get('a').data['name'], 'a')
+        self.assertEqual(self.crud.get('old').error_type, 'NotFound')
+
+    def test_sqs_invalid_body(self):
+        event = sqs_event({'operation': 'ping'})
+        event['Records'][0]['body'] = 'not json'
+        r = self.handler(event)
+        self.assertEqual(r['batchItemFailures'], [{'itemIdentifier': 'm0'}])
+
+    def test_kinesis(self):
+        data = json.dumps({'operation': 'create',
+                           'item': {'id': 'k', 'name': 'kinesis'}})
+        event = {'Records': [{
+            'eventSource': 'aws:kinesis',
+            'kinesis': {'sequenceNumber': '49590338271490256608559692538',
+                        'data': base64.b64encode(
+                            data.encode('utf-8')).decode('ascii')}}]}
+        r = self.handler(event)
+        self.assertEqual(r, {'batchItemFailures': []})
+        self.assertEqual(self.crud.get('k').data['name'], 'kinesis')
+
+    def test_list_reads_are_batched_and_ordered(self):
+        for i in range(3):
+            self.crud.create({'id': str(i), 'name': 'item-{}'.format(i)})
+        r = self.handler([
+            {'operation': 'get', 'id': '0'},
+            {'operation': 'update', 'item': {'id': '0', 'name': 'changed'}},
+            {'operation': 'get', 'id': '0'},
+            {'operation': 'get', 'id': '2'},
+            {'operation': 'get', 'id': 'x'},
+            {'operation': 'ping'}])
+        self.assertEqual([resp['status'] for resp in r],
+                         ['success'] * 4 + ['error', 'success'])
+        self.assertEqual(r[0]['data']['name'], 'item-0')
+        self.assertEqual(r[2]['data']['name'], 'changed')
+        self.assertEqual(r[3]['data']['name'], 'item-2')
+        self.assertEqual(r[4]['error_type'], 'NotFound')
+        self.assertEqual(self.stats.stats['batch_get_item']['count'], 2)
+        self.assertNotIn('get_item', self.stats.stats)
+
+    def test_delete_then_get(self):
+        self.crud.create({'id': 'a', 'name': 'a'})
+        r = self.handler([
+            {'operation': 'get', 'id': 'a'},
+            {'operation': 'delete', 'id': 'a'},
+            {'operation': 'get', 'id': 'a'},
+            {'operation': 'create', 'item': {'id': 'a', 'name': 'again'}},
+            {'operation': 'get', 'id': 'a'}])
+        self.assertEqual([resp['status'] for resp in r],
+                         ['success', 'success', 'error', 'success',
+                          'success'])
+        self.assertEqual(r[0]['data']['name'], 'a')
+        self.assertEqual(r[4]['data']['name'], 'again')
+
+    def test_unhashable_id(self):
+        self.crud.create({'id': 'a', 'name': 'a'})
+        r = self.handler(sqs_event(
+            {'operation': 'get', 'id': 'a'},
+            {'operation': 'get', 'id': ['a']},
+            {'operation': 'delete', 'id': {'id': 'a'}},
+            {'operation': 'create', 'item': {'id': ['b'], 'name': 'b'}}))
+        self.assertEqual(r['batchItemFailures'],
+                         [{'itemIdentifier': 'm1'},
+                          {'itemIdentifier': 'm2'},
+                          {'itemIdentifier': 'm3'}])
+        self.assertEqual(self.crud.get('a').data['name'], 'a')
+
+    def test_read_consistency_of_batched_gets(self):
+        calls = []
+
+        def record(context, call_next):
+            calls.append(context.params.get('ConsistentRead'))
+            call_next(context)
+
+        crud = cruddy.CRUD(table_name='test-cruddy', backend='memory',
+                           read_consistency='eventual', middleware=[record])
+        crud.create({'id': 'a'})
+        handler = EventBatchHandler(crud)
+        handler([{'operation': 'get', 'id': 'a'}])
+        r = handler([{'operation': 'get', 'id': 'a'},
+                     {'operation': 'get', 'id': 'a',
+                      'consistency': 'strong'},
+                     {'operation': 'get', 'id': 'a',
+                      'consistency': 'sometimes'}])
+        self.assertEqual(calls[1:], [False, True])
+        self.assertEqual([resp['status'] for resp in r],
+                         ['success', 'success', 'error'])
+        self.assertEqual(r[2]['error_type'], 'InvalidConsistency')
+
+    def test_unbatchable_operations(self):
+        self.crud.create({'id': 'p', 'name': 'before', 'n': 0})
+        r = self.handler([
+            {'operation': 'update', 'partial': True,
+             'item': {'id': 'p', 'name': 'after'}},
+            {'operation': 'increment_counter', 'id': 'p',
+             'counter_name': 'n'}])
+        self.assertEqual([resp['status'] for resp in r],
+                         ['success', 'success'])
+        item = self.crud.get('p').data
+        self.assertEqual(item['name'], 'after')
+        self.assertEqual(item['n'], 1)
+
+    def test_single_event(self):
+        r = self.handler({'operation': 'create',
+                          'item': {'id': 's', 'name': 'single'}})
+        self.assertEqual(r['status'], 'success')
+        self.assertEqual(self.crud.get('s').data['name'], 'single')
+
+    def test_registry(self):
+        registry = cruddy.CRUDRegistry(
+            tables={'one': {}, 'two': {}}, backend='memory')
+        handler = EventBatchHandler(registry)
+        r = handler(sqs_event(
+            {'table': 'one', 'operation': 'create', 'item': {'id': '1'}},
+            {'table': 'two', 'operation': 'create', 'item': {'id': '2'}},
+            {'table': 'three', 'operation': 'create', 'item': {'id': '3'}}))
+        self.assertEqual(r['batchItemFailures'], [{'itemIdentifier': 'm2'}])
+        self.assertEqual(registry.get('one').get('1').status, 'success')
+        self.assertEqual(registry.get('two').get('1').error_type, 'NotFound')
@@ -0,0 +1,157 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import decimal
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from click.testing import CliRunner
+
+import cruddy
+from cruddy.export import Exporter, open_output, segment_path
+from cruddy.scripts.cli import cli
+
+
+class FailingList(object):
+
+    def __init__(self, list_fn, fail_after):
+        self.list_fn = list_fn
+        self.calls = 0
+        self.fail_after = fail_after
+
+    def __call__(self, **params):
+        self.calls += 1
+        if self.calls > self.fail_after:
+            response = cruddy.CRUDResponse()
+            response.status = 'error'
+            response.error_type = 'Interrupted'
+            return response
+        return self.list_fn(**params)
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.crud = cruddy.CRUD(table_name='test-cruddy', backend='memory')
+        for i in range(100):
+            self.crud.create({'id': 'item-{}'.format(i), 'n': i,
+                              'secret': 'x'})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _read(self, path):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as fp:
+            return [json.loads(line.decode('utf-8')) for line in fp]
+
+    def test_list_pages(self):
+        r = self.crud.list(limit=10, attributes=['id'])
+        self.assertEqual(len(r.data), 10)
+        self.assertEqual(set(r.data[0]), set(['id']))
+        r = self.crud.list(start_key=r.last_evaluated_key)
+        self.assertEqual(len(r.data), 90)
+        self.assertFalse(hasattr(r, 'last_evaluated_key'))
+
+    def test_split_gzip(self):
+        path = os.path.join(self.tmpdir, 'items.json.gz')
+        outputs = {}
+
+        def open_segment(segment):
+            return outputs.setdefault(segment, open_output(
+                segment_path(path, segment), True, False))
+
+        exporter = Exporter(self.crud.list, open_segment, segments=3,
+                            attributes=['id', 'n'], page_size=7)
+        self.assertEqual(exporter.run(), 100)
+        for fp in outputs.values():
+            fp.close()
+        items = []
+        for segment in range(3):
+            items.extend(self._read(os.path.join(
+                self.tmpdir, 'items-{:04d}.json.gz'.format(segment))))
+        self.assertEqual(sorted(i['n'] for i in items), list(range(100)))
+        self.assertNotIn('secret', items[0])
+
+    def test_lazy_items(self):
+        self.crud.lazy_items = True
+        fp = io.BytesIO()
+        exporter = Exporter(self.crud.list, lambda segment: fp, segments=2)
+        self.assertEqual(exporter.run(), 100)
+        items = [json.loads(line.decode('utf-8'))
+                 for line in fp.getvalue().splitlines()]
+        self.assertEqual(sorted(i['n'] for i in items), list(range(100)))
+
+    def test_resume(self):
+        path = os.path.join(self.tmpdir, 'items.json')
+        checkpoint = os.path.join(self.tmpdir, 'checkpoint.json')
+        list_fn = FailingList(self.crud.list, 5)
+        fp = open_output(path, False, False)
+        exporter = Exporter(list_fn, lambda segment: fp, segments=2,
+                            checkpoint=checkpoint, page_size=10)
+        self.assertRaises(IOError, exporter.run)
+        fp.close()
+        self.assertTrue(0 < exporter.count() < 100)
+
+        exporter = Exporter(self.crud.list, None, segments=2,
+                            checkpoint=checkpoint, page_size=10)
+        self.assertTrue(exporter.resumed)
+        fp = open_output(path, False, True)
+        exporter.outputs = lambda segment: fp
+        self.assertEqual(exporter.run(), 100)
+        fp.close()
+        ids = [item['id'] for item in self._read(path)]
+        self.assertEqual(sorted(set(ids)), sorted(ids))
+        self.assertEqual(len(ids), 100)
+
+        self.assertRaises(ValueError, Exporter, self.crud.list, None,
+                          segments=4, checkpoint=checkpoint)
+
+    def test_resume_with_fractional_keys(self):
+        crud = cruddy.CRUD(table_name='test-cruddy', backend='memory')
+        for i in range(20):
+            crud.create({'id': decimal.Decimal(i) + decimal.Decimal('0.1')})
+        path = os.path.join(self.tmpdir, 'items.json')
+        checkpoint = os.path.join(self.tmpdir, 'checkpoint.json')
+        fp = open_output(path, False, False)
+        exporter = Exporter(FailingList(crud.list, 2), lambda segment: fp,
+                            segments=1, checkpoint=checkpoint, page_size=5)
+        self.assertRaises(IOError, exporter.run)
+        self.assertEqual(exporter.state[0]['start_key'], {'id': 9.1})
+        exporter = Exporter(crud.list, lambda segment: fp, segments=1,
+                            checkpoint=checkpoint, page_size=5)
+        self.assertEqual(exporter.run(), 20)
+        fp.close()
+        ids = sorted(item['id'] for item in self._read(path))
+        self.assertEqual(ids, [i + 0.1 for i in range(20)])
+
+    def test_export_command(self):
+        config = os.path.join(self.tmpdir, 'config.json')
+        with open(config, 'w') as fp:
+            json.dump({'table_name': 'test-cruddy', 'backend': 'memory'}, fp)
+        path = os.path.join(self.tmpdir, 'out.json')
+        runner = CliRunner()
+        with mock.patch('cruddy.scripts.cli.CRUD', return_value=self.crud):
+            result = runner.invoke(cli, ['--config', config, 'export',
+                                         '--segments', '4', '-o', path,
+                                         '--attributes', 'id'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('100 items exported', result.output)
+        self.assertEqual(len(self._read(path)), 100)
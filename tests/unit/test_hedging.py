@@ -0,0 +1,143 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import threading
+import time
+import unittest
+
+from cruddy.exceptions import CruddyTimeoutError
+from cruddy.hedging import Hedger, LatencyHistogram
+from cruddy.lambdaclient import BaseClient
+from cruddy.response import CRUDResponse
+
+
+class FakeClient(BaseClient):
+    # Each call sleeps for the next of ``delays`` before answering
+    def __init__(self, delays, hedging=None):
+        self.delays = list(delays)
+        self.sent = []
+        self._lock = threading.Lock()
+        self._setup_hedging(hedging)
+
+    def _send(self, payload):
+        with self._lock:
+            self.sent.append(payload)
+            delay = self.delays.pop(0) if self.delays else 0
+            attempt = len(self.sent)
+        time.sleep(delay)
+        response = CRUDResponse()
+        response.data = attempt
+        return response
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        for i in range(1, 101):
+            histogram.add(i / 1000.0)
+        for percentile, expected in ((50, 0.05), (90, 0.09), (99, 0.099)):
+            latency = histogram.percentile(percentile)
+            # Never below the true value and at most one bucket above it
+            self.assertTrue(expected <= latency <= expected * 1.19,
+                            (percentile, latency))
+        self.assertEqual(histogram.percentile(100), 0.1)
+        report = histogram.report()
+        self.assertEqual(report['count'], 100)
+        self.assertAlmostEqual(report['max_ms'], 100)
+        histogram.add(1000)
+        self.assertEqual(histogram.percentile(100), 1000)
+
+
+class TestHedger(unittest.TestCase):
+
+    def test_delay_follows_the_percentile(self):
+        hedger = Hedger(percentile=50, initial_delay=0.3, min_samples=10)
+        self.assertEqual(hedger.delay('get'), 0.3)
+        for i in range(10):
+            hedger._record('get', 0.02)
+        self.assertTrue(0.02 <= hedger.delay('get') <= 0.024)
+        self.assertEqual(Hedger(min_delay=1, initial_delay=0.1).delay('get'),
+                         1)
+
+    def test_slow_call_is_hedged(self):
+        client = FakeClient([1.0, 0.0], hedging={
+            'initial_delay': 0.05, 'max_rate': 1})
+        start = time.time()
+        response = client.get('1')
+        self.assertTrue(time.time() - start < 0.5)
+        # The hedge answered
+        self.assertEqual(response.data, 2)
+        self.assertEqual(client.sent, [{'operation': 'get', 'id': '1'}] * 2)
+        stats = client.hedging_stats()
+        self.assertEqual((stats['calls'], stats['hedged'],
+                          stats['hedge_wins']), (1, 1, 1))
+        self.assertEqual(stats['hedge_rate'], 1.0)
+        self.assertEqual(stats['latency']['get']['count'], 1)
+
+    def test_fast_call_is_not_hedged(self):
+        client = FakeClient([0.0], hedging={'initial_delay': 0.5,
+                                            'max_rate': 1})
+        self.assertEqual(client.get('1').data, 1)
+        self.assertEqual(len(client.sent), 1)
+        self.assertEqual(client.hedging_stats()['hedged'], 0)
+
+    def test_writes_are_never_hedged(self):
+        client = FakeClient([0.2], hedging={'initial_delay': 0.01,
+                                            'max_rate': 1})
+        self.assertEqual(client.create({'id': '1'}).data, 1)
+        self.assertEqual(len(client.sent), 1)
+
+    def test_hedge_rate_is_bounded(self):
+        client = FakeClient([0.05] * 20, hedging={'initial_delay': 0.01,
+                                                  'max_rate': 0.25})
+        for i in range(8):
+            client.get(str(i))
+        stats = client.hedging_stats()
+        self.assertEqual(stats['calls'], 8)
+        self.assertEqual(stats['hedged'], 2)
+
+    def test_deadline(self):
+        client = FakeClient([0.5, 0.5])
+        start = time.time()
+        response = client.create({'id': '1'}, deadline=0.05)
+        self.assertTrue(time.time() - start < 0.3)
+        self.assertEqual(response.status, 'error')
+        self.assertEqual(response.error_type, 'DeadlineExceeded')
+        # The deadline is not sent to the handler
+        self.assertEqual(client.sent, [{'operation': 'create',
+                                        'item': {'id': '1'}}])
+        self.assertEqual(client.hedging_stats()['deadline_exceeded'], 1)
+        client = FakeClient([0.5], hedging={'deadline': 0.05})
+        self.assertEqual(client.get('1').error_type, 'DeadlineExceeded')
+
+    def test_errors(self):
+        calls = []
+
+        def fail(payload):
+            calls.append(payload)
+            raise ValueError('boom')
+
+        hedger = Hedger(initial_delay=0.01, max_rate=1)
+        self.assertRaises(ValueError, hedger.call, fail,
+                          {'operation': 'get'})
+        self.assertRaises(ValueError, hedger.call, fail,
+                          {'operation': 'create'}, 1)
+        self.assertEqual(hedger.stats()['errors'], 2)
+
+        def slow(payload):
+            time.sleep(0.5)
+
+        self.assertRaises(CruddyTimeoutError, hedger.call, slow,
+                          {'operation': 'get'}, 0.05)
@@ -0,0 +1,127 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import copy
+import decimal
+import json
+import unittest
+
+import cruddy
+from cruddy.lazy import LazyItem
+
+
+class CountingKMS(object):
+
+    def __init__(self):
+        self.decrypts = 0
+
+    def encrypt(self, KeyId, Plaintext):
+        if not isinstance(Plaintext, bytes):
+            Plaintext = Plaintext.encode('utf-8')
+        return {'CiphertextBlob': Plaintext[::-1]}
+
+    def decrypt(self, CiphertextBlob):
+        self.decrypts += 1
+        return {'Plaintext': CiphertextBlob[::-1]}
+
+
+class TestLazyItem(unittest.TestCase):
+
+    def test_converts_once_on_access(self):
+        calls = []
+
+        def convert(name, value):
+            calls.append(name)
+            return value * 2
+
+        item = LazyItem({'a': 1, 'b': 2}, convert)
+        self.assertEqual(sorted(item), ['a', 'b'])
+        self.assertIn('a', item)
+        self.assertEqual(len(item), 2)
+        self.assertEqual(repr(item), 'LazyItem(a, b)')
+        self.assertEqual(calls, [])
+        self.assertEqual(item['a'], 2)
+        self.assertEqual(item['a'], 2)
+        self.assertEqual(calls, ['a'])
+        self.assertTrue(item.is_converted('a'))
+        self.assertFalse(item.is_converted('b'))
+        self.assertIsNone(item.get('missing'))
+        self.assertEqual(item, {'a': 2, 'b': 4})
+        self.assertEqual(copy.deepcopy(item), {'a': 2, 'b': 4})
+        self.assertIsInstance(copy.deepcopy(item), dict)
+        self.assertEqual(calls, ['a', 'b'])
+
+
+class TestLazyItems(unittest.TestCase):
+
+    def setUp(self):
+        self.kms = CountingKMS()
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy', backend='memory',
+            encrypted_attributes=[('secret', 'key-id'),
+                                  ('other', 'key-id')],
+            compressed_attributes=['body'],
+            compression={'threshold': 64},
+            kms_client=self.kms)
+        self.crud.create({'id': 'a', 'n': 3, 'ratio': decimal.Decimal('0.5'),
+                          'nested': {'m': 1}, 'body': 'text ' * 100,
+                          'secret': 'hush', 'other': 'quiet'})
+
+    def test_get(self):
+        item = self.crud.get('a', decrypt=True, lazy=True).data
+        self.assertIsInstance(item, LazyItem)
+        self.assertEqual(item['n'], 3)
+        self.assertEqual(self.kms.decrypts, 0)
+        self.assertEqual(item['secret'], b'hush')
+        self.assertEqual(item['secret'], b'hush')
+        self.assertEqual(self.kms.decrypts, 1)
+        eager = self.crud.get('a', decrypt=True).data
+        self.assertEqual(self.kms.decrypts, 3)
+        self.assertEqual(item, eager)
+        self.assertEqual(item['nested'], {'m': 1})
+        self.assertEqual(item['body'], 'text ' * 100)
+        self.assertIsInstance(item['ratio'], float)
+
+    def test_get_without_decrypt(self):
+        item = self.crud.get('a', lazy=True).data
+        self.assertNotEqual(item['secret'], b'hush')
+        self.assertEqual(self.kms.decrypts, 0)
+
+    def test_handler_default_and_flatten(self):
+        crud = cruddy.CRUD(table_name='test-cruddy', backend='memory',
+                           lazy_items=True)
+        crud.create({'id': 'x', 'n': 1})
+        r = crud.get('x')
+        self.assertIsInstance(r.data, LazyItem)
+        flat = r.flatten()
+        self.assertEqual(flat['data'], {'id': 'x', 'n': 1})
+        json.dumps(flat)
+        self.assertIsInstance(crud.get('x', lazy=False).data, dict)
+        items = crud.list().data
+        self.assertIsInstance(items[0], LazyItem)
+        self.assertEqual(json.loads(json.dumps(crud.list().flatten()))
+                         ['data'], [{'id': 'x', 'n': 1}])
+
+    def test_list_and_search(self):
+        crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend={'name': 'memory', 'indexes': {'color': 'color-index'}})
+        for i in range(3):
+            crud.create({'id': str(i), 'color': 'red', 'n': i})
+        items = crud.list(lazy=True).data
+        self.assertTrue(all(isinstance(i, LazyItem) for i in items))
+        self.assertEqual(sorted(i['n'] for i in items), [0, 1, 2])
+        items = crud.search('color=red', lazy=True).data
+        self.assertTrue(all(isinstance(i, LazyItem) for i in items))
+        columnar = crud.list(lazy=True, columnar=True).data
+        self.assertEqual(len(columnar), 3)
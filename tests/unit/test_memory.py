@@ -0,0 +1,176 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import unittest
+import decimal
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+import cruddy
+from cruddy.memory import MemoryBackend
+
+
+class TestMemoryBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = MemoryBackend(indexes={'status': 'status-index'})
+
+    def tearDown(self):
+        pass
+
+    def test_put_get(self):
+        self.backend.put_item(Item={'id': 'a', 'n': 1, 'tags': ['x']})
+        r = self.backend.get_item(Key={'id': 'a'})
+        self.assertEqual(r['Item']['n'], decimal.Decimal(1))
+        # returned items are copies
+        r['Item']['tags'].append('y')
+        r = self.backend.get_item(Key={'id': 'a'})
+        self.assertEqual(r['Item']['tags'], ['x'])
+        r = self.backend.get_item(Key={'id': 'b'})
+        self.assertNotIn('Item', r)
+
+    def test_update_expression(self):
+        self.backend.put_item(Item={'id': 'a', 'n': 1, 'gone': 'x'})
+        r = self.backend.update_item(
+            Key={'id': 'a'},
+            UpdateExpression='SET #n = #n + :one, m = :m REMOVE gone '
+                             'ADD c :one',
+            ExpressionAttributeNames={'#n': 'n'},
+            ExpressionAttributeValues={':one': 1, ':m': 'new'},
+            ReturnValues='ALL_NEW')
+        self.assertEqual(r['Attributes'],
+                         {'id': 'a', 'n': 2, 'm': 'new', 'c': 1})
+
+    def test_update_missing_attribute(self):
+        self.backend.put_item(Item={'id': 'a'})
+        with self.assertRaises(ClientError) as cm:
+            self.backend.update_item(
+                Key={'id': 'a'},
+                UpdateExpression='set #ctr = #ctr + :val',
+                ExpressionAttributeNames={'#ctr': 'views'},
+                ExpressionAttributeValues={':val': 1})
+        self.assertEqual(cm.exception.response['Error']['Code'],
+                         'ValidationException')
+
+    def test_condition(self):
+        self.backend.put_item(Item={'id': 'a', 'version': 1})
+        self.backend.put_item(Item={'id': 'a', 'version': 2},
+                              ConditionExpression=Attr('version').eq(1))
+        with self.assertRaises(ClientError) as cm:
+            self.backend.put_item(Item={'id': 'a', 'version': 2},
+                                  ConditionExpression=Attr('version').eq(1))
+        self.assertEqual(cm.exception.response['Error']['Code'],
+                         'ConditionalCheckFailedException')
+
+    def test_index_maintenance(self):
+        self.backend.put_item(Item={'id': 'a', 'status': 'new'})
+        self.backend.put_item(Item={'id': 'a', 'status': 'old'})
+        self.backend.put_item(Item={'id': 'b', 'status': 'old'})
+        self.assertEqual(self.backend._index_data['status'],
+                         {'old': ['a', 'b']})
+        self.backend.delete_item(Key={'id': 'a'})
+        self.assertEqual(self.backend._index_data['status'],
+                         {'old': ['b']})
+        self.assertEqual(self.backend._keys, ['b'])
+
+    def test_scan_pagination(self):
+        for i in range(25):
+            self.backend.put_item(Item={'id': str(i)})
+        seen = []
+        params = {'Limit': 10}
+        while True:
+            r = self.backend.scan(**params)
+            seen.extend(item['id'] for item in r['Items'])
+            if 'LastEvaluatedKey' not in r:
+                break
+            params['ExclusiveStartKey'] = r['LastEvaluatedKey']
+        self.assertEqual(sorted(seen), sorted(str(i) for i in range(25)))
+
+    def test_scan_resumes_after_deleted_start_key(self):
+        for i in range(5):
+            self.backend.put_item(Item={'id': str(i)})
+        r = self.backend.scan(Limit=2)
+        self.backend.delete_item(Key=r['LastEvaluatedKey'])
+        r = self.backend.scan(ExclusiveStartKey=r['LastEvaluatedKey'])
+        self.assertEqual([item['id'] for item in r['Items']],
+                         ['2', '3', '4'])
+
+    def test_deleted_item_is_a_copy(self):
+        self.backend.put_item(Item={'id': 'a', 'tags': ['x']})
+        stored = self.backend._items['a']
+        r = self.backend.delete_item(Key={'id': 'a'}, ReturnValues='ALL_OLD')
+        self.assertEqual(r['Attributes'], stored)
+        self.assertIsNot(r['Attributes'], stored)
+        self.assertIsNot(r['Attributes']['tags'], stored['tags'])
+
+    def test_floats_rejected(self):
+        with self.assertRaises(ClientError):
+            self.backend.put_item(Item={'id': 'a', 'f': 1.5})
+
+
+class TestCRUDMemoryBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            prototype={'id': '<on-create:uuid>',
+                       'created_at': '<on-create:timestamp>',
+                       'modified_at': '<on-update:timestamp>',
+                       'fie': 1},
+            backend={'name': 'memory',
+                     'indexes': {'status': 'status-index'}})
+
+    def tearDown(self):
+        pass
+
+    def test_cruddy(self):
+        r = self.crud.list()
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(len(r.data), 0)
+        r = self.crud.create({'status': 'active', 'views': 0})
+        self.assertEqual(r.status, 'success')
+        item = r.data
+        r = self.crud.get(item['id'])
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(r.data['fie'], 1)
+        self.assertTrue(isinstance(r.data['created_at'], int))
+        item['fie'] = 2
+        r = self.crud.update(item)
+        self.assertEqual(r.status, 'success')
+        r = self.crud.search('status=active')
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(len(r.data), 1)
+        self.assertEqual(r.data[0]['fie'], 2)
+        r = self.crud.increment_counter(item['id'], 'views', 5)
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(r.data, 5)
+        r = self.crud.delete(item['id'])
+        self.assertEqual(r.status, 'success')
+        r = self.crud.get(item['id'])
+        self.assertEqual(r.status, 'error')
+        self.assertEqual(r.error_type, 'NotFound')
+
+    def test_bulk_delete(self):
+        for i in range(5):
+            self.crud.create({'status': 'doomed'})
+        self.crud.create({'status': 'active'})
+        r = self.crud.bulk_delete('status=doomed')
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(r.data, {'deleted': 5})
+        self.assertEqual(len(self.crud.list().data), 1)
+
+    def test_error_response(self):
+        r = self.crud.increment_counter('missing', 'views')
+        self.assertEqual(r.status, 'error')
+        self.assertEqual(r.error_code, 'ValidationException')
@@ -0,0 +1,102 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import unittest
+import os
+
+import mock
+import placebo
+from botocore.exceptions import ClientError
+
+import cruddy
+from cruddy.middleware import Middleware, StatsMiddleware
+
+
+class FaultInjector(Middleware):
+
+    def __call__(self, context, call_next):
+        error = {'Error': {'Code': 'ProvisionedThroughputExceededException',
+                           'Message': 'injected'}}
+        raise ClientError(error, context.operation)
+
+
+class CannedResult(Middleware):
+
+    def __init__(self, items):
+        self.items = items
+        self.calls = []
+
+    def __call__(self, context, call_next):
+        self.calls.append((context.operation, context.params))
+        context.result = {'Items': self.items,
+                          'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+
+class TestMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.environ = {}
+        self.environ_patch = mock.patch('os.environ', self.environ)
+        self.environ_patch.start()
+        credential_path = os.path.join(os.path.dirname(__file__), 'cfg',
+                                       'aws_credentials')
+        self.environ['AWS_SHARED_CREDENTIALS_FILE'] = credential_path
+        self.data_path = os.path.join(os.path.dirname(__file__), 'responses')
+        self.stats = StatsMiddleware()
+        self.crud = cruddy.CRUD(
+            profile_name='foobar',
+            region_name='us-west-2',
+            table_name='mg-test-cruddy',
+            middleware=[self.stats],
+            placebo=placebo,
+            placebo_mode='playback',
+            placebo_dir=self.data_path)
+
+    def tearDown(self):
+        self.environ_patch.stop()
+
+    def test_no_middleware(self):
+        crud = cruddy.CRUD(
+            profile_name='foobar',
+            region_name='us-west-2',
+            table_name='mg-test-cruddy',
+            placebo=placebo,
+            placebo_mode='playback',
+            placebo_dir=self.data_path)
+        self.assertIsNone(crud._middleware_chain)
+        r = crud.list()
+        self.assertEqual(r.status, 'success')
+
+    def test_stats(self):
+        r = self.crud.list()
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(self.stats.stats['scan']['count'], 1)
+        self.assertGreaterEqual(self.stats.stats['scan']['elapsed'], 0)
+
+    def test_short_circuit(self):
+        canned = CannedResult([{'id': 'foo'}])
+        self.crud.add_middleware(canned)
+        r = self.crud.list()
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(r.data, [{'id': 'foo'}])
+        self.assertEqual(canned.calls, [('scan', {})])
+        # the outer middleware still sees the call
+        self.assertEqual(self.stats.stats['scan']['count'], 1)
+
+    def test_fault_injection(self):
+        self.crud.add_middleware(FaultInjector())
+        r = self.crud.list()
+        self.assertEqual(r.status, 'error')
+        self.assertEqual(r.error_code,
+                         'ProvisionedThroughputExceededException')
+        self.assertEqual(r.error_message, 'injected')
@@ -0,0 +1,156 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import mock
+from click.testing import CliRunner
+
+import cruddy
+from cruddy.exceptions import CruddyReadError
+from cruddy.pager import Pager
+from cruddy.response import CRUDResponse
+from cruddy.scripts.cli import cli
+
+
+class CountingFetch(object):
+    # Serves ``pages`` pages of ``size`` numbered items
+    def __init__(self, pages=10, size=5, fail_at=None, delay=0):
+        self.pages = pages
+        self.size = size
+        self.fail_at = fail_at
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, start_key=None, **kwargs):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        page = start_key['page'] if start_key else 0
+        response = CRUDResponse()
+        if page == self.fail_at:
+            response.status = 'error'
+            response.error_type = 'ProvisionedThroughputExceededException'
+            response.error_message = 'slow down'
+            return response
+        response.data = [page * self.size + i for i in range(self.size)]
+        if page + 1 < self.pages:
+            response.last_evaluated_key = {'page': page + 1}
+        return response
+
+
+class TestPager(unittest.TestCase):
+
+    def test_items(self):
+        for prefetch in (0, 1, 3):
+            fetch = CountingFetch()
+            self.assertEqual(list(Pager(fetch, prefetch=prefetch)),
+                             list(range(50)))
+            self.assertEqual(fetch.calls, 10)
+
+    def test_read_ahead_is_bounded(self):
+        fetch = CountingFetch()
+        pager = Pager(fetch, prefetch=2)
+        pages = pager.pages()
+        next(pages)
+        time.sleep(0.1)
+        # the page being consumed plus two more
+        self.assertEqual(fetch.calls, 3)
+        next(pages)
+        time.sleep(0.1)
+        self.assertEqual(fetch.calls, 4)
+        pager.close()
+
+    def test_stopping_early_cancels(self):
+        fetch = CountingFetch(pages=100, delay=0.01)
+        with Pager(fetch, prefetch=2) as pager:
+            for item in pager:
+                if item == 7:
+                    break
+        self.assertIsNone(pager._thread)
+        calls = fetch.calls
+        time.sleep(0.05)
+        self.assertEqual(fetch.calls, calls)
+        self.assertLessEqual(calls, 4)
+
+    def test_abandoned_generator_cancels(self):
+        fetch = CountingFetch(pages=100)
+        pager = Pager(fetch, prefetch=1)
+        pages = pager.pages()
+        next(pages)
+        pages.close()
+        self.assertIsNone(pager._thread)
+
+    def test_errors(self):
+        for prefetch in (0, 2):
+            pager = Pager(CountingFetch(fail_at=3), prefetch=prefetch)
+            pages = list(pager.pages())
+            self.assertEqual(len(pages), 4)
+            self.assertEqual(pages[-1].status, 'error')
+            pager = Pager(CountingFetch(fail_at=3), prefetch=prefetch)
+            self.assertRaises(CruddyReadError, list, pager)
+
+    def test_exception_in_reader(self):
+        def fetch(**kwargs):
+            raise ValueError('broken')
+        self.assertRaises(ValueError, list, Pager(fetch, prefetch=1))
+
+    def test_crud_iterators(self):
+        crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend={'name': 'memory', 'page_size': 300,
+                     'indexes': {'color': 'color-index'}})
+        for i in range(40):
+            crud.create({'id': 'item-{:02d}'.format(i),
+                         'color': 'red' if i % 2 else 'blue'})
+        ids = sorted(item['id'] for item in crud.iter_list(prefetch=2))
+        self.assertEqual(len(ids), 40)
+        self.assertEqual(len(set(ids)), 40)
+        red = [item['id']
+               for item in crud.iter_search('color=red', prefetch=1)]
+        self.assertEqual(len(red), 20)
+
+
+class TestCLIPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = os.path.join(self.tmpdir, 'config.json')
+        with open(self.config, 'w') as fp:
+            json.dump({'table_name': 'test-cruddy'}, fp)
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend={'name': 'memory', 'page_size': 300})
+        for i in range(40):
+            self.crud.create({'id': 'item-{:02d}'.format(i), 'n': i})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_stream_with_prefetch(self):
+        runner = CliRunner()
+        with mock.patch('cruddy.scripts.cli.CRUD', return_value=self.crud):
+            result = runner.invoke(cli, ['--config', self.config,
+                                         '--stream', '--prefetch', '2',
+                                         '--format', 'ndjson', 'list'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        items = [json.loads(line) for line in result.output.splitlines()]
+        self.assertEqual(sorted(item['n'] for item in items),
+                         list(range(40)))
@@ -0,0 +1,110 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import unittest
+
+import cruddy
+from cruddy.middleware import Middleware
+
+
+class Recorder(Middleware):
+
+    def __init__(self):
+        self.calls = []
+
+    def before(self, context):
+        self.calls.append((context.operation, context.params))
+
+
+class TestPartialUpdate(unittest.TestCase):
+
+    def setUp(self):
+        self.recorder = Recorder()
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend='memory',
+            prototype={'id': '<on-create:uuid>',
+                       'modified_at': '<on-update:timestamp>',
+                       'fie': 1},
+            version_attribute='version',
+            middleware=[self.recorder])
+        self.item = self.crud.create({'foo': 'bar', 'big': 'x' * 100}).data
+
+    def tearDown(self):
+        pass
+
+    def test_partial(self):
+        self.assertEqual(self.item['version'], 1)
+        r = self.crud.update({'id': self.item['id'], 'version': 1,
+                              'foo': 'baz', 'big': None}, partial=True)
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(r.data['foo'], 'baz')
+        self.assertEqual(r.data['fie'], 1)
+        self.assertEqual(r.data['version'], 2)
+        self.assertNotIn('big', r.data)
+        operation, params = self.recorder.calls[-1]
+        self.assertEqual(operation, 'update_item')
+        self.assertEqual(
+            sorted(params['ExpressionAttributeNames'].values()),
+            ['big', 'foo', 'modified_at', 'version'])
+
+    def test_diff(self):
+        original = dict(self.item)
+        item = dict(self.item)
+        item['foo'] = 'changed'
+        del item['big']
+        r = self.crud.update(item, original=original)
+        self.assertEqual(r.status, 'success')
+        operation, params = self.recorder.calls[-1]
+        # modified_at is only written if the timestamp actually changed
+        names = set(params['ExpressionAttributeNames'].values())
+        names.discard('modified_at')
+        self.assertEqual(sorted(names), ['big', 'foo', 'version'])
+        self.assertNotIn('big', self.crud.get(self.item['id']).data)
+
+    def test_version_conflict(self):
+        stale = dict(self.item)
+        r = self.crud.update(dict(self.item))
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(r.data['version'], 2)
+        r = self.crud.update(stale)
+        self.assertEqual(r.status, 'error')
+        self.assertEqual(r.error_code, 'ConditionalCheckFailedException')
+        stale = {'id': self.item['id'], 'version': 1, 'foo': 'x'}
+        r = self.crud.update(stale, partial=True)
+        self.assertEqual(r.error_code, 'ConditionalCheckFailedException')
+
+    def test_retrying_a_conflict_conflicts_again(self):
+        stale = dict(self.item)
+        partial = {'id': self.item['id'], 'version': 1, 'foo': 'y'}
+        mine = dict(self.item, x=2)
+        self.assertEqual(self.crud.update(mine).status, 'success')
+        self.assertEqual(mine['version'], 2)
+        for attempt in range(2):
+            r = self.crud.update(stale)
+            self.assertEqual(r.error_code,
+                             'ConditionalCheckFailedException')
+            self.assertEqual(stale['version'], 1)
+            r = self.crud.update(partial, partial=True)
+            self.assertEqual(r.error_code,
+                             'ConditionalCheckFailedException')
+            self.assertEqual(partial['version'], 1)
+        item = self.crud.get(self.item['id']).data
+        self.assertEqual((item['x'], item['version']), (2, 2))
+        r = self.crud.update(dict(item, foo='z'), partial=True)
+        self.assertEqual(r.data['version'], 3)
+
+    def test_partial_requires_existing_item(self):
+        r = self.crud.update({'id': 'nope', 'foo': 'x'}, partial=True)
+        self.assertEqual(r.status, 'error')
+        self.assertEqual(r.error_code, 'ConditionalCheckFailedException')
@@ -0,0 +1,133 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import json
+import random
+import unittest
+
+import mock
+from botocore.exceptions import ClientError
+
+import cruddy
+from cruddy.profiler import SpaceSaving
+
+
+class TestSpaceSaving(unittest.TestCase):
+
+    def test_heavy_hitters(self):
+        rnd = random.Random(7)
+        sketch = SpaceSaving(capacity=20)
+        stream = ['hot'] * 500 + ['warm'] * 200
+        stream += ['cold-{}'.format(rnd.randrange(10000))
+                   for i in range(2000)]
+        rnd.shuffle(stream)
+        for key in stream:
+            sketch.add(key)
+        self.assertEqual(len(sketch), 20)
+        self.assertEqual(sketch.total, len(stream))
+        top = sketch.top(2)
+        self.assertEqual([key for key, _, _ in top], ['hot', 'warm'])
+        for key, count, error in top:
+            true_count = stream.count(key)
+            self.assertTrue(count - error <= true_count <= count)
+
+    def test_mixed_key_types(self):
+        sketch = SpaceSaving(capacity=2)
+        for key in ['a', 1, 'b', 2.5, 'a', 1]:
+            sketch.add(key)
+        self.assertEqual(len(sketch), 2)
+
+
+class TestAccessProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend={'name': 'memory',
+                     'indexes': {'color': 'color-index'}},
+            supported_ops=cruddy.CRUD.SupportedOps + ['stats'],
+            profiler={'capacity': 50, 'top': 3})
+        for i in range(10):
+            self.crud.create({'id': str(i), 'color': 'red' if i else 'blue',
+                              'body': 'x' * (i * 500)})
+
+    def test_hot_keys(self):
+        for i in range(20):
+            self.crud.get('3')
+        self.crud.get('4')
+        for i in range(5):
+            self.crud.search('color=red')
+        self.crud.list()
+        report = self.crud.stats().data['profiler']
+        hot = report['hot_keys']
+        self.assertEqual(hot['operations']['get_item'][0]['key'], '3')
+        self.assertEqual(hot['operations']['get_item'][0]['count'], 20)
+        self.assertEqual(hot['all'][0]['key'], '3')
+        self.assertEqual(hot['operations']['query'][0]['key'], 'color=red')
+        self.assertEqual(len(hot['operations']['put_item']), 3)
+        mix = report['access_mix']
+        self.assertEqual(mix['calls']['get_item'], 21)
+        self.assertEqual(mix['calls']['scan'], 1)
+        self.assertEqual(mix['items_scanned'], 10)
+        self.assertAlmostEqual(mix['scan_share'], 1.0 / 27)
+        self.assertAlmostEqual(mix['query_share'], 5.0 / 27)
+        sizes = report['item_sizes']
+        self.assertEqual(sizes['written']['count'], 10)
+        self.assertEqual(sizes['written']['buckets']['<=1KB'], 3)
+        self.assertEqual(sizes['written']['buckets']['<=64KB'], 0)
+        self.assertGreater(sizes['read']['max_bytes'], 4096)
+        json.dumps(report)
+
+    def test_throttled_keys(self):
+        error = ClientError(
+            {'Error': {'Code': 'ProvisionedThroughputExceededException',
+                       'Message': 'slow down'}}, 'GetItem')
+
+        def get_item(**kwargs):
+            raise error
+
+        with mock.patch.object(self.crud.backend, 'get_item', get_item):
+            r = self.crud.get('7')
+        self.assertEqual(r.error_code,
+                         'ProvisionedThroughputExceededException')
+        report = self.crud.stats().data['profiler']
+        self.assertEqual(report['access_mix']['throttled'], 1)
+        self.assertEqual(report['hot_keys']['throttled'][0]['key'], '7')
+
+    def test_describe_and_reset(self):
+        self.crud.get('1')
+        description = self.crud.describe().data
+        self.assertIn('profiler', description)
+        r = self.crud.handler(operation='stats', reset=True, top=1)
+        self.assertEqual(len(r.data['profiler']['hot_keys']['all']), 1)
+        report = self.crud.stats().data['profiler']
+        self.assertEqual(report['access_mix']['calls'], {})
+
+    def test_added_middleware_is_outside_profiler(self):
+        def cached(context, call_next):
+            # Answers every get without calling the table
+            context.result = {'Item': {'id': context.params['Key']['id']},
+                              'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        self.crud.add_middleware(cached)
+        self.assertIs(self.crud._middleware[-1], self.crud.profiler)
+        self.assertEqual(self.crud.get('3').data, {'id': '3'})
+        report = self.crud.stats().data['profiler']
+        self.assertNotIn('get_item', report['access_mix']['calls'])
+
+    def test_disabled(self):
+        crud = cruddy.CRUD(
+            table_name='test-cruddy', backend='memory',
+            supported_ops=cruddy.CRUD.SupportedOps + ['stats'])
+        self.assertIsNone(crud.profiler)
+        self.assertEqual(crud.stats().data, {})
@@ -0,0 +1,101 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import threading
+import unittest
+
+import boto3
+import mock
+
+import cruddy
+
+
+class TestCRUDRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = cruddy.CRUDRegistry(
+            tables={'users': {'prototype': {'id': '<on-create:uuid>'}},
+                    'orders': {'table_name': 'orders-v2'}},
+            default_table='users',
+            backend='memory')
+
+    def tearDown(self):
+        self.registry.close()
+
+    def test_routing(self):
+        self.assertEqual(self.registry.tables, ['orders', 'users'])
+        r = self.registry.handler(table='orders', operation='create',
+                                  item={'id': 'o1'})
+        self.assertEqual(r.status, 'success')
+        r = self.registry.handler(operation='create', item={'name': 'a'})
+        self.assertEqual(r.status, 'success')
+        self.assertEqual(len(self.registry['users'].list().data), 1)
+        self.assertEqual(len(self.registry['orders'].list().data), 1)
+        self.assertEqual(self.registry['orders'].table_name, 'orders-v2')
+
+    def test_lazy(self):
+        self.assertEqual(self.registry._handlers, {})
+        self.registry.handler(table='orders', operation='list')
+        self.assertEqual(list(self.registry._handlers), ['orders'])
+        self.assertIs(self.registry.get('orders'),
+                      self.registry.get('orders'))
+
+    def test_slow_create_does_not_block_other_tables(self):
+        orders = self.registry.get('orders')
+        started = threading.Event()
+        release = threading.Event()
+        created = []
+        real_crud = cruddy.CRUD
+
+        def slow_crud(**config):
+            started.set()
+            # Times out if the other table was blocked
+            created.append((config['table_name'], release.wait(2)))
+            return real_crud(**config)
+
+        with mock.patch('cruddy.CRUD', slow_crud):
+            threads = [threading.Thread(target=self.registry.get,
+                                        args=('users',))
+                       for i in range(3)]
+            for thread in threads:
+                thread.start()
+            self.assertTrue(started.wait(5))
+            r = self.registry.handler(table='orders', operation='list')
+            self.assertEqual(r.status, 'success')
+            self.assertIs(self.registry.get('orders'), orders)
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(created, [('users', True)])
+        self.assertIn('users', self.registry._handlers)
+
+    def test_unknown_table(self):
+        r = self.registry.handler(table='nope', operation='list')
+        self.assertEqual(r.status, 'error')
+        self.assertEqual(r.error_type, 'UnknownTable')
+
+    def test_shared_resource(self):
+        session = boto3.Session(aws_access_key_id='foo',
+                                aws_secret_access_key='bar',
+                                region_name='us-west-2')
+        registry = cruddy.CRUDRegistry(
+            tables={'a': {}, 'b': {}}, session=session,
+            transport={'max_pool_connections': 40})
+        with mock.patch.object(cruddy.CRUD, '_analyze_table'):
+            a = registry.get('a')
+            b = registry.get('b')
+        self.assertIs(a.backend.resource, b.backend.resource)
+        self.assertEqual(a.backend.table.name, 'a')
+        self.assertEqual(b.backend.table.name, 'b')
+        config = a.backend.resource.meta.client.meta.config
+        self.assertEqual(config.max_pool_connections, 40)
@@ -0,0 +1,116 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import json
+import threading
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib3
+
+import cruddy
+from cruddy.httpclient import HTTPClient
+from cruddy.middleware import StatsMiddleware
+from cruddy.server import CruddyHTTPServer
+
+
+class TestServer(unittest.TestCase):
+
+    batch = False
+
+    def setUp(self):
+        self.stats = StatsMiddleware()
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend={'name': 'memory', 'indexes': {'color': 'color-index'}},
+            middleware=[self.stats])
+        self.server = CruddyHTTPServer(('127.0.0.1', 0), self.crud,
+                                       workers=4, batch=self.batch,
+                                       keep_alive=1)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.client = HTTPClient(self.server.url,
+                                 transport={'max_pool_connections': 4})
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_operations(self):
+        response = self.client.create({'id': 'a', 'color': 'red'})
+        self.assertEqual(response.status, 'success')
+        self.assertEqual(self.client.get('a').data,
+                         {'id': 'a', 'color': 'red'})
+        self.assertEqual(self.client.search('color=red').data,
+                         [{'id': 'a', 'color': 'red'}])
+        self.assertEqual(self.client.delete('a').status, 'success')
+        response = self.client.get('a')
+        self.assertEqual(response.status, 'error')
+        self.assertEqual(response.error_type, 'NotFound')
+        response = self.client.call_operation('frobnicate')
+        self.assertEqual(response.error_type, 'UnsupportedOperation')
+
+    def test_connections_are_reused(self):
+        connections = set()
+        original = CruddyHTTPServer.finish_request
+
+        def finish_request(server, request, client_address):
+            connections.add(client_address)
+            original(server, request, client_address)
+
+        self.server.finish_request = finish_request.__get__(self.server)
+        for i in range(10):
+            self.client.ping()
+        self.assertEqual(len(connections), 1)
+
+    def test_concurrent_requests(self):
+        def create(i):
+            return self.client.create({'id': str(i)}).status
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(create, range(40)))
+        self.assertEqual(results, ['success'] * 40)
+        self.assertEqual(len(self.crud.list().data), 40)
+
+    def test_batch(self):
+        responses = self.client.invoke_batch(
+            [{'operation': 'create', 'item': {'id': str(i)}}
+             for i in range(5)] +
+            [{'operation': 'get', 'id': '3'}, 'get'])
+        self.assertEqual([r.status for r in responses],
+                         ['success'] * 6 + ['error'])
+        self.assertEqual(responses[5].data, {'id': '3'})
+        writes = self.stats.stats.get('batch_write_item', {}).get('count')
+        self.assertEqual(writes, 1 if self.batch else None)
+
+    def test_bad_requests(self):
+        http = urllib3.PoolManager()
+        response = http.request('POST', self.server.url + '/',
+                                body=b'{not json')
+        self.assertEqual(response.status, 400)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))[
+            'error_type'], 'InvalidPayload')
+        response = http.request('GET', self.server.url + '/nothing')
+        self.assertEqual(response.status, 404)
+        response = http.request('GET', self.server.url + '/health')
+        self.assertEqual(json.loads(response.data.decode('utf-8')),
+                         {'status': 'success'})
+
+
+class TestBatchingServer(TestServer):
+
+    batch = True
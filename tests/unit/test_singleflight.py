@@ -0,0 +1,148 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import threading
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+import cruddy
+from cruddy.middleware import Middleware, StatsMiddleware
+from cruddy.singleflight import SingleFlight
+
+
+class Gate(Middleware):
+    # Holds every call until the gate is opened so calls overlap
+    def __init__(self):
+        self.opened = threading.Event()
+        self.arrived = 0
+
+    def before(self, context):
+        self.arrived += 1
+        self.opened.wait(5)
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_share_a_result(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            release.wait(5)
+            return {'value': 1}
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(flight.do, 'k', fn)
+                       for i in range(5)]
+            while flight.stats()['shared'] < 4:
+                time.sleep(0.01)
+            release.set()
+            results = [future.result() for future in futures]
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result == ({'value': 1}, True)
+                            for result in results))
+        self.assertEqual(flight.stats(),
+                         {'calls': 1, 'shared': 4, 'in_flight': 0})
+        # Nothing is kept once the call is done
+        self.assertEqual(flight.do('k', lambda: 2), (2, False))
+
+    def test_exceptions_are_shared(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def fn():
+            release.wait(5)
+            raise ValueError('broken')
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(flight.do, 'k', fn)
+                       for i in range(3)]
+            while flight.stats()['shared'] < 2:
+                time.sleep(0.01)
+            release.set()
+            for future in futures:
+                self.assertRaises(ValueError, future.result)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+
+class TestCoalescedReads(unittest.TestCase):
+
+    def setUp(self):
+        self.gate = Gate()
+        self.stats = StatsMiddleware()
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend={'name': 'memory', 'indexes': {'color': 'color-index'}},
+            middleware=[self.stats, self.gate], single_flight=True,
+            read_consistency='eventual',
+            supported_ops=cruddy.CRUD.SupportedOps + ['stats'])
+        self.gate.opened.set()
+        for i in range(3):
+            self.crud.create({'id': str(i), 'color': 'red', 'n': i})
+        self.gate.opened.clear()
+        self.gate.arrived = 0
+
+    def _concurrently(self, fn, count=8):
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            futures = [executor.submit(fn) for i in range(count)]
+            while self.crud.single_flight.stats()['shared'] < count - 1:
+                time.sleep(0.01)
+            self.gate.opened.set()
+            return [future.result() for future in futures]
+
+    def test_get(self):
+        responses = self._concurrently(lambda: self.crud.get('1'))
+        self.assertEqual(self.stats.stats['get_item']['count'], 1)
+        for r in responses:
+            self.assertEqual(r.data, {'id': '1', 'color': 'red', 'n': 1})
+        # Every caller has its own copy of the item
+        responses[0].data['n'] = 99
+        self.assertEqual(responses[1].data['n'], 1)
+        stats = self.crud.stats().data['single_flight']
+        self.assertEqual(stats['shared'], 7)
+
+    def test_search(self):
+        responses = self._concurrently(
+            lambda: self.crud.search('color=red'))
+        self.assertEqual(self.stats.stats['query']['count'], 1)
+        for r in responses:
+            self.assertEqual(sorted(i['n'] for i in r.data), [0, 1, 2])
+
+    def test_different_reads_are_not_coalesced(self):
+        self.gate.opened.set()
+        self.crud.get('1')
+        self.crud.get('2')
+        self.assertEqual(self.stats.stats['get_item']['count'], 2)
+        self.assertEqual(self.crud.single_flight.stats()['shared'], 0)
+
+    def test_consistent_reads_are_not_coalesced(self):
+        # The first get is held in flight while the item is changed, and a
+        # get made after the change must not join it
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(self.crud.get, '1', consistency='strong')
+            while self.gate.arrived < 1:
+                time.sleep(0.01)
+            self.crud.backend.put_item(Item={'id': '1', 'n': 2})
+            second = executor.submit(self.crud.get, '1', consistency='strong')
+            # Doesn't arrive if it joined the first get
+            deadline = time.time() + 2
+            while self.gate.arrived < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            self.gate.opened.set()
+            self.assertEqual(second.result().data['n'], 2)
+            first.result()
+        self.assertEqual(self.crud.single_flight.stats()['shared'], 0)
@@ -0,0 +1,147 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import random
+import threading
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+import mock
+
+import cruddy
+from cruddy.backend import DynamoDBBackend
+from cruddy.middleware import StatsMiddleware
+
+
+class TestConfiguration(unittest.TestCase):
+
+    def test_supported_ops_are_copied(self):
+        ops = ['get', 'list']
+        crud = cruddy.CRUD(table_name='test-cruddy', backend='memory',
+                           supported_ops=ops)
+        self.assertEqual(ops, ['get', 'list'])
+        self.assertEqual(crud.supported_ops, ['get', 'list', 'describe'])
+        self.assertEqual(cruddy.CRUD.SupportedOps.count('describe'), 1)
+        ops.append('delete')
+        self.assertEqual(crud.delete('1').status, 'error')
+
+    def test_new_operations_are_opt_in(self):
+        crud = cruddy.CRUD(table_name='test-cruddy', backend='memory')
+        for operation in ('bulk_create', 'get_counter', 'stats'):
+            self.assertNotIn(operation, crud.supported_ops)
+        r = crud.handler(operation='stats')
+        self.assertEqual(r.error_type, 'UnsupportedOperation')
+
+    def test_prototype_is_copied(self):
+        prototype = {'id': '<on-create:uuid>', 'tags': []}
+        crud = cruddy.CRUD(table_name='test-cruddy', backend='memory',
+                           prototype=prototype)
+        a = crud.create({}).data
+        b = crud.create({}).data
+        a['tags'].append('red')
+        self.assertEqual(b['tags'], [])
+        self.assertEqual(prototype['tags'], [])
+        prototype['tags'].append('blue')
+        self.assertEqual(crud.create({}).data['tags'], [])
+
+
+class TestPerThreadTables(unittest.TestCase):
+
+    def test_each_thread_gets_a_table(self):
+        resource = mock.Mock()
+        resource.Table.side_effect = lambda name: mock.Mock(name=name)
+        backend = DynamoDBBackend(None, 'test-cruddy', resource=resource)
+        main = backend.table
+        self.assertIs(backend.table, main)
+        tables = []
+        thread = threading.Thread(target=lambda: tables.append(backend.table))
+        thread.start()
+        thread.join()
+        self.assertIsNot(tables[0], main)
+        self.assertEqual(resource.Table.call_count, 2)
+
+
+class TestConcurrentOperations(unittest.TestCase):
+
+    Threads = 8
+    Rounds = 200
+
+    def setUp(self):
+        self.stats = StatsMiddleware()
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend={'name': 'memory', 'indexes': {'color': 'color-index'}},
+            prototype={'id': '<on-create:uuid>', 'tags': [], 'n': 0},
+            compressed_attributes=['body'],
+            compression={'threshold': 16},
+            middleware=[self.stats], profiler=True, single_flight=True,
+            search_cache=True, read_consistency='session',
+            supported_ops=cruddy.CRUD.SupportedOps + ['stats'])
+
+    def _worker(self, seed):
+        rnd = random.Random(seed)
+        mine = []
+        for i in range(self.Rounds):
+            choice = rnd.random()
+            if choice < 0.3 or not mine:
+                response = self.crud.create(
+                    {'color': rnd.choice(['red', 'blue']),
+                     'body': 'x' * rnd.randint(0, 64)})
+                self.assertEqual(response.status, 'success')
+                response.data['tags'].append(seed)
+                mine.append(response.data['id'])
+            elif choice < 0.5:
+                id = rnd.choice(mine)
+                response = self.crud.get(id)
+                self.assertEqual(response.status, 'success')
+                self.assertEqual(response.data['id'], id)
+                self.assertEqual(response.data['tags'], [])
+            elif choice < 0.6:
+                id = rnd.choice(mine)
+                item = self.crud.get(id).data
+                item['tags'] = [seed]
+                self.assertEqual(self.crud.update(item).status, 'success')
+                self.assertEqual(self.crud.get(id).data['tags'], [seed])
+                self.assertEqual(self.crud.update(
+                    {'id': id, 'tags': []}, partial=True).status, 'success')
+            elif choice < 0.75:
+                id = rnd.choice(mine)
+                response = self.crud.increment_counter(id, 'n')
+                self.assertEqual(response.status, 'success')
+            elif choice < 0.85:
+                response = self.crud.search('color=red')
+                self.assertEqual(response.status, 'success')
+            elif choice < 0.9:
+                self.assertEqual(self.crud.list().status, 'success')
+            else:
+                id = mine.pop(rnd.randrange(len(mine)))
+                self.assertEqual(self.crud.delete(id).status, 'success')
+                self.assertEqual(self.crud.get(id).status, 'error')
+        return mine
+
+    def test_mixed_operations(self):
+        with ThreadPoolExecutor(max_workers=self.Threads) as executor:
+            results = [future.result() for future in [
+                executor.submit(self._worker, seed)
+                for seed in range(self.Threads)]]
+        remaining = set(id for ids in results for id in ids)
+        listed = set(item['id'] for item in self.crud.list().data)
+        self.assertEqual(listed, remaining)
+        for item in self.crud.list().data:
+            self.assertEqual(item['tags'], [])
+        description = self.crud.describe().data
+        self.assertIn('describe', description['supported_operations'])
+        calls = self.crud.stats().data['profiler']['access_mix']['calls']
+        self.assertEqual(sum(calls.values()),
+                         sum(s['count'] for s in self.stats.stats.values()))
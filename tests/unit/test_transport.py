@@ -0,0 +1,96 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import io
+import json
+import threading
+import unittest
+
+import boto3
+import mock
+from botocore.exceptions import ClientError
+
+from cruddy.backend import get_backend
+from cruddy.lambdaclient import LambdaClient
+from cruddy.scripts.cli import CLIHandler
+from cruddy.transport import get_config, prewarm
+
+
+class TestTransport(unittest.TestCase):
+
+    transport = {'max_pool_connections': 50, 'connect_timeout': 2,
+                 'read_timeout': 5, 'tcp_keepalive': True,
+                 'retry_mode': 'adaptive', 'max_attempts': 4}
+
+    def setUp(self):
+        self.session = boto3.Session(aws_access_key_id='foo',
+                                     aws_secret_access_key='bar',
+                                     region_name='us-west-2')
+
+    def test_get_config(self):
+        self.assertIsNone(get_config({}))
+        config = get_config(self.transport)
+        self.assertEqual(config.max_pool_connections, 50)
+        self.assertEqual(config.connect_timeout, 2)
+        self.assertEqual(config.read_timeout, 5)
+        self.assertTrue(config.tcp_keepalive)
+        self.assertEqual(config.retries,
+                         {'mode': 'adaptive', 'max_attempts': 4})
+        self.assertRaises(ValueError, get_config, {'pool': 5})
+
+    def test_old_botocore(self):
+        with mock.patch('botocore.__version__', '1.12.234'):
+            self.assertRaises(ValueError, get_config, self.transport)
+            self.assertRaises(ValueError, get_config,
+                              {'retry_mode': 'standard'})
+            config = get_config({'read_timeout': 5, 'max_attempts': 4})
+        self.assertEqual(config.retries, {'max_attempts': 4})
+
+    def test_backend_config(self):
+        backend = get_backend(None, self.session, 'test-cruddy',
+                              get_config(self.transport))
+        config = backend.resource.meta.client.meta.config
+        self.assertEqual(config.max_pool_connections, 50)
+        self.assertEqual(config.read_timeout, 5)
+
+    def test_prewarm(self):
+        threads = set()
+        lock = threading.Lock()
+
+        def call():
+            with lock:
+                threads.add(threading.current_thread().ident)
+            raise ClientError({'Error': {'Code': 'AccessDenied'}}, 'Call')
+
+        self.assertEqual(prewarm(call, 4), 4)
+        self.assertTrue(len(threads) >= 1)
+        self.assertEqual(prewarm(call, 0), 0)
+
+    def test_lambda_client(self):
+        with mock.patch('boto3.Session', return_value=self.session):
+            client = LambdaClient('fn', transport={'read_timeout': 300})
+        self.assertEqual(
+            client._lambda_client.meta.config.read_timeout, 300)
+
+    def test_cli_transport_overrides_config(self):
+        config = io.StringIO(json.dumps(
+            {'table_name': 'test-cruddy',
+             'transport': {'max_pool_connections': 20,
+                           'connect_timeout': 1}}))
+        with mock.patch('cruddy.scripts.cli.CRUD') as crud:
+            CLIHandler(None, None, None, config,
+                       transport={'max_pool_connections': 64})
+        crud.assert_called_once_with(
+            table_name='test-cruddy',
+            transport={'max_pool_connections': 64, 'connect_timeout': 1},
+            supported_ops=mock.ANY)
@@ -0,0 +1,130 @@
+# Copyright (c) 2016 CloudNative, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import gc
+import unittest
+import weakref
+
+import cruddy
+from cruddy import shutdown
+from cruddy.exceptions import CruddyWriteError
+from cruddy.middleware import StatsMiddleware
+
+
+class TestWriteBehind(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = StatsMiddleware()
+        self.errors = []
+        self.crud = cruddy.CRUD(
+            table_name='test-cruddy',
+            backend='memory',
+            middleware=[self.stats],
+            write_behind={'interval': 60, 'batch_size': 10,
+                          'on_error': lambda *args: self.errors.append(args)})
+
+    def tearDown(self):
+        self.crud.close()
+
+    def test_create_is_queued(self):
+        responses = [self.crud.create({'id': str(i), 'n': i})
+                     for i in range(5)]
+        for r in responses:
+            self.assertEqual(r.status, 'success')
+            self.assertEqual(r.metadata, {'queued': True})
+            self.assertNotIn('_future', r.flatten())
+        self.assertNotIn('batch_write_item', self.stats.stats)
+        r = self.crud.flush_writes()
+        self.assertEqual(r.data['written'], 5)
+        self.assertEqual(r.data['depth'], 0)
+        self.assertEqual(self.stats.stats['batch_write_item']['count'], 1)
+        item = responses[0].future.result(timeout=5)
+        self.assertEqual(self.crud.get(item['id']).data['n'], 0)
+
+    def test_batch_size_triggers_flush(self):
+        futures = [self.crud.create({'id': str(i)}).future
+                   for i in range(10)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(len(self.crud.list().data), 10)
+
+    def test_writes_to_same_key_are_ordered(self):
+        self.crud.create({'id': 'a', 'n': 0})
+        for i in range(1, 30):
+            self.crud.update({'id': 'a', 'n': i})
+        self.crud.flush_writes()
+        self.assertEqual(self.crud.get('a').data['n'], 29)
+
+    def test_failure(self):
+        future = self.crud.create({'id': 'a', 'price': 1.5}).future
+        self.crud.flush_writes()
+        self.assertRaises(CruddyWriteError, future.result, 5)
+        self.assertEqual(len(self.errors), 1)
+        self.assertEqual(self.errors[0][0]['id'], 'a')
+        self.assertEqual(self.crud.describe().data['write_behind']['failed'],
+                         1)
+
+    def test_close_flushes(self):
+        self.crud.create({'id': 'a'})
+        self.crud.close()
+        self.assertEqual(self.crud.get('a').data, {'id': 'a'})
+
+    def test_closed_queue(self):
+        self.crud.close()
+        r = self.crud.create({'id': 'b'})
+        self.assertEqual(r.status, 'error')
+        self.assertEqual(r.error_type, 'WriteQueueClosed')
+        r = self.crud.update({'id': 'b'})
+        self.assertEqual(r.error_type, 'WriteQueueClosed')
+
+    def test_versioned_updates_are_synchronous(self):
+        crud = cruddy.CRUD(table_name='test-cruddy', backend='memory',
+                           version_attribute='version', write_behind=True)
+        r = crud.update({'id': 'a'})
+        self.assertIsNone(r.future)
+        self.assertEqual(crud.get('a').data['version'], 1)
+        crud.close()
+
+    def test_delete_waits_for_queued_create(self):
+        self.crud.create({'id': 'a'})
+        self.crud.delete('a')
+        self.crud.flush_writes()
+        self.assertEqual(self.crud.get('a').error_type, 'NotFound')
+
+    def test_synchronous_updates_wait_for_queued_writes(self):
+        self.crud.create({'id': 'a', 'n': 0, 'views': 0})
+        self.crud.flush_writes()
+        self.crud.create({'id': 'a', 'n': 1, 'views': 1})
+        self.crud.update({'id': 'a', 'n': 2}, partial=True)
+        self.crud.increment_counter('a', 'views')
+        self.crud.flush_writes()
+        self.assertEqual(self.crud.get('a').data,
+                         {'id': 'a', 'n': 2, 'views': 2})
+
+    def test_idle_queue_is_freed(self):
+        self.crud.create({'id': 'a'})
+        queue = self.crud.write_queue
+        self.assertIn(queue, shutdown._pinned)
+        self.crud.flush_writes()
+        self.assertNotIn(queue, shutdown._pinned)
+        ref = weakref.ref(queue)
+        del queue
+        self.crud = cruddy.CRUD(table_name='test-cruddy', backend='memory')
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_queued_writes_are_written_at_exit(self):
+        self.crud.create({'id': 'a'})
+        shutdown.close_all()
+        self.assertNotIn(self.crud.write_queue, shutdown._open)
+        self.assertEqual(self.crud.get('a').data, {'id': 'a'})